@@ -1,3 +1,24 @@
+# "enabled": True -> load ngay khi khởi động; các model khác được load khi có request faiss=<id> đầu tiên
+# Các key tùy chọn cho mỗi model:
+#   "load_mode": "memory" (mặc định) | "mmap" (FAISS IO_FLAG_MMAP, các worker dùng chung page cache)
+#                | "npy" (ma trận vector thô mở bằng np.memmap, cần "npy_path")
+#   "npy_path":  File .npy float16/float32 (tạo bằng scripts/export_npy.py)
+#   "video_pool_path": Embedding max-pool theo video (scripts/build_video_pool.py), cho multi-context
+#                      khi index không lưu vector thô (IVF/HNSW/PQ)
+#   "memory_mb": RAM ước tính của model, dùng để evict trước khi load (mặc định: bảng MODEL_WEIGHTS_MB
+#                trong utils/model_registry.py + file index, đo lại sau khi load)
+#   "index_variant": "ivf_flat" | "ivf_pq" | "hnsw" -> đọc <bin>.<variant>.bin (scripts/build_ann_index.py)
+#                    thay cho index flat, đổi một ít recall lấy latency CPU thấp hơn nhiều
+#                    "sq_fp16" | "sq8" | "ivf_sq8": vector lượng tử hóa float16 / int8, 1/2 - 1/4 RAM
+#                    (index không lưu vector float thô -> multi-context theo video cần "video_pool_path")
+#   "search_params": Tham số search của biến thể, vd {"nprobe": 32} (IVF) hoặc {"efSearch": 128} (HNSW)
+#   "rerank": {"factor": 4} -> lấy k x 4 candidate từ index rồi chấm lại chính xác trên "npy_path"
+#             (float32, scripts/export_npy.py), dùng kèm index_variant xấp xỉ / lượng tử hóa
+#   "backend": "faiss" (mặc định, index .bin trong process) | "milvus" (collection Milvus, cần "milvus"),
+#              xem utils/vector_backend.py; Milvus lọc theo video_id / frame_id ngay trên engine
+#   "milvus": {"collection", "host", "port", "metric_type"} -> collection do scripts/insert_data.py tạo,
+#             "search_params" khi đó là tham số search của Milvus, vd {"nprobe": 16} hoặc {"ef": 128}
+
 MODEL_CONFIGS = {
     # --- ID 1: bigG-14 LAION ---
     1: {
@@ -6,6 +27,7 @@ MODEL_CONFIGS = {
         "type": "open_clip",
         "model_key": "hf-hub:laion/CLIP-ViT-bigG-14-laion2B-39B-b160k",
         "bin_path": "data/bin/bigg14_laion.bin",
+        "load_mode": "mmap",
         "json_path": "data/index/path_index_clip.json"
     },
 
@@ -16,6 +38,7 @@ MODEL_CONFIGS = {
         "type": "open_clip",
         "model_key": "hf-hub:UCSC-VLAA/ViT-bigG-14-CLIPA-datacomp1B",
         "bin_path": "data/bin/bigg14_datacomp.bin",
+        "load_mode": "mmap",
         "json_path": "data/index/path_index_clip.json"
     },
 
@@ -36,6 +59,7 @@ MODEL_CONFIGS = {
         "type": "open_clip",
         "model_key": "ViT-H-14-378-quickgelu",
         "bin_path": "data/bin/h14_quickgelu.bin",
+        "load_mode": "mmap",
         "json_path": "data/index/path_index_clip.json"
     },
 
@@ -46,6 +70,7 @@ MODEL_CONFIGS = {
         "type": "open_clip",
         "model_key": "hf-hub:apple/DFN5B-CLIP-ViT-H-14-378",
         "bin_path": "data/bin/h14_apple.bin",
+        "load_mode": "mmap",
         "json_path": "data/index/path_index_clip.json"
     },
 
@@ -68,5 +93,89 @@ MODEL_CONFIGS = {
         "model_key": "ViT-B/32",
         "bin_path": "data/bin/b32.bin",
         "json_path": "data/index/path_index_clip.json"
+    },
+
+    # --- ID 8: ViT-B/32 LAION trên Milvus (scripts/etl_pipeline.py -> scripts/insert_data.py) ---
+    8: {
+        "enabled": False,
+        "name": "ViT-B/32-Milvus",
+        "type": "open_clip",
+        "model_key": "ViT-B-32",
+        "pretrained": "laion2b_s34b_b79k",
+        "backend": "milvus",
+        "milvus": {
+            "collection": "video_search_vit_b_32",
+            "host": "127.0.0.1",
+            "port": "19530",
+            "metric_type": "L2"  # Khớp index IVF_FLAT L2 của insert_data.py
+        },
+        "search_params": {"nprobe": 16},
+        "json_path": "data/index/path_index_clip.json"
     }
-}
\ No newline at end of file
+}
+
+# Model Registry: giữ tối đa N model gần dùng nhất trong RAM, evict LRU khi vượt giới hạn
+MODEL_REGISTRY_CONFIG = {
+    "max_loaded_models": 2,
+    "memory_budget_mb": 24000  # None = không giới hạn RAM
+}
+
+# Cache vector query theo (model, text sau dịch/LLM), persist_path = None để chỉ cache trong RAM
+EMBEDDING_CACHE_CONFIG = {
+    "maxsize": 4096,
+    "ttl": None,  # Giây, None = không hết hạn
+    "persist_path": "data/cache/query_cache.sqlite"
+}
+
+# Thread pool cho các tác vụ blocking trong endpoint async (số worker = số việc chạy song song tối đa)
+EXECUTOR_CONFIGS = {
+    "inference": {"max_workers": 2},  # CLIP encode + FAISS search (kể cả từng model của ensemble)
+    "llm": {"max_workers": 4},        # Gemini refine query
+    "io": {"max_workers": 8},         # Elasticsearch, DRES submit, load model
+    "decode": {"max_workers": 4}      # Decode ảnh upload (PIL)
+}
+
+# Micro-batching: gom text query đến gần nhau thành 1 lần encode + 1 lần FAISS search
+TEXT_BATCHER_CONFIG = {
+    "max_batch_size": 16,
+    "max_wait_ms": 5  # Chỉ chờ khi model đang bận, model rảnh thì chạy ngay
+}
+
+# Translation (vi -> en): cache RAM + SQLite, backend offline khi mất mạng ("marian" hoặc None)
+TRANSLATION_CONFIG = {
+    "cache_size": 4096,
+    "cache_path": "data/cache/query_cache.sqlite",
+    "offline_backend": "marian",
+    # Model phải có sẵn trên đĩa (backend offline chạy khi mất mạng, không tải được),
+    # tải trước: huggingface-cli download Helsinki-NLP/opus-mt-vi-en --local-dir data/models/opus-mt-vi-en
+    "offline_model": "data/models/opus-mt-vi-en",
+    "offline_cooldown": 30  # Giây: sau 1 lần dịch online lỗi, các query tiếp theo dịch offline luôn
+}
+
+# LLM refine query cho CLIP: backend "gemini" hoặc "stub" (offline, không cần API key)
+LLM_CONFIG = {
+    "backend": "gemini",
+    "timeout": 3.0,  # Giây, quá hạn thì search bằng query gốc
+    "cache_size": 1024,
+    "cache_path": "data/cache/query_cache.sqlite",
+    "rotate_delay": 0.0
+}
+
+# Cache kết quả search phía server: phân trang (?page= hoặc cursor của /api/results) không search lại
+RESULT_CACHE_CONFIG = {
+    "maxsize": 256,      # Số bộ kết quả (mỗi bộ <= 400 frame)
+    "ttl": 600,          # Giây
+    "fallback_ttl": 30,  # Kết quả search khi LLM timeout / lỗi (query gốc), 0 = không cache
+    "wait_timeout": 30   # Giây chờ lần search trùng tham số đang chạy, quá hạn thì tự search
+}
+
+# Ensemble search nhiều model (/api/ensemble-search), xem utils/ensemble.py
+ENSEMBLE_CONFIG = {
+    "method": "rrf",          # "rrf" | "weighted" (tổng điểm z-normalize)
+    "rrf_k": 60,
+    "weights": {},            # {model_id: trọng số}, mặc định 1.0
+    "per_model_k": 400,       # Số candidate lấy từ mỗi model
+    "max_latency_ms": 1500,   # Model có latency EWMA lớn hơn bị bỏ khỏi ensemble (None = giữ tất cả)
+    "latency_alpha": 0.2,
+    "probe_every": 20         # Model bị bỏ được chạy thử lại sau mỗi 20 request
+}
@@ -0,0 +1,158 @@
+"""
+EmbeddingStore: lưu embedding keyframe theo shard, chỉ ghi thêm (append-only), chạy lại được sau khi crash.
+
+Cấu trúc thư mục:
+    <root>/manifest.json             {"dim", "dtype", "shard_size", "model", "shards": [{"name", "count"}]}
+    <root>/shard_00000.npy           embedding [n, dim] (float16 mặc định)
+    <root>/shard_00000.ids.npy       frame ID int64 [n]
+    <root>/shard_00000.meta.jsonl    1 dòng / frame: {"video_id", "frame_id", "path"}
+
+- Embedding được gom trong RAM tới shard_size dòng rồi ghi thành 1 shard mới, không bao giờ ghi lại file cũ
+- Shard chỉ có hiệu lực sau khi được thêm vào manifest (ghi file tạm rồi os.replace),
+  crash giữa chừng chỉ mất phần đang gom dở
+- done_ids(): các frame ID đã có, để ETL chạy lại bỏ qua
+- iter_batches(): đọc tuần tự từng shard (mmap) cho FAISS builder / insert Milvus
+"""
+
+import os
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+class EmbeddingStore:
+    def __init__(self, root, dim=None, dtype="float16", shard_size=16384, model=None):
+        """
+        Args:
+            root: Thư mục chứa store (tạo mới nếu chưa có)
+            dim: Số chiều embedding (bắt buộc khi tạo store mới)
+            dtype: "float16" | "float32" kiểu lưu trên đĩa
+            shard_size: Số dòng mỗi shard
+            model: Tên model (ghi vào manifest để kiểm tra khi ghi tiếp)
+        """
+        self.root = root
+        manifest_path = os.path.join(root, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if dim is not None and dim != self.manifest["dim"]:
+                raise ValueError(f"Store {root} có dim={self.manifest['dim']}, không ghi tiếp được dim={dim}")
+            if model is not None and self.manifest.get("model") not in (None, model):
+                raise ValueError(f"Store {root} thuộc model {self.manifest['model']}, không phải {model}")
+        else:
+            if dim is None:
+                raise FileNotFoundError(f"Chưa có store tại {root} (cần dim để tạo mới)")
+            os.makedirs(root, exist_ok=True)
+            self.manifest = {"dim": dim, "dtype": dtype, "shard_size": shard_size, "model": model, "shards": []}
+            self._write_manifest()
+
+        self.dim = self.manifest["dim"]
+        self.dtype = np.dtype(self.manifest["dtype"])
+        self.shard_size = self.manifest["shard_size"]
+
+        # Phần đang gom, chưa ghi thành shard
+        self._ids, self._vectors, self._metas = [], [], []
+        self._buffered = 0
+
+    def __len__(self):
+        return sum(shard["count"] for shard in self.manifest["shards"]) + self._buffered
+
+    def _path(self, name, suffix):
+        return os.path.join(self.root, name + suffix)
+
+    def _write_manifest(self):
+        tmp_path = os.path.join(self.root, MANIFEST + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.root, MANIFEST))
+
+    # ----- GHI -----
+    def append(self, ids, embeddings, metas=None):
+        """
+        Args:
+            ids: Frame ID [n]
+            embeddings: float array [n, dim]
+            metas: List dict metadata [n] (video_id, frame_id, path...), None = không có
+        """
+        embeddings = np.asarray(embeddings)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings [n, {self.dim}], got {embeddings.shape}")
+
+        self._ids.append(np.asarray(ids, dtype=np.int64))
+        self._vectors.append(embeddings.astype(self.dtype))
+        self._metas.extend(metas if metas is not None else [{}] * len(embeddings))
+        self._buffered += len(embeddings)
+
+        while self._buffered >= self.shard_size:
+            self._write_shard(self.shard_size)
+
+    def flush(self):
+        """Ghi phần đang gom thành 1 shard (có thể nhỏ hơn shard_size)"""
+        if self._buffered:
+            self._write_shard(self._buffered)
+
+    def close(self):
+        self.flush()
+
+    def _write_shard(self, count):
+        ids = np.concatenate(self._ids)
+        vectors = np.concatenate(self._vectors)
+        metas = self._metas
+
+        name = f"shard_{len(self.manifest['shards']):05d}"
+        for suffix, write in (
+            (".npy", lambda f: np.save(f, vectors[:count])),
+            (".ids.npy", lambda f: np.save(f, ids[:count])),
+            (".meta.jsonl", lambda f: f.write(b"".join(
+                (json.dumps(meta, ensure_ascii=False) + "\n").encode('utf-8') for meta in metas[:count]
+            ))),
+        ):
+            tmp_path = self._path(name, suffix + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, self._path(name, suffix))
+
+        # Shard chỉ có hiệu lực sau khi vào manifest
+        self.manifest["shards"].append({"name": name, "count": int(count)})
+        self._write_manifest()
+        logger.info(f"Wrote {name}: {count} embeddings ({len(self) - self._buffered + count} total)")
+
+        self._ids = [ids[count:]] if count < len(ids) else []
+        self._vectors = [vectors[count:]] if count < len(vectors) else []
+        self._metas = metas[count:]
+        self._buffered -= count
+
+    # ----- ĐỌC -----
+    def done_ids(self):
+        """Frame ID đã có trong store (kể cả phần đang gom), sort tăng dần"""
+        parts = [np.load(self._path(shard["name"], ".ids.npy")) for shard in self.manifest["shards"]]
+        parts += self._ids
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def iter_shards(self):
+        """Yields (ids, embeddings memmap, shard name) theo thứ tự ghi"""
+        for shard in self.manifest["shards"]:
+            ids = np.load(self._path(shard["name"], ".ids.npy"))
+            vectors = np.load(self._path(shard["name"], ".npy"), mmap_mode='r')
+            yield ids, vectors, shard["name"]
+
+    def read_metas(self, name):
+        with open(self._path(name, ".meta.jsonl"), 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def iter_batches(self, batch_size=4096, with_meta=False):
+        """
+        Đọc tuần tự toàn bộ store theo batch, chỉ giữ 1 batch trong RAM.
+        Yields: (ids [n], embeddings float32 [n, dim]) hoặc (ids, embeddings, metas) nếu with_meta
+        """
+        for ids, vectors, name in self.iter_shards():
+            metas = self.read_metas(name) if with_meta else None
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                batch = (ids[start:end], np.asarray(vectors[start:end], dtype=np.float32))
+                yield batch + (metas[start:end],) if with_meta else batch
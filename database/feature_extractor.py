@@ -1,7 +1,50 @@
+import logging
+
 import open_clip
 import torch
 import numpy as np
 from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+
+logger = logging.getLogger(__name__)
+
+
+class KeyframeDataset(Dataset):
+    """
+    Dataset (key, path) -> ảnh đã preprocess, chạy trong các worker của DataLoader
+    nên decode + resize của nhiều ảnh diễn ra song song với encode_image
+    """
+
+    def __init__(self, items, preprocess):
+        """
+        Args:
+            items: List (frame ID, path)
+            preprocess: Transform của open_clip
+        """
+        self.items = items
+        self.preprocess = preprocess
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        key, path = self.items[idx]
+        try:
+            with Image.open(path) as image:
+                return self.preprocess(image.convert('RGB')), int(key), path
+        except Exception as e:
+            logger.warning(f"Error processing {path}: {e}")
+            return None
+
+
+def collate_keyframes(samples):
+    """Gộp batch, bỏ các ảnh lỗi. Returns: (tensor [n, 3, H, W], keys, paths) hoặc None nếu cả batch lỗi"""
+    samples = [s for s in samples if s is not None]
+    if not samples:
+        return None
+    tensors, keys, paths = zip(*samples)
+    return torch.stack(tensors), np.asarray(keys, dtype=np.int64), list(paths)
+
 
 class FeatureExtractor:
     def __init__(self, model_name='ViT-B-32', pretrained='laion2b_s34b_b79k', device=None):
@@ -26,6 +69,42 @@ class FeatureExtractor:
             print(f"Error processing {image_path}: {e}")
             return None
 
+    def encode_images(self, images):
+        """Batch ảnh đã preprocess [n, 3, H, W] -> np.float32 [n, dim] đã normalize (1 lần forward)"""
+        with torch.no_grad():
+            features = self.model.encode_image(images.to(self.device, non_blocking=True))
+            features /= features.norm(dim=-1, keepdim=True)
+        return features.cpu().numpy().astype(np.float32)
+
+    def extract(self, items, batch_size=64, num_workers=4):
+        """
+        Trích xuất embedding cho nhiều ảnh: DataLoader num_workers decode + preprocess song song,
+        model encode từng batch cố định batch_size.
+
+        Args:
+            items: List (frame ID, path)
+        Yields:
+            (keys int64 [n], paths, embeddings float32 [n, dim], attempted) cho từng batch, attempted = số ảnh
+            của batch kể cả ảnh lỗi (n < attempted khi có ảnh lỗi, batch lỗi hết thì n = 0 và embeddings None)
+        """
+        loader = DataLoader(
+            KeyframeDataset(items, self.preprocess),
+            batch_size=batch_size,
+            num_workers=num_workers,
+            collate_fn=collate_keyframes,
+            pin_memory=self.device == 'cuda',
+            persistent_workers=False
+        )
+
+        # Không shuffle: batch i gồm items[i * batch_size : (i + 1) * batch_size]
+        for i, batch in enumerate(loader):
+            attempted = min(batch_size, len(items) - i * batch_size)
+            if batch is None:
+                yield np.zeros(0, dtype=np.int64), [], None, attempted
+                continue
+            images, keys, paths = batch
+            yield keys, paths, self.encode_images(images), attempted
+
     def encode_text(self, text):
         """Chuyển text thành vector"""
         with torch.no_grad():
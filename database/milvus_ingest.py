@@ -0,0 +1,156 @@
+"""
+Insert embedding store (database/embedding_store.py) vào Milvus theo kiểu streaming.
+
+- Store được đọc tuần tự từng batch (mmap từng shard) và chuyển thành cột ngay trước khi insert,
+  RAM chỉ giữ tối đa max_in_flight + 1 batch
+- Tối đa max_in_flight batch được insert song song (mỗi batch 1 RPC), batch lỗi được thử lại
+  với backoff tăng dần, hết lượt thử thì dừng và báo lỗi
+- Insert không idempotent (RPC timeout có thể đã được server ghi), nên lần thử lại dùng upsert
+  (hoặc xóa các id của batch rồi insert lại với pymilvus cũ chưa có upsert) để không nhân đôi primary key
+- InMemoryCollection: stand-in chạy trong process có cùng hàm insert() / upsert() như pymilvus.Collection,
+  dùng để chạy thử / đo tốc độ đọc store mà không cần Milvus (--dry-run)
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def column_batches(store, batch_size=1000):
+    """Yields (số dòng, entities theo cột [ids, video_ids, frame_ids, paths, embeddings]) theo schema Milvus"""
+    for ids, embeddings, metas in store.iter_batches(batch_size, with_meta=True):
+        entities = [
+            ids.tolist(),
+            [str(meta.get('video_id', '')) for meta in metas],
+            [int(meta.get('frame_id', 0)) for meta in metas],
+            [str(meta.get('path', '')) for meta in metas],
+            embeddings
+        ]
+        yield len(ids), entities
+
+
+def rewrite(collection, entities):
+    """Ghi lại 1 batch có thể đã được ghi 1 phần: upsert, hoặc xóa theo id rồi insert nếu không có upsert"""
+    if hasattr(collection, "upsert"):
+        return collection.upsert(entities)
+    collection.delete(f"id in {[int(i) for i in entities[0]]}")
+    return collection.insert(entities)
+
+
+def insert_with_retry(collection, entities, retries=3, backoff=1.0):
+    """
+    Insert 1 batch, lỗi thì thử lại tối đa retries lần (chờ backoff, 2*backoff, ...).
+    Lần đầu dùng insert (nhanh nhất), các lần thử lại dùng rewrite để batch đã ghi 1 phần không bị trùng id.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return collection.insert(entities) if attempt == 0 else rewrite(collection, entities)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            logger.warning(f"Insert batch lỗi ({e}), thử lại sau {delay:.1f}s ({attempt + 1}/{retries})")
+            time.sleep(delay)
+
+
+def ingest(collection, batches, max_in_flight=2, retries=3, backoff=1.0, progress=None):
+    """
+    Args:
+        collection: pymilvus.Collection hoặc InMemoryCollection
+        batches: Iterator (số dòng, entities) - xem column_batches
+        max_in_flight: Số batch insert song song tối đa
+        progress: Callback(số dòng vừa insert) để cập nhật tiến độ (tqdm.update)
+    Returns:
+        {"rows", "batches", "seconds", "rows_per_sec"}
+    """
+    rows, num_batches = 0, 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="milvus-insert") as pool:
+        in_flight = {}
+
+        def collect(done):
+            nonlocal rows, num_batches
+            for future in done:
+                count = in_flight.pop(future)
+                future.result()  # Hết lượt thử -> raise, dừng ingest
+                rows += count
+                num_batches += 1
+                if progress:
+                    progress(count)
+
+        for count, entities in batches:
+            # Chỉ đọc batch tiếp theo khi còn chỗ, tránh đọc hết store vào RAM khi Milvus chậm
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[pool.submit(insert_with_retry, collection, entities, retries, backoff)] = count
+
+        collect(wait(in_flight).done)
+
+    seconds = time.perf_counter() - start
+    return {"rows": rows, "batches": num_batches, "seconds": seconds, "rows_per_sec": rows / max(seconds, 1e-9)}
+
+
+class InMemoryCollection:
+    """
+    Stand-in của pymilvus.Collection cho insert / upsert: giữ các cột trong RAM, có thể giả lập lỗi / độ trễ.
+    Giống Milvus, insert không kiểm tra trùng primary key (num_entities đếm cả dòng trùng).
+    """
+
+    def __init__(self, fail_every=0, latency=0.0, fail_after_write=False):
+        """
+        Args:
+            fail_every: Cứ mỗi fail_every lần ghi thì raise 1 lần (0 = không lỗi)
+            latency: Số giây chờ mỗi lần ghi (giả lập RPC)
+            fail_after_write: Raise sau khi đã ghi batch (giả lập RPC timeout nhưng server đã ghi)
+        """
+        self.fail_every = fail_every
+        self.latency = latency
+        self.fail_after_write = fail_after_write
+        self.calls = 0
+        self.ids, self.embeddings = [], []
+        self._lock = threading.Lock()
+
+    def _write(self, entities, replace):
+        with self._lock:
+            self.calls += 1
+            fail = self.fail_every and self.calls % self.fail_every == 0
+        if self.latency:
+            time.sleep(self.latency)
+        if fail and not self.fail_after_write:
+            raise ConnectionError("Simulated insert failure")
+        with self._lock:
+            if replace:
+                self._remove(entities[0])
+            self.ids.extend(entities[0])
+            self.embeddings.extend(np.asarray(entities[4], dtype=np.float32))
+        if fail:
+            raise TimeoutError("Simulated insert timeout after write")
+
+    def _remove(self, ids):
+        drop = set(int(i) for i in ids)
+        keep = [i for i, row_id in enumerate(self.ids) if int(row_id) not in drop]
+        self.ids = [self.ids[i] for i in keep]
+        self.embeddings = [self.embeddings[i] for i in keep]
+
+    def insert(self, entities):
+        self._write(entities, replace=False)
+
+    def upsert(self, entities):
+        self._write(entities, replace=True)
+
+    @property
+    def num_entities(self):
+        return len(self.ids)
+
+    def create_index(self, field_name, index_params):
+        logger.info(f"InMemoryCollection: bỏ qua create_index({field_name}, {index_params})")
+
+    def load(self):
+        pass
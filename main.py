@@ -2,25 +2,30 @@ import logging
 from contextlib import asynccontextmanager
 from typing import Optional, List
 from urllib.parse import unquote
-import io
 import base64
 
 from fastapi import FastAPI, Request, Query, Depends, HTTPException, File, UploadFile, Form
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import torch, os
-from PIL import Image
-import numpy as np
 
 # --- IMPORT MODULES CỦA HỆ THỐNG MỚI ---
-from configs import MODEL_CONFIGS          # File cấu hình
-from utils.faiss_service import FaissService # Service xử lý Vector/CLIP
+from configs import MODEL_CONFIGS, MODEL_REGISTRY_CONFIG, EMBEDDING_CACHE_CONFIG, EXECUTOR_CONFIGS, TEXT_BATCHER_CONFIG, TRANSLATION_CONFIG, LLM_CONFIG, RESULT_CACHE_CONFIG, ENSEMBLE_CONFIG  # File cấu hình
+from utils.model_registry import ModelRegistry  # Lazy load FaissService + LRU eviction
 from utils.es_service import EsService       # Service xử lý Elasticsearch
 from utils.llm_service import LlmService
 from utils.query_processing import Translation
 from utils.multi_context_kis import MultiContextKIS  # Multi-Context KIS
+from utils.executors import init_executors, get_executor, run_blocking, shutdown_executors  # Thread pool cho tác vụ blocking
+from utils.text_batcher import TextSearchBatcher  # Gom text query đồng thời thành batch
+from utils.frame_catalog import get_catalog
+from utils.video_index import get_video_index  # Danh bạ video cho trang chủ
+from utils.result_store import ResultStore, ShortLived  # Cache kết quả search cho phân trang
+from utils.ensemble import EnsembleSearcher  # Search nhiều model song song + gộp điểm
+from utils.faiss_service import decode_image  # Decode ảnh upload trên executor "decode"
+from utils.search_filter import parse_filters  # Lọc search theo video / batch L / ngày publish
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -36,14 +41,28 @@ logger = logging.getLogger(__name__)
 # ==========================================
 # 1. GLOBAL VARIABLES (QUẢN LÝ TRẠNG THÁI)
 # ==========================================
-# Dictionary chứa các FaissService đã load (Key là ID trong config)
-faiss_services = {} 
+# Registry quản lý các FaissService (Key là ID trong config), load khi có request đầu tiên
+model_registry = None
 
 # Biến chứa EsService (chỉ cần 1 instance)
 es_service = None
 
-# Multi-Context KIS service
-multi_context_kis = None
+# Multi-Context KIS chạy trên model này (chỉ giữ ID, service lấy từ registry mỗi request)
+MULTI_CONTEXT_MODEL_ID = 6
+# Số frame candidate mỗi context (mode frame) - top 100 bỏ sót video có frame khớp xếp hạng thấp hơn
+MULTI_CONTEXT_SEARCH_K = 1000
+
+# Danh bạ video (VideoIndex trên frame catalog dùng chung), build lúc startup cho trang chủ
+video_directory = None
+
+# Micro-batching cho text search đồng thời (/clip, /ic)
+text_batcher = TextSearchBatcher(**TEXT_BATCHER_CONFIG)
+
+# Kết quả search đã chạy, đổi trang chỉ cắt lại từ cache
+result_store = ResultStore(**RESULT_CACHE_CONFIG)
+
+# Ensemble search trên các model đang load (giữ latency EWMA của từng model giữa các request)
+ensemble_searcher = EnsembleSearcher(**ENSEMBLE_CONFIG)
 
 # ==========================================
 # 2. LIFESPAN (KHỞI ĐỘNG & DỌN DẸP SERVER)
@@ -53,9 +72,12 @@ async def lifespan(app: FastAPI):
     # --- STARTUP ---
     logger.info("========== SERVER STARTING ==========")
     
+    # 0. Thread pool cho inference / LLM / IO (không chạy blocking trên event loop)
+    init_executors(EXECUTOR_CONFIGS)
+
     # 1. Khởi tạo Translator (Dùng chung cho tất cả)
     logger.info("Init Translator...")
-    translator = Translation(from_lang='vi', to_lang='en', mode='google')
+    translator = Translation(from_lang='vi', to_lang='en', mode='google', **TRANSLATION_CONFIG)
     
     # 2. Khởi tạo Elasticsearch Service (Nếu có)
     global es_service
@@ -68,35 +90,26 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Failed to init ES Service: {e}")
 
-    # 3. Load các Model FAISS/CLIP theo Config
-    loaded_count = 0
-    for model_id, config in MODEL_CONFIGS.items():
-        if config["enabled"]:
-            try:
-                logger.info(f"⏳ Loading Model ID {model_id}: {config['name']}...")
-                
-                # Kiểm tra file tồn tại
-                import os
-                if not os.path.exists(config["bin_path"]):
-                    logger.warning(f"File bin không tồn tại: {config['bin_path']}. Bỏ qua.")
-                    continue
-
-                # Khởi tạo Service
-                faiss_services[model_id] = FaissService(
-                    bin_path=config["bin_path"],
-                    json_path=config["json_path"],
-                    model_type=config["type"],
-                    model_name=config["model_key"],
-                    device="cuda" if torch.cuda.is_available() else "cpu",
-                    translator=translator,
-                    pretrained=config.get("pretrained")  # Lấy pretrained từ config nếu có
-                )
-                logger.info(f"Loaded {config['name']} SUCCESS.")
-                loaded_count += 1
-            except Exception as e:
-                logger.error(f"FAILED to load {config['name']}: {e}")
-        else:
-            logger.info(f"Skipped {config['name']} (Disabled)")
+    # 3. Danh bạ video cho trang chủ (chỉ cần frame catalog, không cần model)
+    global video_directory
+    try:
+        video_directory = get_video_index(get_catalog(MODEL_CONFIGS[7]["json_path"]))
+    except Exception as e:
+        logger.error(f"Failed to build video directory: {e}")
+
+    # 4. Khởi tạo Model Registry, preload các Model "enabled" theo Config
+    #    (Model còn lại sẽ được load khi có request faiss=<id> đầu tiên)
+    global model_registry
+    model_registry = ModelRegistry(
+        MODEL_CONFIGS,
+        device="cuda" if torch.cuda.is_available() else "cpu",
+        translator=translator,
+        max_loaded_models=MODEL_REGISTRY_CONFIG["max_loaded_models"],
+        memory_budget_mb=MODEL_REGISTRY_CONFIG["memory_budget_mb"],
+        service_kwargs={"embedding_cache": EMBEDDING_CACHE_CONFIG}
+    )
+    preload_ids = [model_id for model_id, config in MODEL_CONFIGS.items() if config["enabled"]]
+    loaded_count = model_registry.preload(preload_ids)
             
     logger.info(f"========== SYSTEM READY. Services loaded: {loaded_count} ==========")
     
@@ -105,35 +118,16 @@ async def lifespan(app: FastAPI):
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") 
     
     logger.info("Init LLM Service...")
-    llm_service = LlmService(api_keys=GEMINI_API_KEY)
-
-    # Init Multi-Context KIS Service
-    global multi_context_kis
-    if 6 in faiss_services:  # Sử dụng model ID 6 (ViT-L/14@336px)
-        logger.info("Init Multi-Context KIS Service with ViT-L/14...")
-        multi_context_kis = MultiContextKIS(
-            faiss_service=faiss_services[6],
-            es_service=es_service
-        )
-    elif len(faiss_services) > 0:
-        # Fallback: Dùng model đầu tiên
-        first_model_id = next(iter(faiss_services))
-        logger.info(f"Init Multi-Context KIS with model ID {first_model_id}...")
-        multi_context_kis = MultiContextKIS(
-            faiss_service=faiss_services[first_model_id],
-            es_service=es_service
-        )
-
-    logger.info(f"========== SYSTEM READY. Services loaded: {loaded_count} ==========")
+    llm_service = LlmService(api_keys=GEMINI_API_KEY, executor=get_executor("llm"), **LLM_CONFIG)
 
+    # Multi-Context KIS được tạo theo từng request (xem get_multi_context_kis)
 
     yield # Server chạy và chờ request tại đây
     
     # --- SHUTDOWN ---
     logger.info("========== SERVER STOPPING ==========")
-    faiss_services.clear()
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
+    model_registry.clear()
+    shutdown_executors(wait=False)
 
 # Khởi tạo App
 app = FastAPI(lifespan=lifespan)
@@ -153,22 +147,93 @@ class QueryParams(BaseModel):
     page: int = Query(1, ge=1)
     imgid: Optional[int] = Query(None)
     faiss: int = Query(7) # Mặc định ID 7 (ViT-B/32)
+    # Bộ lọc cho /clip, /img: chỉ xếp hạng trong các video này
+    video: Optional[str] = Query(None)      # "L01_V001,L01_V002"
+    group: Optional[str] = Query(None)      # "L01,L02"
+    date_from: Optional[str] = Query(None)  # Ngày publish "YYYY-MM-DD"
+    date_to: Optional[str] = Query(None)
+
+    def filters(self):
+        return parse_filters(self.video, self.group, self.date_from, self.date_to)
+
+async def get_service(model_id):
+    """Lấy FaissService từ registry, nếu phải load model thì chạy trên executor "io" """
+    if model_id in model_registry:
+        return model_registry.get(model_id)
+    return await run_blocking("io", model_registry.get, model_id)
+
+async def get_multi_context_kis():
+    """
+    MultiContextKIS trên model ID 6 (ViT-L/14@336px), fallback model đang được load.
+    Tạo mới mỗi request (chỉ giữ reference tới service): không giữ service đã bị registry evict
+    trong RAM ngoài ngân sách memory_budget_mb.
+    """
+    service = await get_service(MULTI_CONTEXT_MODEL_ID) or model_registry.any_loaded()
+    if service is None:
+        return None
+    return MultiContextKIS(faiss_service=service, es_service=es_service)
+
+def page_bounds(total_items, page, limit=100):
+    """Tính (start_idx, end_idx, page, num_pages) của 1 trang trên tổng total_items phần tử"""
+    num_pages = max(1, (total_items // limit) + (1 if total_items % limit > 0 else 0))
+
+    # Đảm bảo page hợp lệ
+    page = max(1, min(page, num_pages))
+
+    start_idx = (page - 1) * limit
+    end_idx = min(start_idx + limit, total_items)
+    return start_idx, end_idx, page, num_pages
 
 def paginate(data_list, page, limit=100):
     """Hàm cắt list dữ liệu theo trang"""
     if not data_list:
         return [], 1, 1, 0
-        
-    total_items = len(data_list)
-    num_pages = (total_items // limit) + (1 if total_items % limit > 0 else 0)
-    
-    # Đảm bảo page hợp lệ
-    page = max(1, min(page, num_pages)) if num_pages > 0 else 1
-    
-    start_idx = (page - 1) * limit
-    end_idx = min(start_idx + limit, total_items)
-    
-    return data_list[start_idx:end_idx], page, num_pages, total_items
+
+    start_idx, end_idx, page, num_pages = page_bounds(len(data_list), page, limit)
+    return data_list[start_idx:end_idx], page, num_pages, len(data_list)
+
+# ----- Search có cache kết quả (dùng chung cho trang Jinja và JSON API) -----
+# Returns: (result_set, results), results = None nếu model chưa load được
+
+async def search_clip(query, model_id, filters=None):
+    async def run():
+        service = await get_service(model_id)
+        if not service:
+            return None
+        search_query, refined = query, True
+        if llm_service and llm_service.model:
+            search_query, refined = await llm_service.refine_async(query)
+        logger.info(f"Final Search Query for CLIP: {search_query}")
+        if filters:
+            # Query có bộ lọc riêng không gộp batch được với query khác
+            results = await run_blocking("inference", service.text_search, search_query, k=400, filters=filters)
+        else:
+            results = await text_batcher.search(service, search_query, k=400)
+        # LLM timeout / lỗi -> kết quả của query gốc chỉ cache ngắn hạn, lần sau thử refine lại
+        return results if refined else ShortLived(results)
+    return await result_store.get_or_search("clip", {"query": query, "faiss": model_id, "filters": filters}, run)
+
+async def search_image(imgid, model_id, filters=None):
+    async def run():
+        service = await get_service(model_id)
+        if not service:
+            return None
+        return await run_blocking("inference", service.image_search, imgid, k=400, filters=filters)
+    return await result_store.get_or_search("image", {"imgid": imgid, "faiss": model_id, "filters": filters}, run)
+
+async def search_ic(query):
+    async def run():
+        # Sử dụng model L14 (ID 6)
+        service = await get_service(6)
+        if not service:
+            return None
+        return await text_batcher.search(service, query, k=400)
+    return await result_store.get_or_search("ic", {"query": query}, run)
+
+async def search_objects(parsed_query):
+    async def run():
+        return await run_blocking("io", es_service.object_search, parsed_query)
+    return await result_store.get_or_search("object", {"query": parsed_query}, run)
 
 # ==========================================
 # 4. API ENDPOINTS
@@ -178,59 +243,42 @@ def paginate(data_list, page, limit=100):
 async def home(request: Request, params: QueryParams = Depends()):
     """
     Trang chủ: Hiển thị danh sách ảnh.
-    Logic: Lấy danh sách ảnh từ model đang hoạt động đầu tiên.
+    Logic: Lấy từ danh bạ video build sẵn lúc startup, mỗi request chỉ cắt đúng 1 trang.
     """
-    # 1. Tìm một service bất kỳ đang hoạt động để lấy danh sách ảnh làm gốc
-    active_service = None
-    if 7 in faiss_services: # Ưu tiên ID 7 (B32)
-        active_service = faiss_services[7]
-    elif len(faiss_services) > 0: # Lấy cái đầu tiên nếu 7 tắt
-        active_service = faiss_services[next(iter(faiss_services))]
-    
     # Trạng thái các model để hiển thị UI
-    available_models_status = {cfg["name"]: (k in faiss_services) for k, cfg in MODEL_CONFIGS.items()}
+    available_models_status = {cfg["name"]: (k in model_registry) for k, cfg in MODEL_CONFIGS.items()}
 
-    if not active_service:
+    if video_directory is None:
         return templates.TemplateResponse("home.html", {
-            "request": request, 
+            "request": request,
             "data": [],
             "page": 1, "num_pages": 1,
-            "error_message": "Chưa có Model nào được bật (Enabled) hoặc Load thành công!",
-            "available_models": available_models_status
+            "error_message": "Chưa load được danh bạ video (frame catalog)!",
+            "available_models": available_models_status,
+            "available_videos": []
         })
 
-    # 2. Lấy toàn bộ ảnh từ id_map của service
-    all_images = [{"id": k, "imgpath": f"/{v}"} for k, v in active_service.id_map.items()]
-    
-    # 3. Lọc theo video (Logic cũ)
+    catalog = video_directory.catalog
+
+    # Lọc theo video: "L01" -> mọi video của L01, "L01_V003" -> 1 video
     filter_video = request.query_params.get("video", None)
     if filter_video:
-        all_images = [img for img in all_images if filter_video in img["imgpath"]]
-        all_images.sort(key=lambda x: x["id"])
+        codes = video_directory.match_videos(filter_video)
+        total = video_directory.count_frames(codes)
+        start_idx, end_idx, current_page, num_pages = page_bounds(total, params.page)
+        frame_ids = video_directory.page_frames(codes, start_idx, end_idx)
     else:
-        # Nếu không lọc, chỉ lấy 2000 ảnh đầu để demo cho nhẹ trang chủ
-        all_images = sorted(all_images, key=lambda x: x["id"])[:2000]
-
-    # 4. Phân trang
-    paginated_data, current_page, num_pages, total = paginate(all_images, params.page)
-
-    # 5. Lấy danh sách tên video cho Dropdown
-    # (Optional: Nếu muốn tối ưu có thể cache cái này lại)
-    available_videos = set()
-    for img in all_images[:5000]: # Sample 5000 ảnh để lấy prefix
-        path = img["imgpath"]
-        # Path format: /data/clip_frame/L24_V001/keyframe_xxx.webp
-        parts = path.strip('/').split('/')  # Remove leading / and split
-        if len(parts) >= 3 and parts[0] == 'data':
-            available_videos.add(parts[2])  # Get video ID like L24_V001
-            
+        total = len(catalog)
+        start_idx, end_idx, current_page, num_pages = page_bounds(total, params.page)
+        frame_ids = catalog.ids[start_idx:end_idx]
+
     return templates.TemplateResponse("home.html", {
         "request": request,
-        "data": paginated_data,
+        "data": catalog.format_frames(frame_ids),
         "page": current_page,
         "num_pages": num_pages,
         "available_models": available_models_status,
-        "available_videos": sorted(list(available_videos)),
+        "available_videos": video_directory.video_list,
         "filter_video": filter_video,
         "result_count": total
     })
@@ -244,22 +292,15 @@ async def text_search_api(request: Request, params: QueryParams = Depends()):
                 "request": request, "data": [], "page": 1, "num_pages": 1, "error": "Vui lòng nhập từ khóa!"
             })
 
-        # 1. Chọn Service
-        service = faiss_services.get(params.faiss)
-        if not service:
+        # 1. Search (LLM refine + CLIP), trang sau dùng lại kết quả trong result_store
+        result_set, results = await search_clip(params.query, params.faiss, params.filters())
+        if results is None:
             return templates.TemplateResponse("home.html", {
                 "request": request, "data": [], "page": 1, "num_pages": 1, 
                 "error": f"Model ID {params.faiss} chưa được load."
             })
 
-        # 2. Gọi hàm Search
-        search_query = params.query
-        if llm_service and llm_service.model:
-            search_query = llm_service.refine_for_clip(params.query)
-        logger.info(f"Final Search Query for CLIP: {search_query}")
-        results = service.text_search(search_query, k=400)
-
-        # 3. Phân trang
+        # 2. Phân trang
         paginated_data, current_page, num_pages, total = paginate(results, params.page)
 
         return templates.TemplateResponse("home.html", {
@@ -270,7 +311,8 @@ async def text_search_api(request: Request, params: QueryParams = Depends()):
             "query": params.query,
             "faiss": params.faiss,
             "search_type": "clip",
-            "result_count": total
+            "result_count": total,
+            "result_set": result_set
         })
 
     except Exception as e:
@@ -281,12 +323,16 @@ async def text_search_api(request: Request, params: QueryParams = Depends()):
 async def clip_image_search(
     request: Request,
     image: UploadFile = File(...),
-    faiss: int = Form(...)
+    faiss: int = Form(...),
+    video: Optional[str] = Form(None),
+    group: Optional[str] = Form(None),
+    date_from: Optional[str] = Form(None),
+    date_to: Optional[str] = Form(None)
 ):
     """API tìm kiếm CLIP bằng hình ảnh"""
     try:
         # Load service
-        service = faiss_services.get(faiss)
+        service = await get_service(faiss)
         if not service:
             return templates.TemplateResponse("home.html", {
                 "request": request, 
@@ -296,66 +342,37 @@ async def clip_image_search(
                 "error": f"Model ID {faiss} chưa được load"
             })
         
-        # Read and process image
+        if not service.can_encode_images():
+            return templates.TemplateResponse("home.html", {
+                "request": request,
+                "data": [],
+                "page": 1,
+                "num_pages": 1,
+                "error": "Model không hỗ trợ tìm kiếm bằng ảnh"
+            })
+
+        # Decode trên executor "decode" (bỏ qua nếu vector ảnh này đã có trong cache),
+        # encode + search trên executor "inference"
         image_data = await image.read()
-        pil_image = Image.open(io.BytesIO(image_data)).convert('RGB')
-        
-        # Encode image using CLIP
-        with torch.no_grad():
-            if hasattr(service, 'preprocess'):
-                image_tensor = service.preprocess(pil_image).unsqueeze(0).to(service.device)
-                
-                if service.model_type == "open_clip":
-                    features = service.model.encode_image(image_tensor)
-                elif service.model_type == "openai":
-                    features = service.model.encode_image(image_tensor)
-                else:
-                    return templates.TemplateResponse("home.html", {
-                        "request": request,
-                        "data": [],
-                        "page": 1,
-                        "num_pages": 1,
-                        "error": "Model không hỗ trợ tìm kiếm bằng ảnh"
-                    })
-                
-                vector = features.cpu().numpy().astype(np.float32)
-                vector = vector / np.linalg.norm(vector, axis=1, keepdims=True)
-                
-                # Search in FAISS
-                scores, ids = service.index.search(vector, 400)
-                
-                # Format results
-                results = []
-                for score, idx in zip(scores[0], ids[0]):
-                    idx = int(idx)
-                    if idx in service.id_map:
-                        results.append({
-                            "id": idx,
-                            "score": float(score),
-                            "imgpath": f"/{service.id_map[idx]}"
-                        })
-                
-                # Paginate and return
-                paginated_data, current_page, num_pages, total = paginate(results, 1)
-                
-                return templates.TemplateResponse("home.html", {
-                    "request": request,
-                    "data": paginated_data,
-                    "page": current_page,
-                    "num_pages": num_pages,
-                    "query": "[Image Search]",
-                    "faiss": faiss,
-                    "search_type": "clip",
-                    "result_count": total
-                })
-            else:
-                return templates.TemplateResponse("home.html", {
-                    "request": request,
-                    "data": [],
-                    "page": 1,
-                    "num_pages": 1,
-                    "error": "Model không hỗ trợ encode ảnh"
-                })
+        pil_image = None
+        if not service.has_cached_image(image_data):
+            pil_image = await run_blocking("decode", decode_image, image_data)
+        results = await run_blocking("inference", service.image_query, image_data, k=400, image=pil_image,
+                                     filters=parse_filters(video, group, date_from, date_to))
+
+        # Paginate and return
+        paginated_data, current_page, num_pages, total = paginate(results, 1)
+
+        return templates.TemplateResponse("home.html", {
+            "request": request,
+            "data": paginated_data,
+            "page": current_page,
+            "num_pages": num_pages,
+            "query": "[Image Search]",
+            "faiss": faiss,
+            "search_type": "clip",
+            "result_count": total
+        })
                 
     except Exception as e:
         logger.error(f"Error in image search: {e}")
@@ -374,13 +391,11 @@ async def image_search_api(request: Request, params: QueryParams = Depends()):
         if params.imgid is None:
              return templates.TemplateResponse("home.html", {"request": request, "data": [], "error": "Thiếu ID ảnh!"})
 
-        service = faiss_services.get(params.faiss)
-        if not service:
+        # Gọi hàm Search (trang sau dùng lại kết quả trong result_store)
+        result_set, results = await search_image(params.imgid, params.faiss, params.filters())
+        if results is None:
             return templates.TemplateResponse("home.html", {"request": request, "data": [], "error": "Model chưa load."})
 
-        # Gọi hàm Search
-        results = service.image_search(params.imgid, k=400)
-
         # Phân trang
         paginated_data, current_page, num_pages, total = paginate(results, params.page)
 
@@ -392,7 +407,8 @@ async def image_search_api(request: Request, params: QueryParams = Depends()):
             "imgid": params.imgid,
             "faiss": params.faiss,
             "search_type": "image",
-            "result_count": total
+            "result_count": total,
+            "result_set": result_set
         })
     except Exception as e:
         logger.error(f"Lỗi API Img: {e}")
@@ -420,35 +436,34 @@ async def obj_api(request: Request, query: Optional[List[str]] = Query(None), pa
                 name = parts[1].replace("+", " ")
                 parsed_query.append((qty, name, "None")) # Attribute tạm để None
     
-    results = es_service.object_search(parsed_query)
+    result_set, results = await search_objects(parsed_query)
     paginated_data, current_page, num_pages, total = paginate(results, params.page)
     
     return templates.TemplateResponse("home.html", {
         "request": request, "data": paginated_data, "page": current_page, "num_pages": num_pages,
-        "search_type": "object", "result_count": total
+        "search_type": "object", "result_count": total, "result_set": result_set
     })
 
 @app.get("/ic", response_class=HTMLResponse)
 async def ic_api(request: Request, params: QueryParams = Depends()):
     """Tìm kiếm Image Captioning sử dụng ViT-L/14"""
     
-    # Sử dụng model L14 (ID 6)
-    service = faiss_services.get(6)
-    
-    if not service:
-        logger.warning("Model L14 chưa được load!")
-        return templates.TemplateResponse("home.html", {
-            "request": request, 
-            "data": [], 
-            "error": "Model ViT-L/14 chưa được load! Hãy bật ID 6 trong config.",
-            "page": 1,
-            "num_pages": 1,
-            "query": params.query,
-            "search_type": "ic"
-        })
-    
     try:
-        results = service.text_search(params.query, k=400)
+        # Sử dụng model L14 (ID 6), trang sau dùng lại kết quả trong result_store
+        result_set, results = await search_ic(params.query)
+
+        if results is None:
+            logger.warning("Model L14 chưa được load!")
+            return templates.TemplateResponse("home.html", {
+                "request": request, 
+                "data": [], 
+                "error": "Model ViT-L/14 chưa được load! Hãy bật ID 6 trong config.",
+                "page": 1,
+                "num_pages": 1,
+                "query": params.query,
+                "search_type": "ic"
+            })
+
         paginated_data, current_page, num_pages, total = paginate(results, params.page)
         
         return templates.TemplateResponse("home.html", {
@@ -458,7 +473,8 @@ async def ic_api(request: Request, params: QueryParams = Depends()):
             "num_pages": num_pages,
             "query": params.query, 
             "search_type": "ic", 
-            "result_count": total
+            "result_count": total,
+            "result_set": result_set
         })
     except Exception as e:
         logger.error(f"Lỗi IC API: {e}")
@@ -470,6 +486,109 @@ async def ic_api(request: Request, params: QueryParams = Depends()):
             "num_pages": 1
         })
 
+# ==========================================
+# 📄 JSON SEARCH API (result_set + cursor)
+# ==========================================
+class SearchRequest(BaseModel):
+    type: str = "clip"  # clip | image | ic | object
+    query: Optional[str] = None
+    imgid: Optional[int] = None
+    objects: Optional[List[str]] = None  # Type "object": ["1 person", "2 car"]
+    faiss: int = 7
+    limit: int = Field(100, ge=1, le=1000)  # Cùng giới hạn với /api/results
+    # Bộ lọc cho type "clip" / "image" (xem utils/search_filter.py)
+    video: Optional[str] = None
+    group: Optional[str] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+
+@app.post("/api/search")
+async def search_json_api(payload: SearchRequest):
+    """
+    Search và trả về trang đầu tiên + result_set id.
+    Các trang sau lấy bằng GET /api/results/{result_set}?cursor=<next_cursor> (không search lại).
+    """
+    try:
+        filters = parse_filters(payload.video, payload.group, payload.date_from, payload.date_to)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    try:
+        if payload.type == "clip" and payload.query:
+            result_set, results = await search_clip(payload.query, payload.faiss, filters)
+        elif payload.type == "image" and payload.imgid is not None:
+            result_set, results = await search_image(payload.imgid, payload.faiss, filters)
+        elif payload.type == "ic" and payload.query:
+            result_set, results = await search_ic(payload.query)
+        elif payload.type == "object" and payload.objects:
+            if not es_service:
+                return JSONResponse(status_code=503, content={"error": "Elasticsearch chưa kết nối!"})
+            parsed_query = [tuple(item.split()[:2]) + ("None",) for item in payload.objects if len(item.split()) >= 2]
+            result_set, results = await search_objects(parsed_query)
+        else:
+            return JSONResponse(status_code=400, content={"error": f"Thiếu tham số cho search type '{payload.type}'"})
+
+        if results is None:
+            return JSONResponse(status_code=503, content={"error": "Model chưa được load"})
+        # Đọc trang đầu từ chính kết quả vừa search (entry trong cache có thể đã bị LRU evict / là kết quả không cache)
+        return JSONResponse(content=result_store.page(result_set, cursor=0, limit=payload.limit, results=results))
+
+    except Exception as e:
+        logger.error(f"JSON Search Error: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/api/results/{result_set}")
+async def search_results_page(result_set: str, cursor: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """Trang tiếp theo của 1 bộ kết quả đã có trong cache"""
+    page = result_store.page(result_set, cursor=cursor, limit=limit)
+    if page is None:
+        return JSONResponse(status_code=404, content={"error": "result_set không tồn tại hoặc đã hết hạn, hãy search lại"})
+    return JSONResponse(content=page)
+
+# ==========================================
+# 🧩 ENSEMBLE SEARCH (nhiều model CLIP)
+# ==========================================
+@app.get("/api/ensemble-search")
+async def ensemble_search_api(
+    query: str = Query(...),
+    models: Optional[str] = Query(None),  # "1,6,7", mặc định: mọi model đang load
+    method: Optional[str] = Query(None),  # "rrf" | "weighted", mặc định theo ENSEMBLE_CONFIG
+    k: int = Query(100, ge=1, le=1000)
+):
+    """
+    Chạy query trên nhiều model song song, gộp điểm (RRF / weighted z-score).
+    Chỉ dùng model đã load để không làm registry phải evict / load lại liên tục.
+    Trả về latency EWMA từng model và các model bị bỏ vì chậm.
+    """
+    try:
+        model_ids = [int(m) for m in models.split(",")] if models else model_registry.loaded_ids()
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": f"models không hợp lệ: {models}"})
+
+    services = {model_id: model_registry.peek(model_id) for model_id in model_ids}
+    not_loaded = [model_id for model_id, service in services.items() if service is None]
+    services = {model_id: service for model_id, service in services.items() if service is not None}
+    if not services:
+        return JSONResponse(status_code=503, content={"error": "Không có model nào đang load", "not_loaded": not_loaded})
+
+    try:
+        search_query = query
+        if llm_service and llm_service.model:
+            search_query, _ = await llm_service.refine_async(query)
+
+        scores, ids, info = await ensemble_searcher.search(services, search_query, k=k, method=method)
+        catalog = next(iter(services.values())).catalog
+        return JSONResponse(content={
+            "results": catalog.format_results(scores, ids),
+            **info,
+            "not_loaded": not_loaded
+        })
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except Exception as e:
+        logger.error(f"Ensemble Search Error: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
 # ==========================================
 # 🎯 MULTI-CONTEXT KIS ENDPOINT
 # ==========================================
@@ -478,6 +597,9 @@ class MultiContextRequest(BaseModel):
     context2: Optional[str] = ""
     context3: Optional[str] = ""
     faiss: int = 7  # Default model ID
+    mode: str = "auto"  # auto | frame | video | temporal (context1 -> context2 -> context3 theo thời gian)
+    window_seconds: float = 60.0  # Mode temporal: khoảng cách tối đa giữa 2 context liên tiếp
+    search_k: int = Field(MULTI_CONTEXT_SEARCH_K, ge=1, le=10000)  # Số frame candidate mỗi context
 
 @app.post("/api/multi-context-search")
 async def multi_context_search_api(payload: MultiContextRequest):
@@ -485,6 +607,7 @@ async def multi_context_search_api(payload: MultiContextRequest):
     API tìm kiếm multi-context
     Trả về JSON cho AJAX call
     """
+    multi_context_kis = await get_multi_context_kis()
     if not multi_context_kis:
         return JSONResponse(
             status_code=503,
@@ -496,10 +619,14 @@ async def multi_context_search_api(payload: MultiContextRequest):
         contexts = [payload.context1, payload.context2, payload.context3]
         
         # Search
-        results = multi_context_kis.search_multi_context(
+        results = await run_blocking(
+            "inference",
+            multi_context_kis.search_multi_context,
             contexts=contexts,
             k=400,
-            search_k=100
+            search_k=payload.search_k,
+            mode=payload.mode,
+            window_seconds=payload.window_seconds
         )
         
         # Get video summary
@@ -524,19 +651,13 @@ async def multi_context_ui(request: Request, params: QueryParams = Depends()):
     """
     Endpoint GET cho Multi-Context (để hiển thị UI hoặc handle query params)
     """
-    if not multi_context_kis:
-        return templates.TemplateResponse("home.html", {
-            "request": request,
-            "data": [],
-            "page": 1,
-            "num_pages": 1,
-            "error": "Multi-Context KIS chưa được khởi tạo"
-        })
-    
     # Lấy contexts từ query params
     context1 = request.query_params.get("context1", "")
     context2 = request.query_params.get("context2", "")
     context3 = request.query_params.get("context3", "")
+    mode = request.query_params.get("mode", "auto")
+    window_seconds = float(request.query_params.get("window", 60))
+    search_k = min(max(int(request.query_params.get("search_k", MULTI_CONTEXT_SEARCH_K)), 1), 10000)
     
     if not any([context1, context2, context3]):
         # Chưa có query, hiển thị trang trống
@@ -547,14 +668,29 @@ async def multi_context_ui(request: Request, params: QueryParams = Depends()):
             "num_pages": 1,
             "search_type": "multi_context"
         })
-    
+
+    # Chỉ load model khi thực sự có query
+    multi_context_kis = await get_multi_context_kis()
+    if not multi_context_kis:
+        return templates.TemplateResponse("home.html", {
+            "request": request,
+            "data": [],
+            "page": 1,
+            "num_pages": 1,
+            "error": "Multi-Context KIS chưa được khởi tạo"
+        })
+
     try:
         # Search
         contexts = [context1, context2, context3]
-        results = multi_context_kis.search_multi_context(
+        results = await run_blocking(
+            "inference",
+            multi_context_kis.search_multi_context,
             contexts=contexts,
             k=400,
-            search_k=100
+            search_k=search_k,
+            mode=mode,
+            window_seconds=window_seconds
         )
         
         # Paginate
@@ -583,6 +719,24 @@ async def multi_context_ui(request: Request, params: QueryParams = Depends()):
             "search_type": "multi_context"
         })
 
+# ==========================================
+# 📊 CACHE STATS
+# ==========================================
+@app.get("/api/stats/cache")
+async def cache_stats_api():
+    """Hit/miss của embedding cache cho từng model đang load, translation cache và result cache"""
+    stats = {}
+    for model_id in model_registry.loaded_ids():
+        service = model_registry.peek(model_id)
+        if service is not None and service.embedding_cache is not None:
+            stats[MODEL_CONFIGS[model_id]["name"]] = service.embedding_cache.stats()
+    translation_stats = model_registry.translator.cache_stats() if model_registry.translator else None
+    return JSONResponse(content={
+        "embedding_cache": stats,
+        "translation_cache": translation_stats,
+        "result_cache": result_store.stats()
+    })
+
 # ==========================================
 # 🚀 SUBMIT ENDPOINT
 # ==========================================
@@ -613,7 +767,7 @@ async def submit_frame(payload: SubmitRequest):
             "timestamp": payload.frame,
             "timestampMs": timestamp_to_use
         }
-        response = full_submission_flow(result, fps=payload.fps)
+        response = await run_blocking("io", full_submission_flow, result, fps=payload.fps)
         
         # Extract detailed submission information from DRES response
         submission_info = {
@@ -0,0 +1,122 @@
+"""
+Build index xấp xỉ (IVF-Flat / IVF-PQ / HNSW) hoặc lượng tử hóa (SQfp16 / SQ8) từ file FAISS .bin flat
+và đo recall@k, sai số điểm so với flat float32.
+
+Query đánh giá: file .npy (vd embedding text query thật, nên dùng) hoặc mẫu ngẫu nhiên các vector trong index.
+Query lấy mẫu từ index ("in-index") có sẵn chính nó trong index: kết quả trùng query bị bỏ khỏi cả ground truth
+lẫn kết quả, nhưng recall vẫn thường cao hơn query thật (query nằm đúng trên phân bố dữ liệu đã train),
+report ghi rõ "query_source" để không nhầm.
+Kết quả sweep tham số search được in ra và lưu cạnh file index (<out>.report.json),
+chọn tham số rồi set "index_variant" + "search_params" trong MODEL_CONFIGS.
+
+Usage:
+    python scripts/build_ann_index.py data/bin/l14.bin --variant ivf_pq --nlist 4096 --nprobe 8 16 32 64
+    python scripts/build_ann_index.py data/bin/l14.bin --variant hnsw --hnsw-m 32 --ef-search 64 128 256
+    python scripts/build_ann_index.py data/bin/bigg14_laion.bin --variant sq_fp16
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.index_tools import (INDEX_VARIANTS, variant_path, factory_string, source_vectors, build_index, evaluate,
+                               drop_self)
+
+
+def load_queries(vectors, queries_path=None, num_queries=1000, seed=1):
+    """
+    Returns: (queries float32 [n, d], self_ids) - self_ids là frame ID của query lấy mẫu từ index,
+        None khi query đọc từ file (held-out)
+    """
+    if queries_path:
+        return np.ascontiguousarray(np.load(queries_path).astype(np.float32)), None
+    sample = np.sort(np.random.default_rng(seed).choice(len(vectors), size=min(num_queries, len(vectors)), replace=False))
+    return np.ascontiguousarray(np.asarray(vectors[sample], dtype=np.float32)), sample.astype(np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build approximate FAISS index variants from a flat .bin")
+    parser.add_argument("bin_path", help="Index flat gốc (data/bin/*.bin)")
+    parser.add_argument("--variant", choices=[v for v in INDEX_VARIANTS if v != "flat"], required=True)
+    parser.add_argument("--out", help="File index đầu ra (mặc định: <bin>.<variant>.bin)")
+    parser.add_argument("--nlist", type=int, default=4096, help="Số cluster IVF")
+    parser.add_argument("--pq-m", type=int, default=None, help="Số byte PQ / vector (mặc định d // 16)")
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--train-size", type=int, default=200000)
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[8, 16, 32, 64], help="Giá trị nprobe cần đo (IVF)")
+    parser.add_argument("--ef-search", type=int, nargs="*", default=[64, 128, 256], help="Giá trị efSearch cần đo (HNSW)")
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--queries", help="File .npy query vectors (mặc định lấy mẫu từ index)")
+    parser.add_argument("--num-queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    out_path = args.out or variant_path(args.bin_path, args.variant)
+
+    flat = faiss.read_index(args.bin_path)
+    vectors = source_vectors(flat)
+    spec = factory_string(args.variant, flat.d, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+    print(f"Source: {args.bin_path} ({flat.ntotal:,} x {flat.d}) -> {spec}")
+
+    start = time.perf_counter()
+    index = build_index(vectors, spec, train_size=args.train_size, ef_construction=args.ef_construction)
+    build_seconds = time.perf_counter() - start
+    faiss.write_index(index, out_path)
+    print(f"Built in {build_seconds:.1f}s -> {out_path} ({os.path.getsize(out_path) / 1024 ** 2:.1f} MB)")
+
+    # Ground truth từ index flat
+    queries, self_ids = load_queries(vectors, args.queries, args.num_queries)
+    query_source = "held-out" if self_ids is None else "in-index"
+    if self_ids is not None:
+        print("Cảnh báo: query lấy mẫu từ chính index (in-index), recall cao hơn thực tế - nên dùng --queries")
+    start = time.perf_counter()
+    gt_scores, gt_ids = flat.search(queries, args.k if self_ids is None else args.k + 1)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    if self_ids is not None:
+        gt_scores, gt_ids = drop_self(gt_scores, gt_ids, self_ids, args.k)
+
+    if args.variant == "hnsw":
+        sweep = [{"efSearch": ef} for ef in args.ef_search]
+    elif args.variant.startswith("ivf"):
+        sweep = [{"nprobe": nprobe} for nprobe in args.nprobe]
+    else:
+        sweep = [{}]  # SQ brute-force: không có tham số search
+
+    results = [evaluate(index, queries, gt_ids, k=args.k, params=params, gt_scores=gt_scores, self_ids=self_ids)
+               for params in sweep]
+
+    flat_mb = os.path.getsize(args.bin_path) / 1024 ** 2
+    index_mb = os.path.getsize(out_path) / 1024 ** 2
+    print(f"\nQueries: {len(queries)} ({query_source})")
+    print(f"Flat: {flat_ms:.2f} ms/query, {flat_mb:.1f} MB -> {index_mb:.1f} MB ({index_mb / flat_mb:.0%})")
+    for row in results:
+        print(f"  {row['params']}: recall@{args.k}={row[f'recall@{args.k}']:.4f}  "
+              f"top-1 score error={row['top1_score_error']:.5f}  "
+              f"{row['ms_per_query']:.2f} ms/query ({flat_ms / max(row['ms_per_query'], 1e-9):.1f}x)")
+
+    report = {
+        "source": args.bin_path,
+        "index": out_path,
+        "variant": args.variant,
+        "factory": spec,
+        "ntotal": int(index.ntotal),
+        "num_queries": len(queries),
+        "query_source": query_source,
+        "build_seconds": build_seconds,
+        "flat_ms_per_query": flat_ms,
+        "flat_mb": flat_mb,
+        "index_mb": index_mb,
+        "results": results
+    }
+    with open(out_path + ".report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report -> {out_path}.report.json")
+
+
+if __name__ == "__main__":
+    main()
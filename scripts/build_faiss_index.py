@@ -0,0 +1,80 @@
+"""
+Build file FAISS .bin flat (inner product) từ embedding store của scripts/etl_pipeline.py (database/embedding_store.py).
+
+Đọc store tuần tự từng batch (mmap từng shard), ghi thẳng vào bộ nhớ của IndexFlatIP tại vị trí = frame ID
+nên không cần giữ thêm bản copy nào. Frame ID không có embedding (ảnh lỗi / chưa trích xuất) giữ vector 0.
+Có thể xuất kèm ma trận .npy (load_mode="npy" / rerank) trong cùng 1 lần đọc.
+
+Usage:
+    python scripts/build_faiss_index.py data/embeddings/ViT-B-32_laion2b_s34b_b79k data/bin/b32.bin
+    python scripts/build_faiss_index.py data/embeddings/ViT-L-14_openai data/bin/l14.bin --npy data/bin/l14.npy --ntotal 177321
+"""
+import os
+import sys
+import argparse
+
+import faiss
+import numpy as np
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.embedding_store import EmbeddingStore
+from utils.index_loader import index_vectors
+
+
+def build_faiss_index(store_dir, bin_path, ntotal=None, npy_path=None, npy_dtype="float32",
+                      batch_size=65536):
+    store = EmbeddingStore(store_dir)
+    d = store.dim
+    if ntotal is None:
+        done = store.done_ids()
+        ntotal = int(done[-1]) + 1 if len(done) else 0
+
+    # Cấp phát index đủ ntotal vector 0 theo chunk, sau đó ghi embedding vào đúng vị trí frame ID
+    index = faiss.IndexFlatIP(d)
+    for start in range(0, ntotal, batch_size):
+        index.add(np.zeros((min(batch_size, ntotal - start), d), dtype=np.float32))
+    vectors = index_vectors(index)
+
+    out = None
+    if npy_path:
+        out = np.lib.format.open_memmap(npy_path, mode='w+', dtype=npy_dtype, shape=(ntotal, d))
+
+    filled = np.zeros(ntotal, dtype=bool)
+    with tqdm(total=len(store), unit="vec") as pbar:
+        for ids, embeddings in store.iter_batches(batch_size):
+            valid = (ids >= 0) & (ids < ntotal)
+            ids, embeddings = ids[valid], embeddings[valid]
+            vectors[ids] = embeddings
+            if out is not None:
+                out[ids] = embeddings.astype(npy_dtype)
+            filled[ids] = True
+            pbar.update(len(valid))
+
+    faiss.write_index(index, bin_path)
+    print(f"Built {ntotal:,} x {d} flat IP index -> {bin_path} ({os.path.getsize(bin_path) / 1024 ** 2:.1f} MB)")
+    if out is not None:
+        out.flush()
+        print(f"Exported {ntotal:,} x {d} ({npy_dtype}) -> {npy_path}")
+
+    missing = ntotal - int(filled.sum())
+    if missing:
+        print(f"Cảnh báo: {missing} frame ID không có embedding trong store (giữ vector 0)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a flat FAISS .bin from a sharded embedding store")
+    parser.add_argument("store_dir", help="Thư mục embedding store (data/embeddings/<model>)")
+    parser.add_argument("bin_path", help="File index đầu ra (data/bin/*.bin)")
+    parser.add_argument("--ntotal", type=int, help="Số frame của catalog (mặc định: frame ID lớn nhất + 1)")
+    parser.add_argument("--npy", help="Xuất kèm ma trận .npy")
+    parser.add_argument("--npy-dtype", choices=["float16", "float32"], default="float32")
+    parser.add_argument("--batch-size", type=int, default=65536)
+    args = parser.parse_args()
+
+    build_faiss_index(args.store_dir, args.bin_path, ntotal=args.ntotal, npy_path=args.npy,
+                      npy_dtype=args.npy_dtype, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
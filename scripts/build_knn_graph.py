@@ -0,0 +1,81 @@
+"""
+Tính sẵn top-K láng giềng cho mọi frame của 1 index (utils/knn_graph.py), để /img không phải search.
+
+Ghi trực tiếp vào file .npy memory-mapped theo từng batch query, metadata ghi sau cùng
+nên job bị dừng giữa chừng sẽ không được dùng. Có thể dùng index xấp xỉ (--search-index)
+để build nhanh hơn, graph vẫn gắn với file index gốc.
+
+Usage:
+    python scripts/build_knn_graph.py data/bin/l14.bin --k 400
+    python scripts/build_knn_graph.py data/bin/l14.bin --k 400 --search-index data/bin/l14.hnsw.bin --search-params efSearch=512
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import faiss
+import numpy as np
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.index_tools import source_vectors
+from utils.knn_graph import graph_paths, index_signature
+
+
+def build_knn_graph(bin_path, k=400, batch_size=1024, search_index_path=None, search_params=None):
+    index = faiss.read_index(bin_path)
+    vectors = source_vectors(index)
+    search_index = faiss.read_index(search_index_path) if search_index_path else index
+    if search_params:
+        faiss.ParameterSpace().set_index_parameters(search_index, search_params)
+
+    ids_path, scores_path, meta_path = graph_paths(bin_path)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # Graph cũ không còn hợp lệ trong lúc ghi đè
+
+    ntotal = index.ntotal
+    graph_ids = np.lib.format.open_memmap(ids_path, mode='w+', dtype=np.int32, shape=(ntotal, k))
+    graph_scores = np.lib.format.open_memmap(scores_path, mode='w+', dtype=np.float16, shape=(ntotal, k))
+
+    start = time.perf_counter()
+    for begin in tqdm(range(0, ntotal, batch_size)):
+        queries = np.ascontiguousarray(vectors[begin:begin + batch_size], dtype=np.float32)
+        scores, ids = search_index.search(queries, k)
+        graph_ids[begin:begin + len(queries)] = ids
+        graph_scores[begin:begin + len(queries)] = scores
+    graph_ids.flush()
+    graph_scores.flush()
+    elapsed = time.perf_counter() - start
+
+    meta = {
+        "k": k,
+        "ntotal": int(ntotal),
+        "index": index_signature(bin_path),
+        "search_index": search_index_path or bin_path,
+        "search_params": search_params,
+        "build_seconds": elapsed
+    }
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    size_mb = (os.path.getsize(ids_path) + os.path.getsize(scores_path)) / 1024 ** 2
+    print(f"KNN graph {ntotal:,} x {k} ({size_mb:.1f} MB) built in {elapsed:.1f}s -> {ids_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute top-K neighbours of every frame for /img")
+    parser.add_argument("bin_path", help="Index gốc (data/bin/*.bin)")
+    parser.add_argument("--k", type=int, default=400, help="Số láng giềng / frame (/img dùng k=400)")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--search-index", help="Index dùng để search khi build (mặc định: bin_path)")
+    parser.add_argument("--search-params", help="Tham số ParameterSpace cho search index, vd nprobe=64")
+    args = parser.parse_args()
+
+    build_knn_graph(args.bin_path, k=args.k, batch_size=args.batch_size,
+                    search_index_path=args.search_index, search_params=args.search_params)
+
+
+if __name__ == "__main__":
+    main()
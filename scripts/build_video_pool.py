@@ -0,0 +1,56 @@
+"""
+Build embedding max-pool theo video cho multi-context KIS (key "video_pool_path" trong MODEL_CONFIGS).
+
+Mỗi video -> 1 vector = max theo từng chiều trên mọi frame của video (rồi L2-normalize),
+thứ tự dòng theo danh sách video đã sort của FrameCatalog.
+
+Usage:
+    python scripts/build_video_pool.py --model-id 6 --out data/index/video_pool_l14.npy
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+from tqdm import tqdm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from configs import MODEL_CONFIGS
+from utils.index_loader import load_index, index_vectors
+from utils.frame_catalog import get_catalog
+from utils.video_index import get_video_index
+
+
+def build_video_pool(config, out_path, pool="max"):
+    index = load_index(config["bin_path"], load_mode=config.get("load_mode", "memory"), npy_path=config.get("npy_path"))
+    vectors = index_vectors(index)
+    video_index = get_video_index(get_catalog(config["json_path"]))
+
+    pooled = np.zeros((len(video_index), index.d), dtype=np.float32)
+    for code in tqdm(range(len(video_index))):
+        ids = video_index.frame_ids[video_index.frame_slice(code)]
+        ids = ids[ids < index.ntotal]
+        if len(ids) == 0:
+            continue
+        # Index không lưu vector thô (IVF/HNSW) thì reconstruct từng frame
+        frames = np.asarray(vectors[ids], dtype=np.float32) if vectors is not None else np.stack([index.reconstruct(int(i)) for i in ids])
+        pooled[code] = frames.max(axis=0) if pool == "max" else frames.mean(axis=0)
+
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    pooled /= np.where(norms > 0, norms, 1)
+    np.save(out_path, pooled)
+    print(f"Saved {pool}-pooled embeddings for {len(video_index)} videos -> {out_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build per-video pooled embeddings")
+    parser.add_argument("--model-id", type=int, required=True, help="ID trong MODEL_CONFIGS")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--pool", choices=["max", "mean"], default="max")
+    args = parser.parse_args()
+
+    build_video_pool(MODEL_CONFIGS[args.model_id], args.out, pool=args.pool)
+
+
+if __name__ == "__main__":
+    main()
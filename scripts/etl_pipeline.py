@@ -101,7 +101,9 @@ if __name__ == "__main__":
 import sys
 import os
 import json
-import pickle # Thư viện để lưu file tạm
+import time
+import argparse
+import numpy as np
 from tqdm import tqdm
 from pathlib import Path
 
@@ -109,10 +111,15 @@ from pathlib import Path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # from database.milvus_db import MilvusDB # <--- Tạm thời không cần cái này
 from database.feature_extractor import FeatureExtractor
+from database.embedding_store import EmbeddingStore
 
 # CẤU HÌNH
 JSON_PATH = 'data/index/path_index_clip.json'
-SAVE_FILE = 'vectors_dump_quickgelu.pkl' # Tên file lưu tạm
+SAVE_DIR = 'data/embeddings'  # Mỗi model 1 store: data/embeddings/<model>_<pretrained>/
+SHARD_SIZE = 16384  # Số embedding / shard
+FLUSH_EVERY = 100   # Ghi phần đang gom thành shard sau mỗi N batch (crash chỉ mất tối đa N batch)
+BATCH_SIZE = 64    # Số ảnh / 1 lần forward encode_image
+NUM_WORKERS = 4    # Số process decode + preprocess ảnh song song (DataLoader)
 
 # --- HÀM BỊ THIẾU (PHẢI CÓ CÁI NÀY MỚI CHẠY ĐƯỢC) ---
 def parse_video_info(file_path):
@@ -134,11 +141,27 @@ def parse_video_info(file_path):
 # MODEL_NAME = 'ViT-H-14-378-quickgelu' 
 # PRETRAINED = 'dfn5b'
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Trích xuất embedding keyframe (batch + decode song song)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--num-workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--limit", type=int, default=10000, help="Số keyframe cần xử lý (0 = tất cả)")
+    parser.add_argument("--model", default='ViT-B-32')
+    parser.add_argument("--pretrained", default='laion2b_s34b_b79k')
+    parser.add_argument("--out", help="Thư mục embedding store (mặc định: SAVE_DIR/<model>_<pretrained>)")
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"], help="Kiểu lưu embedding trên đĩa")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--flush-every", type=int, default=FLUSH_EVERY,
+                        help="Ghi shard sau mỗi N batch dù chưa đủ shard-size (0 = chỉ ghi khi đủ)")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+
     # 1. Load Model (Dùng bản nhẹ ViT-B-32 để chạy nhanh trên CPU)
     # Lưu ý: Nếu bạn chưa sửa file feature_extractor.py để nhận tham số này thì cứ giữ mặc định
     try:
-        extractor = FeatureExtractor(model_name='ViT-B-32', pretrained='laion2b_s34b_b79k')
+        extractor = FeatureExtractor(model_name=args.model, pretrained=args.pretrained)
     except:
         # Fallback nếu code cũ của bạn hard-code model
         print("Cảnh báo: Không load được ViT-B-32, đang dùng model mặc định trong code...")
@@ -155,51 +178,62 @@ def main():
     with open(JSON_PATH, 'r') as f:
         data = json.load(f)
     
-    # Test trước 10000 keyframe (hoặc bỏ [:10000] nếu muốn chạy hết)
-    items = list(data.items())[:10000]
-
-    # Chuẩn bị list chứa
-    saved_vectors = [] 
-    
-    print(f"Đang xử lý {len(items)} ảnh trên CPU...")
-    
-    # 4. Vòng lặp ETL
-    for key, path in tqdm(items):
-        # Xử lý đường dẫn tuyệt đối/tương đối
-        full_path = path if os.path.exists(path) else os.path.join(os.getcwd(), path)
-        if not os.path.exists(full_path):
-            continue
-            
-        # Trích xuất Vector
-        embedding = extractor.encode_image(full_path)
-        if embedding is None:
-            continue
-            
-        # Lấy thông tin phụ
-        video_id, frame_id = parse_video_info(path)
-        
-        # Lưu vào RAM
-        saved_vectors.append({
-            'id': int(key),
-            'video_id': video_id,
-            'frame_id': frame_id,
-            'path': path,
-            'embedding': embedding
-        })
-
-        # Cứ mỗi 1000 ảnh thì lưu đè ra file 1 lần (Checkpoint)
-        # Để lỡ máy có sập thì còn giữ được tiến độ
-        if len(saved_vectors) % 1000 == 0:
-            with open(SAVE_FILE, 'wb') as f:
-                pickle.dump(saved_vectors, f)
+    # Test trước 10000 keyframe (--limit 0 nếu muốn chạy hết)
+    items = list(data.items())
+    if args.limit:
+        items = items[:args.limit]
+
+    # Bỏ các ảnh không tồn tại trên đĩa
+    items = [(key, path) for key, path in items if os.path.exists(path)]
+
+    # Store ghi thêm theo shard, chạy lại thì bỏ qua các frame đã trích xuất
+    out_dir = args.out or os.path.join(SAVE_DIR, f"{args.model}_{args.pretrained}")
+    store = EmbeddingStore(out_dir, dim=extractor.get_dim(), dtype=args.dtype,
+                           shard_size=args.shard_size, model=f"{args.model}/{args.pretrained}")
+    done = store.done_ids()
+    if len(done):
+        keys = np.asarray([int(key) for key, _ in items], dtype=np.int64)
+        pending = ~np.isin(keys, done)
+        print(f"Đã có {len(done)} embedding trong {out_dir}, bỏ qua {len(items) - int(pending.sum())} ảnh")
+        items = [item for item, keep in zip(items, pending) if keep]
+
+    print(f"Đang xử lý {len(items)} ảnh (batch {args.batch_size}, {args.num_workers} workers)...")
+
+    # 4. Vòng lặp ETL: DataLoader decode song song, encode theo batch, ghi thẳng vào store
+    start = time.perf_counter()
+    processed, failed = 0, 0
+    batches = extractor.extract(items, batch_size=args.batch_size, num_workers=args.num_workers)
+    try:
+        with tqdm(total=len(items), unit="img") as pbar:
+            for step, (keys, paths, embeddings, attempted) in enumerate(batches, 1):
+                if len(keys):
+                    metas = []
+                    for key, path in zip(keys.tolist(), paths):
+                        # Lấy thông tin phụ
+                        video_id, frame_id = parse_video_info(path)
+                        metas.append({'video_id': video_id, 'frame_id': frame_id, 'path': path})
+
+                    # Đủ shard_size thì store tự ghi 1 shard mới (append-only, không ghi lại dữ liệu cũ)
+                    store.append(keys, embeddings, metas)
+                processed += len(keys)
+                failed += attempted - len(keys)
+
+                # Chốt phần đang gom định kỳ để crash / Ctrl+C không mất cả shard
+                if args.flush_every and step % args.flush_every == 0:
+                    store.flush()
+
+                # Ảnh lỗi cũng tính là đã xử lý để thanh tiến độ chạy tới 100%
+                pbar.update(attempted)
+                pbar.set_postfix(img_per_sec=f"{processed / (time.perf_counter() - start):.1f}", failed=failed)
+    finally:
+        # 5. Ghi phần còn lại thành shard cuối (kể cả khi vòng lặp bị lỗi / ngắt giữa chừng)
+        store.close()
+    elapsed = time.perf_counter() - start
 
-    # 5. Lưu lần cuối cùng khi chạy xong
-    with open(SAVE_FILE, 'wb') as f:
-        pickle.dump(saved_vectors, f)
-    
     print(f"\n✅ XONG GIAI ĐOẠN 1!")
-    print(f"Dữ liệu đã lưu tại: {SAVE_FILE}")
-    print(f"Tổng số vector: {len(saved_vectors)}")
+    print(f"Dữ liệu đã lưu tại: {out_dir}")
+    print(f"Tổng số vector: {len(store)} (mới: {processed}, ảnh lỗi: {failed})")
+    print(f"Tốc độ: {processed / max(elapsed, 1e-9):.1f} images/sec ({elapsed:.1f}s)")
     print("Bây giờ bạn có thể bật Docker lên và chạy script insert.")
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+"""
+Export vector từ file FAISS .bin ra ma trận .npy để dùng với load_mode="npy".
+
+Usage:
+    python scripts/export_npy.py data/bin/l14.bin data/bin/l14.npy --dtype float16
+"""
+import argparse
+
+import faiss
+import numpy as np
+from tqdm import tqdm
+
+
+def export_npy(bin_path, npy_path, dtype="float32", chunk_size=65536):
+    index = faiss.read_index(bin_path)
+    out = np.lib.format.open_memmap(npy_path, mode='w+', dtype=dtype, shape=(index.ntotal, index.d))
+
+    # Reconstruct theo chunk để không phải giữ 2 bản copy trong RAM
+    for start in tqdm(range(0, index.ntotal, chunk_size)):
+        n = min(chunk_size, index.ntotal - start)
+        out[start:start + n] = index.reconstruct_n(start, n).astype(dtype)
+
+    out.flush()
+    print(f"Exported {index.ntotal:,} x {index.d} ({dtype}) -> {npy_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export FAISS .bin vectors to a .npy matrix")
+    parser.add_argument("bin_path")
+    parser.add_argument("npy_path")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float32")
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    args = parser.parse_args()
+
+    export_npy(args.bin_path, args.npy_path, dtype=args.dtype, chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
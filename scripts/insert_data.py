@@ -1,5 +1,8 @@
-import pickle
+import os
+import sys
 import time
+import argparse
+from tqdm import tqdm
 from pymilvus import (
     connections,
     FieldSchema, CollectionSchema, DataType,
@@ -7,69 +10,67 @@ from pymilvus import (
     utility
 )
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.embedding_store import EmbeddingStore
+from database.milvus_ingest import column_batches, ingest, InMemoryCollection
+
 # --- CẤU HÌNH ---
-PKL_FILE = 'vectors_dump.pkl'
+STORE_DIR = 'data/embeddings/ViT-B-32_laion2b_s34b_b79k' # Embedding store do etl_pipeline.py ghi
 COLLECTION_NAME = 'video_search_vit_b_32' # Đặt tên rõ ràng
 DIMENSION = 512  # ViT-B-32 có vector size là 512
 BATCH_SIZE = 1000 # Insert từng cục 1000 dòng
+MAX_IN_FLIGHT = 2 # Số batch insert song song
+RETRIES = 3       # Số lần thử lại 1 batch lỗi
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Insert embedding store vào Milvus (streaming theo batch)")
+    parser.add_argument("--store", default=STORE_DIR, help="Thư mục embedding store")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--in-flight", type=int, default=MAX_IN_FLIGHT, help="Số batch insert song song tối đa")
+    parser.add_argument("--retries", type=int, default=RETRIES)
+    parser.add_argument("--dry-run", action="store_true", help="Insert vào collection giả trong RAM, không cần Milvus")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+
     # 1. Kết nối Milvus
     print("1. Đang kết nối tới Milvus...")
-    try:
-        connections.connect("default", host="127.0.0.1", port="19530")
-    except Exception as e:
-        print(f"Lỗi kết nối: {e}")
-        print("Hãy chắc chắn bạn đã chạy 'docker compose start'!")
-        return
-
-    # 2. Đọc dữ liệu từ file PKL
-    print(f"2. Đang đọc file {PKL_FILE}...")
-    with open(PKL_FILE, 'rb') as f:
-        data = pickle.load(f)
-    print(f"-> Đã load {len(data)} dòng dữ liệu.")
+    if not args.dry_run:
+        try:
+            connections.connect("default", host="127.0.0.1", port="19530")
+        except Exception as e:
+            print(f"Lỗi kết nối: {e}")
+            print("Hãy chắc chắn bạn đã chạy 'docker compose start'!")
+            return
 
-    # 3. Chuẩn bị dữ liệu theo cột (Milvus yêu cầu Column-based)
-    # File pkl đang là list of dicts, cần chuyển thành list of lists
-    ids = [item['id'] for item in data]
-    video_ids = [str(item['video_id']) for item in data]
-    frame_ids = [int(item['frame_id']) for item in data]
-    paths = [str(item['path']) for item in data]
-    embeddings = [item['embedding'] for item in data]
+    # 2. Mở embedding store (chỉ đọc manifest, dữ liệu được đọc dần từng batch lúc insert)
+    print(f"2. Đang mở embedding store {args.store}...")
+    store = EmbeddingStore(args.store)
+    print(f"-> Store có {len(store)} dòng dữ liệu.")
 
     # Kiểm tra chiều dài vector xem có đúng 512 không
-    if len(embeddings) > 0 and len(embeddings[0]) != DIMENSION:
-        print(f"❌ LỖI DIMENSION! Config là {DIMENSION} nhưng dữ liệu là {len(embeddings[0])}")
+    if store.dim != DIMENSION:
+        print(f"❌ LỖI DIMENSION! Config là {DIMENSION} nhưng dữ liệu là {store.dim}")
         return
 
     # 4. Tạo Collection (Xóa cũ nếu có)
-    if utility.has_collection(COLLECTION_NAME):
-        print(f"Phát hiện collection cũ '{COLLECTION_NAME}', đang xóa...")
-        utility.drop_collection(COLLECTION_NAME)
+    if args.dry_run:
+        collection = InMemoryCollection()
+        print("3. Dry run: insert vào collection giả trong RAM")
+    else:
+        collection = create_collection(args.collection)
+        print(f"3. Đã tạo Collection mới: {args.collection}")
 
-    fields = [
-        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
-        FieldSchema(name="video_id", dtype=DataType.VARCHAR, max_length=50),
-        FieldSchema(name="frame_id", dtype=DataType.INT64),
-        FieldSchema(name="path", dtype=DataType.VARCHAR, max_length=500),
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=DIMENSION)
-    ]
-    schema = CollectionSchema(fields, description="Video Retrieval Collection")
-    collection = Collection(name=COLLECTION_NAME, schema=schema)
-    print(f"3. Đã tạo Collection mới: {COLLECTION_NAME}")
+    # 5. Insert dữ liệu: đọc store từng batch, tối đa --in-flight batch đang insert, batch lỗi được thử lại
+    print(f"4. Bắt đầu Insert (batch {args.batch_size}, {args.in_flight} in-flight)...")
+    with tqdm(total=len(store), unit="row") as pbar:
+        stats = ingest(collection, column_batches(store, args.batch_size), max_in_flight=args.in_flight,
+                       retries=args.retries, progress=pbar.update)
 
-    # 5. Insert dữ liệu (Chia nhỏ để insert cho an toàn)
-    print("4. Bắt đầu Insert...")
-    total = len(data)
-    
-    # Gom các cột lại thành 1 cục lớn
-    entities = [ids, video_ids, frame_ids, paths, embeddings]
-    
-    start_time = time.time()
-    collection.insert(entities)
-    end_time = time.time()
-    
-    print(f"-> Insert xong {total} dòng trong {end_time - start_time:.2f} giây.")
+    print(f"-> Insert xong {stats['rows']} dòng ({stats['batches']} batch) trong {stats['seconds']:.2f} giây "
+          f"({stats['rows_per_sec']:.0f} rows/sec).")
 
     # 6. Tạo Index (Bắt buộc để search nhanh)
     print("5. Đang tạo Index (IVF_FLAT)...")
@@ -86,5 +87,20 @@ def main():
     print("\n✅ HOÀN TẤT! Hệ thống đã sẵn sàng để search.")
     print(f"Số lượng entities trong Milvus: {collection.num_entities}")
 
+def create_collection(name):
+    if utility.has_collection(name):
+        print(f"Phát hiện collection cũ '{name}', đang xóa...")
+        utility.drop_collection(name)
+
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="video_id", dtype=DataType.VARCHAR, max_length=50),
+        FieldSchema(name="frame_id", dtype=DataType.INT64),
+        FieldSchema(name="path", dtype=DataType.VARCHAR, max_length=500),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=DIMENSION)
+    ]
+    schema = CollectionSchema(fields, description="Video Retrieval Collection")
+    return Collection(name=name, schema=schema)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -21,22 +21,19 @@ print(f"   - Model Key: {config['model_key']}")
 print(f"   - Pretrained: {config.get('pretrained', 'None')}")
 print(f"   - Bin Path: {config['bin_path']}")
 print(f"   - JSON Path: {config['json_path']}")
+print(f"   - Load Mode: {config.get('load_mode', 'memory')}")
 
 # Try to load
 print(f"\n3. Loading FaissService...")
 try:
-    service = FaissService(
-        bin_path=config["bin_path"],
-        json_path=config["json_path"],
-        model_type=config["type"],
-        model_name=config["model_key"],
+    service = FaissService.from_config(
+        config,
         device="cuda" if torch.cuda.is_available() else "cpu",
-        translator=translator,
-        pretrained=config.get("pretrained")
+        translator=translator
     )
     print("✅ SUCCESS! Model loaded successfully.")
-    print(f"   - Index size: {service.index.ntotal}")
-    print(f"   - ID map size: {len(service.id_map)}")
+    print(f"   - Index size: {service.backend.ntotal}")
+    print(f"   - Catalog size: {len(service.catalog)}")
     
     # Test search
     print("\n4. Testing text search...")
@@ -0,0 +1,64 @@
+"""
+Fixture dùng chung: catalog nhỏ 3 video x 10 frame, không cần data/ hay model.
+
+    L01_V001: frame ID 0-9, L01_V002: 10-19, L02_V001: 20-29 (số frame = 0, 25, 50, ...)
+"""
+import os
+import sys
+import json
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.frame_catalog import FrameCatalog
+from utils.video_index import VideoIndex
+
+VIDEOS = ["L01_V001", "L01_V002", "L02_V001"]
+FRAMES_PER_VIDEO = 10
+FRAME_STEP = 25
+
+
+def frame_paths():
+    return {
+        str(v * FRAMES_PER_VIDEO + i): f"data/clip_frame/{video}/keyframe_{i * FRAME_STEP:04d}.webp"
+        for v, video in enumerate(VIDEOS)
+        for i in range(FRAMES_PER_VIDEO)
+    }
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    json_path = tmp_path / "path_index_clip.json"
+    json_path.write_text(json.dumps(frame_paths()), encoding="utf-8")
+    return FrameCatalog.from_json(str(json_path))
+
+
+@pytest.fixture
+def video_index(catalog):
+    return VideoIndex(catalog)
+
+
+class FakeService:
+    """Thay FaissService cho MultiContextKIS: vector frame cố định, query -> vector theo dict"""
+
+    def __init__(self, catalog, video_index, vectors, queries):
+        self.catalog = catalog
+        self.video_index = video_index
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.queries = {text: np.asarray(v, dtype=np.float32) for text, v in queries.items()}
+
+    def encode_texts(self, texts):
+        return np.stack([self.queries[t] for t in texts])
+
+    def search_vectors(self, vectors, k):
+        scores = vectors @ self.vectors.T
+        ids = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(scores, ids, axis=1), ids
+
+    def video_scores(self, vectors):
+        return self.video_index.reduce_max(vectors @ self.vectors.T)
+
+    def can_score_videos(self):
+        return True
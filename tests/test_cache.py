@@ -0,0 +1,63 @@
+import sqlite3
+import time
+
+import numpy as np
+
+from utils.cache import LRUCache, SqliteStore
+from utils.embedding_cache import EmbeddingCache, normalize_query
+
+
+def test_lru_eviction_and_per_entry_ttl():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)  # "b" ít dùng nhất -> bị bỏ
+    assert "b" not in cache and cache.get("a") == 1
+
+    cache.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+
+
+def test_normalize_query():
+    assert normalize_query("  A   Cat ") == "a cat"
+    assert normalize_query("  Ha Noi  tower ", lowercase=False) == "Ha Noi tower"
+
+
+def test_case_folding_follows_the_model(tmp_path):
+    folded = EmbeddingCache("clip", lowercase=True)
+    folded.set("Ha Noi", np.ones(2))
+    assert folded.get("ha  noi") is not None
+
+    cased = EmbeddingCache("st", lowercase=False)
+    cased.set("Ha Noi", np.ones(2))
+    assert cased.get("Ha  Noi") is not None
+    assert cased.get("ha noi") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    EmbeddingCache("m", persist_path=path).set("a cat", np.arange(3, dtype=np.float32))
+
+    cache = EmbeddingCache("m", persist_path=path)
+    np.testing.assert_array_equal(cache.get("A cat"), [0, 1, 2])
+    assert cache.stats()["disk_hits"] == 1
+    assert EmbeddingCache("other model", persist_path=path).get("a cat") is None
+
+
+def test_sqlite_errors_degrade_to_cache_miss(tmp_path):
+    cache = EmbeddingCache("m", persist_path=str(tmp_path / "cache.sqlite"))
+    cache.store._conn.close()  # Mọi lệnh SQLite sau đó đều lỗi
+
+    cache.set("a cat", np.ones(2))  # Không raise, vẫn có trong RAM
+    assert cache.get("a cat") is not None
+    assert cache.get("a dog") is None
+
+
+def test_sqlite_store(tmp_path):
+    store = SqliteStore(str(tmp_path / "nested" / "kv.sqlite"), table="t")
+    store.set("ns", "k", b"v1")
+    store.set("ns", "k", b"v2")
+    assert store.get("ns", "k") == b"v2"
+    assert store.get("other", "k") is None
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from database.embedding_store import EmbeddingStore
+
+
+def batch(start, n, dim=4):
+    ids = np.arange(start, start + n)
+    vectors = np.random.default_rng(start).random((n, dim)).astype(np.float32)
+    metas = [{"video_id": "L01_V001", "frame_id": int(i)} for i in ids]
+    return ids, vectors, metas
+
+
+def test_round_trip_across_shards(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=4, dtype="float32", shard_size=8, model="ViT-B-32/test")
+    written = [batch(0, 5), batch(5, 7), batch(12, 3)]
+    for ids, vectors, metas in written:
+        store.append(ids, vectors, metas)
+    store.close()
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert len(reopened) == 15
+    assert [shard["count"] for shard in reopened.manifest["shards"]] == [8, 7]
+    np.testing.assert_array_equal(reopened.done_ids(), np.arange(15))
+
+    ids, vectors, metas = zip(*reopened.iter_batches(batch_size=4, with_meta=True))
+    np.testing.assert_array_equal(np.concatenate(ids), np.arange(15))
+    np.testing.assert_allclose(np.concatenate(vectors), np.concatenate([v for _, v, _ in written]))
+    assert [m["frame_id"] for chunk in metas for m in chunk] == list(range(15))
+
+
+def test_unflushed_rows_are_lost_but_shards_survive(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=4, shard_size=8)
+    store.append(*batch(0, 10))  # 1 shard 8 dòng + 2 dòng đang gom
+    # "Crash": không gọi close()
+    reopened = EmbeddingStore(str(tmp_path))
+    np.testing.assert_array_equal(reopened.done_ids(), np.arange(8))
+
+    reopened.append(*batch(8, 2))
+    reopened.flush()
+    assert len(EmbeddingStore(str(tmp_path))) == 10
+
+
+def test_rejects_mismatched_store(tmp_path):
+    EmbeddingStore(str(tmp_path), dim=4, model="a")
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), dim=8)
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), model="b")
+    with pytest.raises(FileNotFoundError):
+        EmbeddingStore(str(tmp_path / "missing"))
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path)).append([0], np.zeros((1, 3)))
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+faiss_service = pytest.importorskip("utils.faiss_service")
+
+from utils.embedding_cache import EmbeddingCache
+
+
+def service(embedding_cache):
+    """FaissService không load model: encode = vector ngẫu nhiên theo text, ghi lại text đã encode"""
+    svc = faiss_service.FaissService.__new__(faiss_service.FaissService)
+    svc._translate = lambda text: text
+    svc.embedding_cache = embedding_cache
+    svc.encoded = []
+
+    def encode(texts):
+        svc.encoded.append(list(texts))
+        return np.stack([np.random.default_rng(abs(hash(t)) % 2 ** 32).random(4) for t in texts]).astype(np.float32)
+
+    svc._encode_texts = encode
+    return svc
+
+
+def test_variants_of_one_key_are_encoded_once():
+    svc = service(EmbeddingCache("clip", lowercase=True))
+    vectors = svc.encode_texts(["A  cat", "a cat", "dog"])
+    assert svc.encoded == [["A  cat", "dog"]]  # Encode text gốc, mỗi key 1 lần
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+
+    svc.encode_texts(["A CAT"])
+    assert len(svc.encoded) == 1
+
+
+def test_case_sensitive_models_keep_case():
+    svc = service(EmbeddingCache("st", lowercase=False))
+    svc.encode_texts(["Apple", "apple"])
+    assert svc.encoded == [["Apple", "apple"]]
+
+
+def test_same_input_with_and_without_cache():
+    cached = service(EmbeddingCache("clip")).encode_texts(["Ha Noi"])
+    uncached = service(None).encode_texts(["Ha Noi"])
+    np.testing.assert_array_equal(cached, uncached)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from utils.ensemble import fuse_scores, EnsembleSearcher
+
+
+def test_rrf_rewards_agreement_and_ignores_padding():
+    scores, ids = fuse_scores(
+        [[0.9, 0.8, 0.1], [0.7, 0.6, -np.inf]],
+        [[1, 2, 3], [2, 1, -1]],
+        method="rrf", rrf_k=60, k=10,
+    )
+    assert sorted(ids.tolist()[:2]) == [1, 2]
+    assert ids.tolist()[2] == 3
+    np.testing.assert_allclose(scores[0], 1 / 61 + 1 / 62, rtol=1e-6)
+    assert -1 not in ids.tolist()
+
+
+def test_rrf_weights():
+    _, ids = fuse_scores([[1.0], [1.0]], [[1], [2]], method="rrf", weights=[1.0, 2.0])
+    assert ids.tolist() == [2, 1]
+
+
+def test_weighted_normalizes_each_model():
+    # Model 2 có thang điểm lớn hơn hẳn nhưng sau z-normalize không lấn át model 1
+    scores, ids = fuse_scores(
+        [[0.30, 0.20, 0.10], [90.0, 80.0, 70.0]],
+        [[1, 2, 3], [3, 2, 1]],
+        method="weighted", k=3,
+    )
+    np.testing.assert_allclose(scores, scores[0])  # Đối xứng -> 3 frame bằng điểm
+
+
+def test_unknown_method_and_empty():
+    with pytest.raises(ValueError):
+        fuse_scores([[1.0]], [[1]], method="max")
+    scores, ids = fuse_scores([[-np.inf]], [[-1]])
+    assert len(scores) == 0 and len(ids) == 0
+
+
+def test_select_models_drops_slow_models_and_probes():
+    searcher = EnsembleSearcher(max_latency_ms=100, probe_every=2)
+    searcher.latency_ms = {1: 50, 2: 500}
+    assert searcher.select_models([1, 2]) == ([1], [2])
+    assert searcher.select_models([1, 2]) == ([1, 2], [])  # Lượt probe
+
+    searcher.latency_ms = {1: 300, 2: 500}
+    searcher._skipped = {}
+    selected, _ = searcher.select_models([1, 2])
+    assert selected == [1]  # Luôn giữ model nhanh nhất
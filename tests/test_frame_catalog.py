@@ -0,0 +1,55 @@
+import numpy as np
+
+from utils.frame_catalog import parse_frame_path
+
+
+def test_parse_frame_path():
+    assert parse_frame_path("data/clip_frame/L01_V001/keyframe_0123.webp") == ("L01_V001", 123)
+    assert parse_frame_path("L02_V004\\0007.jpg") == ("L02_V004", 7)
+
+
+def test_lookup(catalog):
+    assert len(catalog) == 30
+    assert catalog.path(12) == "data/clip_frame/L01_V002/keyframe_0050.webp"
+    assert catalog.video(25) == "L02_V001"
+    assert catalog.frame(25) == 125
+    assert 29 in catalog and 30 not in catalog and -1 not in catalog
+    assert catalog.get(99) is None
+    np.testing.assert_array_equal(catalog.rows([0, -1, 29, 99]), [0, -1, 29, -1])
+
+
+def test_format_results_drops_invalid_ids(catalog):
+    results = catalog.format_results([0.9, 0.8, 0.7], [3, -1, 21])
+    assert [r["id"] for r in results] == [3, 21]
+    assert results[0]["imgpath"] == "/data/clip_frame/L01_V001/keyframe_0075.webp"
+    assert results[1]["score"] == np.float32(0.7)
+
+
+def test_save_load_round_trip(catalog, tmp_path):
+    path = tmp_path / "catalog.npz"
+    catalog.save(str(path))
+    with np.load(path) as data:
+        loaded = type(catalog)(data["ids"], data["video_codes"], data["frames"],
+                               data["path_offsets"], data["path_blob"].tobytes(), data["videos"])
+    assert list(loaded.items()) == list(catalog.items())
+
+
+def test_video_index_ranges_and_paging(video_index):
+    assert video_index.video_list == ["L01_V001", "L01_V002", "L02_V001"]
+    assert video_index.id_range("L01_V002") == (10, 19)
+    assert video_index.id_range("L09_V001") is None
+
+    codes = video_index.match_videos("L01")
+    np.testing.assert_array_equal(codes, [0, 1])
+    assert video_index.count_frames(codes) == 20
+    # Trang cắt ngang 2 video
+    np.testing.assert_array_equal(video_index.page_frames(codes, 8, 13), [8, 9, 10, 11, 12])
+    assert len(video_index.page_frames(codes, 20, 30)) == 0
+
+
+def test_reduce_max_pads_missing_frames(video_index):
+    # Index chỉ phủ 25/30 frame: video cuối chỉ có frame 20-24
+    scores = np.arange(25, dtype=np.float32)[None, :]
+    video_scores, grouped = video_index.reduce_max(scores)
+    np.testing.assert_array_equal(video_scores, [[9, 19, 24]])
+    assert np.isneginf(grouped[0, 25:]).all()
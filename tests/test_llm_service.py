@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from utils.llm_service import LlmService, StubLlmBackend
+
+
+class CountingBackend(StubLlmBackend):
+    def __init__(self, delay=0.0):
+        super().__init__(delay)
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        return super().generate_content(prompt)
+
+
+def stub_service(delay=0.0, timeout=None, **kwargs):
+    service = LlmService(backend="stub", timeout=timeout, **kwargs)
+    service.model = CountingBackend(delay)
+    return service
+
+
+def wait_idle(service, timeout=1.0):
+    """Kết quả trả về trước khi callback ghi cache chạy xong: chờ in-flight rỗng"""
+    deadline = time.monotonic() + timeout
+    while service._inflight and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_concurrent_requests_share_one_call_and_cache():
+    service = stub_service(delay=0.05, timeout=1.0)
+
+    async def main():
+        return await asyncio.gather(*[service.refine_async("xe  cứu thương") for _ in range(4)])
+
+    results = asyncio.run(main())
+    wait_idle(service)
+    assert results == [("A photo of xe  cứu thương", True)] * 4
+    assert service.model.calls == 1
+    # Key bỏ khoảng trắng thừa: dùng lại cache
+    assert service.refine_with_status("xe cứu thương") == ("A photo of xe  cứu thương", True)
+    assert service.model.calls == 1
+
+
+def test_timeout_returns_original_query_and_call_finishes_in_background():
+    service = stub_service(delay=0.2, timeout=0.01)
+    assert asyncio.run(service.refine_async("con mèo")) == ("con mèo", False)
+
+    time.sleep(0.2)
+    wait_idle(service)
+    assert service.refine_with_status("con mèo") == ("A photo of con mèo", True)
+    assert service.model.calls == 1
+    assert service._inflight == {}
+
+
+def test_cache_is_written_before_leaving_in_flight():
+    service = stub_service()
+    seen = []
+
+    class Inflight(dict):
+        def pop(self, key, default=None):
+            seen.append(service.cache.get(key))
+            return super().pop(key, default)
+
+    service._inflight = Inflight()
+    service.refine_with_status("con chó")
+    wait_idle(service)
+    assert seen == ["A photo of con chó"]
+
+
+def test_sqlite_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    service = stub_service(cache_path=path)
+    service.refine_with_status("con gà")
+    wait_idle(service)
+
+    restarted = stub_service(cache_path=path)
+    assert restarted.refine_with_status("con gà") == ("A photo of con gà", True)
+    assert restarted.model.calls == 0
+
+
+def test_concurrent_quota_errors_rotate_once():
+    service = stub_service()
+    service.api_keys = ["k1", "k2", "k3"]
+    service.current_key_index = 0
+    service._initialize_model = lambda: True
+
+    threads = [threading.Thread(target=service._rotate_key, args=(0,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert service.current_key_index == 1
@@ -0,0 +1,62 @@
+import ast
+
+import numpy as np
+import pytest
+
+from database.milvus_ingest import ingest, insert_with_retry, InMemoryCollection
+
+
+def batches(num_batches=6, size=10):
+    for b in range(num_batches):
+        ids = list(range(b * size, (b + 1) * size))
+        yield size, [ids, ["L01_V001"] * size, ids, ["p"] * size, np.ones((size, 4)).tolist()]
+
+
+@pytest.mark.parametrize("fail_after_write", [False, True])
+def test_retries_do_not_duplicate_rows(fail_after_write):
+    # 1 luồng: lỗi xen kẽ 1 lần ghi lỗi / 1 lần ghi được, mỗi batch lỗi tối đa 1 lần
+    collection = InMemoryCollection(fail_every=2, fail_after_write=fail_after_write)
+    stats = ingest(collection, batches(), max_in_flight=1, retries=3, backoff=0)
+
+    assert stats["rows"] == 60 and stats["batches"] == 6
+    assert collection.num_entities == 60
+    assert sorted(collection.ids) == list(range(60))
+
+
+def test_concurrent_batches_are_all_written():
+    collection = InMemoryCollection(latency=0.01)
+    stats = ingest(collection, batches(), max_in_flight=3, retries=0, backoff=0)
+    assert stats["batches"] == 6
+    assert sorted(collection.ids) == list(range(60))
+
+
+def test_retry_without_upsert_deletes_then_inserts():
+    class LegacyCollection:
+        """pymilvus cũ: có insert / delete, không có upsert"""
+
+        def __init__(self):
+            self.rows, self.calls = [], []
+
+        def insert(self, entities):
+            self.calls.append("insert")
+            self.rows.extend(entities[0])
+            if len(self.calls) == 1:
+                raise TimeoutError("timeout after write")
+
+        def delete(self, expr):
+            self.calls.append("delete")
+            drop = set(ast.literal_eval(expr.split(" in ")[1]))
+            self.rows = [row for row in self.rows if row not in drop]
+
+    collection = LegacyCollection()
+    _, entities = next(batches(1))
+    insert_with_retry(collection, entities, retries=2, backoff=0)
+    assert collection.calls == ["insert", "delete", "insert"]
+    assert collection.rows == list(range(10))
+
+
+def test_gives_up_after_retries():
+    collection = InMemoryCollection(fail_every=1)
+    with pytest.raises(ConnectionError):
+        ingest(collection, batches(1), retries=2, backoff=0)
+    assert collection.calls == 3
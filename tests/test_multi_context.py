@@ -0,0 +1,65 @@
+import numpy as np
+
+from utils.multi_context_kis import MultiContextKIS, default_ranking_score, MAX_EVIDENCE_FRAMES
+from conftest import FakeService
+
+
+def one_hot_service(catalog, video_index, hits):
+    """
+    Vector frame one-hot theo context: frame trong hits[c] khớp context c (điểm = giá trị cho trước),
+    mọi frame khác có điểm 0 với mọi context
+    """
+    n_contexts = len(hits)
+    vectors = np.zeros((len(catalog), n_contexts), dtype=np.float32)
+    for c, frames in enumerate(hits):
+        for frame_id, score in frames.items():
+            vectors[frame_id, c] = score
+    queries = {f"context {c}": np.eye(n_contexts)[c] for c in range(n_contexts)}
+    return FakeService(catalog, video_index, vectors, queries)
+
+
+def test_evidence_never_outweighs_contexts():
+    # 1 context + rất nhiều frame hit, điểm tối đa vs 2 contexts, điểm thấp, 1 frame
+    one = default_ranking_score(np.array([1]), np.array([1.0]), np.array([1.0]), np.array([5000]))
+    two = default_ranking_score(np.array([2]), np.array([-1.0]), np.array([-1.0]), np.array([1]))
+    assert two[0] > one[0]
+    capped = default_ranking_score(np.array([1]), np.array([0.0]), np.array([0.0]), np.array([10 ** 6]))
+    assert capped[0] == 1000 + MAX_EVIDENCE_FRAMES
+
+
+def test_multi_context_fusion_ranks_by_contexts_first(catalog, video_index):
+    # L01_V001 khớp cả 2 contexts (điểm thấp), L02_V001 chỉ khớp context 0 nhưng nhiều frame điểm cao
+    hits = [
+        {2: 0.3, **{i: 0.9 for i in range(20, 30)}},
+        {5: 0.3},
+    ]
+    kis = MultiContextKIS(one_hot_service(catalog, video_index, hits))
+    scores, ids = kis.search_arrays(["context 0", "context 1"], k=11)
+
+    results = kis.multi_context_fusion(scores, ids, k=10, min_contexts=1)
+    videos = list(dict.fromkeys(r["video_id"] for r in results))
+    assert videos[0] == "L01_V001"
+    assert results[0]["contexts_matched"] == 2
+    assert "L02_V001" in videos
+
+    # min_contexts=2: chỉ còn video khớp đủ
+    results = kis.multi_context_fusion(scores, ids, k=10, min_contexts=2)
+    assert {r["video_id"] for r in results} == {"L01_V001"}
+
+
+def test_custom_scorer_is_used_by_both_fusions(catalog, video_index):
+    hits = [{2: 0.9, 12: 0.5}, {5: 0.9, 15: 0.5}]
+    calls = []
+
+    def prefer_low_scores(num_contexts, avg_score, max_score, num_frames):
+        calls.append(len(num_contexts))
+        return -max_score
+
+    kis = MultiContextKIS(one_hot_service(catalog, video_index, hits), scorer=prefer_low_scores)
+    scores, ids = kis.search_arrays(["context 0", "context 1"], k=2)
+    frame_level = kis.multi_context_fusion(scores, ids, k=2, min_contexts=2)
+    video_level = kis.video_level_fusion(["context 0", "context 1"], k=2, min_contexts=2, match_top=3)
+
+    assert len(calls) == 2
+    assert frame_level[0]["video_id"] == "L01_V002"
+    assert video_level[0]["video_id"] == "L02_V001"  # max_score 0 thấp nhất
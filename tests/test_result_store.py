@@ -0,0 +1,100 @@
+import asyncio
+
+from utils.result_store import ResultStore, ShortLived, result_set_id
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_result_set_id_is_stable():
+    assert result_set_id("clip", {"query": "a", "faiss": 7}) == result_set_id("clip", {"faiss": 7, "query": "a"})
+    assert result_set_id("clip", {"query": "a"}) != result_set_id("clip", {"query": "b"})
+
+
+def test_cursor_paging():
+    store = ResultStore()
+
+    async def search():
+        return list(range(250))
+
+    result_set, _ = run(store.get_or_search("clip", {"query": "a"}, search))
+    first = store.page(result_set, cursor=0, limit=100)
+    last = store.page(result_set, cursor=200, limit=100)
+    assert first["items"] == list(range(100)) and first["next_cursor"] == 100
+    assert last["items"] == list(range(200, 250)) and last["next_cursor"] is None and last["total"] == 250
+    assert store.page("expired", 0, 100) is None
+    assert store.page("fresh", 0, 2, results=[1, 2, 3])["items"] == [1, 2]
+
+
+def test_concurrent_requests_search_once():
+    store = ResultStore()
+    calls = []
+
+    async def search():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["hit"]
+
+    async def main():
+        return await asyncio.gather(*[store.get_or_search("clip", {"query": "a"}, search) for _ in range(5)])
+
+    results = run(main())
+    assert len(calls) == 1
+    assert all(r == results[0] for r in results)
+
+
+def test_waiters_search_themselves_when_leader_is_cancelled():
+    store = ResultStore()
+    calls = []
+
+    async def slow_search():
+        calls.append("leader")
+        await asyncio.sleep(10)
+
+    async def search():
+        calls.append("waiter")
+        return ["hit"]
+
+    async def main():
+        leader = asyncio.ensure_future(store.get_or_search("clip", {"query": "a"}, slow_search))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(store.get_or_search("clip", {"query": "a"}, search))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.wait_for(waiter, 1)
+
+    _, results = run(main())
+    assert results == ["hit"]
+    assert calls == ["leader", "waiter"]
+
+
+def test_waiters_time_out():
+    store = ResultStore(wait_timeout=0.01)
+
+    async def slow_search():
+        await asyncio.sleep(0.5)
+        return ["slow"]
+
+    async def search():
+        return ["fast"]
+
+    async def main():
+        leader = asyncio.ensure_future(store.get_or_search("clip", {"query": "a"}, slow_search))
+        await asyncio.sleep(0)
+        _, results = await store.get_or_search("clip", {"query": "a"}, search)
+        leader.cancel()
+        return results
+
+    assert run(main()) == ["fast"]
+
+
+def test_short_lived_results_use_fallback_ttl():
+    store = ResultStore(ttl=600, fallback_ttl=0)
+
+    async def fallback():
+        return ShortLived(["original query"])
+
+    result_set, results = run(store.get_or_search("clip", {"query": "a"}, fallback))
+    assert results == ["original query"]
+    assert store.get(result_set) is None  # fallback_ttl=0: không cache
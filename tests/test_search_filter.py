@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from utils.search_filter import (parse_filters, select_videos, frame_id_ranges, range_rows, search_ranges,
+                                 publish_dates)
+
+
+def test_parse_filters():
+    assert parse_filters() is None
+    assert parse_filters(video="L01_V001, L01_V002", group="L02", date_from="31/10/2023") == {
+        "video_ids": ["L01_V001", "L01_V002"], "groups": ["L02"], "date_from": "2023-10-31"
+    }
+    with pytest.raises(ValueError):
+        parse_filters(date_to="2023-13-45")
+
+
+def test_select_videos_by_group_and_date(video_index, tmp_path):
+    (tmp_path / "L01_V001.json").write_text('{"publish_date": "01/10/2023"}', encoding="utf-8")
+    (tmp_path / "L01_V002.json").write_text('{"publish_date": "20/10/2023"}', encoding="utf-8")
+
+    assert select_videos(video_index, {"groups": ["L01"]}).tolist() == [0, 1]
+    assert select_videos(video_index, {"video_ids": ["L02_V001"]}).tolist() == [2]
+    # Video không có metadata bị loại khi lọc theo ngày
+    codes = select_videos(video_index, {"date_from": "2023-10-15"}, metadata_dir=str(tmp_path))
+    assert codes.tolist() == [1]
+    assert publish_dates(video_index, str(tmp_path))[2] == -1
+
+
+def test_frame_id_ranges(video_index):
+    ranges = frame_id_ranges(video_index, np.array([0, 2]))
+    assert ranges.tolist() == [[0, 9], [20, 29]]
+    # Số frame trong video 50-100 -> frame thứ 2-4 của mỗi video
+    ranges = frame_id_ranges(video_index, np.array([0, 1]), frame_range=(50, 100))
+    assert ranges.tolist() == [[2, 4], [12, 14]]
+    assert frame_id_ranges(video_index, np.array([], dtype=np.int64)).shape == (0, 2)
+
+
+def test_search_ranges_matches_brute_force():
+    rng = np.random.default_rng(0)
+    xb = rng.standard_normal((500, 16)).astype(np.float32)
+    queries = rng.standard_normal((3, 16)).astype(np.float32)
+    ranges = np.array([[10, 40], [100, 101], [300, 499]])
+
+    scores, ids = search_ranges(xb.astype(np.float16), queries, 5, ranges, chunk_size=64)
+
+    rows = range_rows(ranges)
+    exact = queries @ xb[rows].astype(np.float16).astype(np.float32).T
+    expected = rows[np.argsort(-exact, axis=1)[:, :5]]
+    np.testing.assert_array_equal(ids, expected)
+    assert np.isin(ids, rows).all()
+
+
+def test_search_ranges_pads_small_subsets():
+    xb = np.eye(4, dtype=np.float32)
+    scores, ids = search_ranges(xb, xb[:1], 3, np.array([[0, 1]]))
+    assert ids.tolist() == [[0, 1, -1]]
+    assert np.isneginf(scores[0, 2])
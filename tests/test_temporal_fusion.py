@@ -0,0 +1,47 @@
+import numpy as np
+
+from utils.temporal_fusion import best_ordered_chains, SparseTableMax
+
+
+def candidates(rows):
+    """rows: [(video, frame, score, id), ...] -> dict mảng"""
+    video, frame, score, ids = zip(*rows)
+    return {"video": np.array(video), "frame": np.array(frame), "score": np.array(score, dtype=np.float64),
+            "id": np.array(ids)}
+
+
+def test_sparse_table_matches_brute_force():
+    values = np.random.default_rng(0).random(37)
+    table = SparseTableMax(values)
+    lo = np.array([0, 3, 10, 36, 5])
+    hi = np.array([36, 3, 20, 36, 30])
+    maxes, positions = table.query(lo, hi)
+    for l, h, m, p in zip(lo, hi, maxes, positions):
+        assert m == values[l:h + 1].max()
+        assert values[p] == m and l <= p <= h
+
+
+def test_chain_respects_order_and_window():
+    first = candidates([(0, 100, 0.9, 1), (0, 500, 0.5, 2), (1, 10, 0.8, 3)])
+    second = candidates([
+        (0, 50, 1.0, 4),    # Trước frame 100 -> không nối được với (0, 100)
+        (0, 150, 0.6, 5),   # Sau (0, 100) 50 frame
+        (0, 900, 0.9, 6),   # Sau (0, 500) 400 frame > window
+        (1, 30, 0.7, 7),
+    ])
+    videos, scores, chain_ids, frame_scores = best_ordered_chains([first, second], window=100)
+
+    assert videos.tolist() == [0, 1]
+    np.testing.assert_allclose(scores, [1.5, 1.5])
+    assert chain_ids.tolist() == [[1, 5], [3, 7]]
+    np.testing.assert_allclose(frame_scores[0], [0.9, 0.6])
+
+
+def test_per_video_window_and_no_chain():
+    first = candidates([(0, 0, 1.0, 1), (1, 0, 1.0, 2)])
+    second = candidates([(0, 200, 1.0, 3), (1, 200, 1.0, 4)])
+    videos, _, _, _ = best_ordered_chains([first, second], window=np.array([100, 300]))
+    assert videos.tolist() == [1]
+
+    videos, scores, chain_ids, _ = best_ordered_chains([first, second], window=10)
+    assert len(videos) == 0 and chain_ids.shape == (0, 2)
@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("deep_translator")
+pytest.importorskip("transformers")
+
+from utils.query_processing import Translation
+
+
+class Offline:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return f"offline {text}"
+
+
+def offline_translation(monkeypatch, **kwargs):
+    translation = Translation(mode="google", offline_backend=Offline(), **kwargs)
+    online_calls = []
+
+    def fail(text):
+        online_calls.append(text)
+        raise ConnectionError("network down")
+
+    monkeypatch.setattr(translation, "translate_online", fail)
+    return translation, online_calls
+
+
+def test_online_failure_opens_circuit(monkeypatch):
+    translation, online_calls = offline_translation(monkeypatch, offline_cooldown=60)
+    assert translation("xin chào") == "offline xin chào"
+    assert translation("tạm biệt") == "offline tạm biệt"
+    assert online_calls == ["xin chào"]  # Lần 2 không thử online nữa
+
+
+def test_online_is_retried_after_cooldown(monkeypatch):
+    translation, online_calls = offline_translation(monkeypatch, offline_cooldown=0)
+    translation("a")
+    translation("b")
+    assert online_calls == ["a", "b"]
+
+
+def test_cache_write_errors_keep_the_translation(monkeypatch, tmp_path):
+    translation = Translation(mode="google", cache_path=str(tmp_path / "t.sqlite"))
+    monkeypatch.setattr(translation, "translate_online", lambda text: f"en {text}")
+    translation.store._conn.close()
+    assert translation("Xin chào") == "en xin chào"
+
+
+def test_missing_offline_model_disables_backend(tmp_path):
+    translation = Translation(mode="google", offline_backend="marian", offline_model=str(tmp_path / "missing"))
+    assert translation.offline_backend is None
@@ -0,0 +1,62 @@
+import faiss
+import numpy as np
+
+from utils.index_tools import drop_self
+from utils.vector_backend import FaissBackend, milvus_expr
+
+
+def write_index(path, index):
+    faiss.write_index(index, str(path))
+    return str(path)
+
+
+def vectors(n=2000, d=16):
+    xb = np.random.default_rng(0).standard_normal((n, d)).astype(np.float32)
+    return xb / np.linalg.norm(xb, axis=1, keepdims=True)
+
+
+def test_flat_backend_filtered_search_is_exact(tmp_path):
+    xb = vectors()
+    index = faiss.IndexFlatIP(xb.shape[1])
+    index.add(xb)
+    backend = FaissBackend(write_index(tmp_path / "flat.bin", index), load_mode="mmap")
+
+    ranges = np.array([[100, 199], [1500, 1510]])
+    scores, ids = backend.search(xb[:2], 5, {"id_ranges": ranges})
+    rows = np.r_[100:200, 1500:1511]
+    expected = rows[np.argsort(-(xb[:2] @ xb[rows].T), axis=1)[:, :5]]
+    np.testing.assert_array_equal(ids, expected)
+
+
+def test_ivf_backend_filters_on_cpu_index(tmp_path):
+    xb = vectors()
+    index = faiss.IndexIVFFlat(faiss.IndexFlatIP(16), 16, 8, faiss.METRIC_INNER_PRODUCT)
+    index.train(xb)
+    index.add(xb)
+    backend = FaissBackend(write_index(tmp_path / "ivf.bin", index), search_params={"nprobe": 8})
+    assert backend.vectors is None
+
+    class GpuIndex:
+        """Index GPU không nhận IDSelector"""
+        ntotal = backend.ntotal
+
+        def search(self, x, k, params=None):
+            raise RuntimeError("IDSelector not supported on GPU")
+
+    backend.index = GpuIndex()
+    _, ids = backend.search(xb[:3], 5, {"id_ranges": np.array([[300, 399]])})
+    assert ((ids >= 300) & (ids <= 399)).all()
+
+
+def test_drop_self():
+    scores = np.array([[1.0, 0.9, 0.8], [0.7, 0.6, 0.5]])
+    ids = np.array([[4, 7, 9], [3, 5, 8]])
+    s, i = drop_self(scores, ids, [4, 5], 2)
+    assert i.tolist() == [[7, 9], [3, 8]]
+    np.testing.assert_allclose(s, [[0.9, 0.8], [0.7, 0.5]])
+
+
+def test_milvus_expr():
+    assert milvus_expr(None) is None
+    assert milvus_expr({"video_ids": ["L01_V001"], "frame_range": (10, 20)}) == \
+        'video_id in ["L01_V001"] && frame_id >= 10 && frame_id <= 20'
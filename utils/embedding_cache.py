@@ -0,0 +1,82 @@
+"""
+EmbeddingCache: cache vector query theo (model, text đã chuẩn hóa).
+
+Text được lấy SAU khi dịch / LLM refine, nên các query lặp lại hoặc chỉ khác
+khoảng trắng không phải encode lại. Hoa-thường chỉ được gộp khi tokenizer của model tự lowercase
+(CLIP BPE), với model phân biệt hoa-thường (HF tokenizer, sentence-transformers) thì là 2 key khác nhau.
+Key chỉ dùng để tra cache, model luôn encode đúng text gốc.
+Lỗi SQLite (file bị khóa / hỏng) chỉ làm tầng đĩa thành miss, không làm hỏng search.
+Tầng RAM là LRUCache (+ TTL tùy chọn), tầng đĩa SQLite tùy chọn để giữ qua restart.
+"""
+
+import logging
+
+import numpy as np
+
+from utils.cache import LRUCache, SqliteStore
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text, lowercase=True):
+    """Chuẩn hóa text làm key cache: bỏ khoảng trắng thừa (+ lowercase nếu model không phân biệt hoa-thường)"""
+    text = " ".join(text.split())
+    return text.lower() if lowercase else text
+
+
+class EmbeddingCache:
+    def __init__(self, namespace, maxsize=4096, ttl=None, persist_path=None, lowercase=True):
+        """
+        Args:
+            namespace: Định danh model (vd: "open_clip:ViT-L-14-336:openai")
+            maxsize, ttl: Cấu hình tầng RAM (xem LRUCache)
+            persist_path: File SQLite để lưu vector xuống đĩa, None = chỉ cache trong RAM
+            lowercase: Gộp key khác hoa-thường (chỉ đúng khi tokenizer của model tự lowercase)
+        """
+        self.namespace = namespace
+        self.lowercase = lowercase
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.store = SqliteStore(persist_path, table="embeddings") if persist_path else None
+        self.disk_hits = 0
+
+    def key(self, text):
+        return normalize_query(text, self.lowercase)
+
+    def get(self, text):
+        key = self.key(text)
+        vector = self.memory.get(key)
+        if vector is not None or self.store is None:
+            return vector
+
+        try:
+            blob = self.store.get(self.namespace, key)
+        except Exception as e:
+            logger.warning(f"Không đọc được embedding cache trên đĩa: {e}")
+            return None
+        if blob is None:
+            return None
+
+        vector = np.frombuffer(blob, dtype=np.float32)
+        self.memory.set(key, vector)
+        self.disk_hits += 1
+        return vector
+
+    def set(self, text, vector):
+        key = self.key(text)
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        self.memory.set(key, vector)
+        if self.store is not None:
+            try:
+                self.store.set(self.namespace, key, vector.tobytes())
+            except Exception as e:
+                logger.warning(f"Không ghi được embedding cache xuống đĩa: {e}")
+
+    def stats(self):
+        stats = self.memory.stats()
+        # Hit từ đĩa được tính là miss ở tầng RAM, chuyển sang hit cho đúng tổng thể
+        stats["disk_hits"] = self.disk_hits
+        stats["misses"] -= self.disk_hits
+        stats["hits"] += self.disk_hits
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
@@ -0,0 +1,179 @@
+"""
+Ensemble search: chạy cùng 1 query trên nhiều model CLIP song song rồi gộp kết quả.
+
+- Encode + FAISS search của từng model là 1 việc trên stage "inference" dùng chung với mọi search khác,
+  nên ensemble không vượt giới hạn CPU/GPU của stage đó (model chạy song song tối đa = số worker "inference")
+- Gộp trên hợp các frame ID của mọi model bằng NumPy (np.unique + bincount):
+    "rrf": Reciprocal Rank Fusion, sum w / (rrf_k + rank)
+    "weighted": tổng có trọng số của điểm đã z-normalize theo từng model
+- Latency từng model được theo dõi bằng EWMA; model chậm hơn max_latency_ms bị bỏ khỏi
+  ensemble, cứ probe_every request thì thử lại 1 lần để cập nhật latency
+"""
+
+import time
+import asyncio
+import logging
+import threading
+
+import numpy as np
+
+from utils.executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
+FUSION_METHODS = ("rrf", "weighted")
+
+
+def fuse_scores(all_scores, all_ids, method="rrf", weights=None, rrf_k=60, k=100):
+    """
+    Args:
+        all_scores, all_ids: List theo model, mỗi phần tử là 1 hàng kết quả FAISS (scores [n], ids [n])
+        method: "rrf" | "weighted"
+        weights: Trọng số từng model (None = bằng nhau)
+    Returns:
+        (scores [<=k], ids [<=k]) sort theo điểm gộp giảm dần
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of {FUSION_METHODS}")
+    weights = np.ones(len(all_ids)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    contributions, ids = [], []
+    for weight, scores, model_ids in zip(weights, all_scores, all_ids):
+        scores = np.asarray(scores, dtype=np.float64)
+        model_ids = np.asarray(model_ids, dtype=np.int64)
+        valid = model_ids >= 0
+        scores, model_ids = scores[valid], model_ids[valid]
+        if len(model_ids) == 0:
+            continue
+
+        if method == "rrf":
+            # Kết quả FAISS đã sort theo điểm giảm dần -> rank = vị trí
+            contribution = weight / (rrf_k + np.arange(1, len(model_ids) + 1))
+        else:
+            # Z-normalize để điểm các model cùng thang, dịch về >= 0 để frame model không trả về = điểm thấp nhất
+            std = scores.std()
+            z = (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+            contribution = weight * (z - z.min())
+
+        contributions.append(contribution)
+        ids.append(model_ids)
+
+    if not ids:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    union, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+    fused = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(union))
+
+    top_k = min(k, len(union))
+    top = np.argpartition(-fused, top_k - 1)[:top_k]
+    top = top[np.argsort(-fused[top], kind="stable")]
+    return fused[top].astype(np.float32), union[top]
+
+
+class EnsembleSearcher:
+    def __init__(self, method="rrf", rrf_k=60, weights=None, per_model_k=400, max_latency_ms=None,
+                 latency_alpha=0.2, probe_every=20, stage="inference"):
+        """
+        Args:
+            method: Cách gộp mặc định ("rrf" | "weighted")
+            weights: {model_id: trọng số}, model không có trong dict nhận 1.0
+            per_model_k: Số candidate lấy từ mỗi model
+            max_latency_ms: Model có EWMA latency lớn hơn sẽ bị bỏ (None = không bỏ model nào)
+            latency_alpha: Hệ số EWMA (lớn = phản ứng nhanh với thay đổi gần đây)
+            probe_every: Model đang bị bỏ được chạy thử lại sau mỗi probe_every request
+            stage: Executor chạy search từng model (xem utils/executors.py)
+        """
+        self.method = method
+        self.rrf_k = rrf_k
+        self.weights = weights or {}
+        self.per_model_k = per_model_k
+        self.max_latency_ms = max_latency_ms
+        self.latency_alpha = latency_alpha
+        self.probe_every = probe_every
+        self.stage = stage
+
+        self.latency_ms = {}  # model_id -> EWMA latency
+        self._skipped = {}    # model_id -> số request liên tiếp đã bị bỏ
+        self._lock = threading.Lock()
+
+    def _record_latency(self, model_id, elapsed_ms):
+        with self._lock:
+            previous = self.latency_ms.get(model_id)
+            self.latency_ms[model_id] = elapsed_ms if previous is None else (
+                self.latency_alpha * elapsed_ms + (1 - self.latency_alpha) * previous
+            )
+
+    def _timed_search(self, model_id, service, text):
+        start = time.perf_counter()
+        try:
+            vectors = service.encode_texts([text])
+            if vectors is None:
+                return None
+            scores, ids = service.search_vectors(vectors, self.per_model_k)
+            return scores[0], ids[0]
+        finally:
+            self._record_latency(model_id, (time.perf_counter() - start) * 1000)
+
+    def select_models(self, model_ids):
+        """Bỏ các model chậm (EWMA > max_latency_ms), luôn giữ lại ít nhất 1 model"""
+        if self.max_latency_ms is None:
+            return list(model_ids), []
+
+        selected, dropped = [], []
+        with self._lock:
+            for model_id in model_ids:
+                latency = self.latency_ms.get(model_id)
+                if latency is None or latency <= self.max_latency_ms:
+                    selected.append(model_id)
+                    continue
+                skipped = self._skipped.get(model_id, 0) + 1
+                if skipped >= self.probe_every:
+                    # Thử lại để latency có cơ hội giảm khi hết tải
+                    self._skipped[model_id] = 0
+                    selected.append(model_id)
+                else:
+                    self._skipped[model_id] = skipped
+                    dropped.append(model_id)
+
+            if not selected and dropped:
+                fastest = min(dropped, key=lambda m: self.latency_ms[m])
+                dropped.remove(fastest)
+                selected.append(fastest)
+        return selected, dropped
+
+    async def search(self, services, text, k=100, method=None):
+        """
+        Args:
+            services: {model_id: FaissService}
+        Returns:
+            (scores, ids, info) - info: {"models", "dropped", "failed", "latency_ms"}
+        """
+        selected, dropped = self.select_models(services)
+        tasks = {
+            model_id: asyncio.ensure_future(run_blocking(self.stage, self._timed_search, model_id, services[model_id], text))
+            for model_id in selected
+        }
+        await asyncio.wait(tasks.values())
+
+        used, failed, all_scores, all_ids = [], [], [], []
+        for model_id, task in tasks.items():
+            if task.exception() is not None or task.result() is None:
+                logger.error(f"Ensemble: model {model_id} lỗi: {task.exception()}")
+                failed.append(model_id)
+                continue
+            scores, ids = task.result()
+            used.append(model_id)
+            all_scores.append(scores)
+            all_ids.append(ids)
+
+        weights = [self.weights.get(model_id, 1.0) for model_id in used]
+        fused_scores, fused_ids = fuse_scores(
+            all_scores, all_ids, method=method or self.method, weights=weights, rrf_k=self.rrf_k, k=k
+        )
+        info = {
+            "models": used,
+            "dropped": dropped,
+            "failed": failed,
+            "latency_ms": {model_id: round(self.latency_ms[model_id], 1) for model_id in services if model_id in self.latency_ms}
+        }
+        return fused_scores, fused_ids, info
@@ -166,10 +166,11 @@
 
 
 import logging
-import json
 import os
 from elasticsearch import Elasticsearch
 
+from utils.frame_catalog import get_catalog
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -196,14 +197,11 @@ class EsService:
             logger.error(f"Lỗi kết nối ES: {e}")
             self.es = None
 
-        # 2. Load Mapping JSON (Để map ID -> Image Path)
-        self.id_map = {}
+        # 2. Load Frame Catalog (Để map ID -> Image Path, dùng chung với FaissService)
+        self.catalog = None
         if json_path and os.path.exists(json_path):
-            logger.info(f"Loading Map for ES: {json_path}")
             try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    # Chuyển key thành int để map cho chính xác
-                    self.id_map = {int(k): v for k, v in json.load(f).items()}
+                self.catalog = get_catalog(json_path)
             except Exception as e:
                 logger.error(f"Lỗi đọc file map: {e}")
         else:
@@ -219,7 +217,7 @@ class EsService:
             try:
                 # Xử lý trường hợp ID trả về dạng string
                 idx_int = int(idx) 
-                path = self.id_map.get(idx_int, "")
+                path = self.catalog.get(idx_int, "") if self.catalog else ""
                 
                 results.append({
                     "id": idx_int,
@@ -0,0 +1,53 @@
+"""
+Thread pool riêng cho từng stage blocking, để các endpoint async không chặn event loop.
+
+Stage (cấu hình trong EXECUTOR_CONFIGS):
+- "inference": CLIP forward + FAISS search (torch/FAISS nhả GIL khi tính toán)
+- "llm": gọi Gemini refine query
+- "io": Elasticsearch, DRES submit, load model...
+- "decode": decode ảnh upload (PIL)
+
+Mỗi stage có số worker giới hạn riêng, 1 LLM call chậm chỉ chiếm 1 slot "llm"
+chứ không làm đứng các request search khác.
+"""
+
+import asyncio
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+
+
+def init_executors(configs):
+    """
+    Args:
+        configs: {stage: {"max_workers": int}}
+    """
+    for stage, config in configs.items():
+        if stage not in _executors:
+            _executors[stage] = ThreadPoolExecutor(
+                max_workers=config["max_workers"],
+                thread_name_prefix=f"{stage}-worker"
+            )
+            logger.info(f"Executor '{stage}': {config['max_workers']} workers")
+
+
+def get_executor(stage):
+    if stage not in _executors:
+        raise KeyError(f"Executor stage '{stage}' chưa được khởi tạo (init_executors)")
+    return _executors[stage]
+
+
+async def run_blocking(stage, fn, *args, **kwargs):
+    """Chạy hàm blocking trên thread pool của `stage` và await kết quả"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(stage), partial(fn, *args, **kwargs))
+
+
+def shutdown_executors(wait=True):
+    for stage, executor in list(_executors.items()):
+        executor.shutdown(wait=wait, cancel_futures=True)
+        del _executors[stage]
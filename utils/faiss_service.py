@@ -1,6 +1,7 @@
+import io
 import os
 import json
-import faiss
+import hashlib
 import torch
 import numpy as np
 import logging
@@ -9,49 +10,90 @@ from PIL import Image
 import open_clip
 import clip # OpenAI CLIP
 from sentence_transformers import SentenceTransformer
-from langdetect import detect
-    
+
+from utils.frame_catalog import get_catalog
+from utils.video_index import get_video_index
+from utils.embedding_cache import EmbeddingCache
+from utils.cache import LRUCache
+from utils.vector_backend import FaissBackend, create_backend
+from utils.search_filter import select_videos
+from utils.query_processing import detect_language
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def image_digest(image_data):
+    """Key cache cho ảnh upload: hash nội dung file (cùng ảnh upload lại -> cùng key)"""
+    return hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+
+def decode_image(image_data):
+    """Bytes ảnh upload -> PIL RGB (chạy trên executor "decode", không chặn event loop)"""
+    return Image.open(io.BytesIO(image_data)).convert('RGB')
+
+
 class FaissService:
-    def __init__(self, bin_path, json_path, model_type="open_clip", model_name="ViT-B-32", device="cpu", translator=None, pretrained=None):
+    def __init__(self, bin_path, json_path, model_type="open_clip", model_name="ViT-B-32", device="cpu", translator=None, pretrained=None,
+                 load_mode="memory", npy_path=None, embedding_cache=None, video_pool_path=None,
+                 index_variant=None, search_params=None, rerank=None, image_cache_size=256, backend=None):
         """
+        Encode query (CLIP) + format kết quả, lưu trữ / search vector giao cho VectorBackend (utils/vector_backend.py).
+
         Args:
             model_type: "open_clip", "openai", "sentence_transformer"
             model_name: Tên model cụ thể (vd: "ViT-B/32")
             pretrained: Pretrained weights cho open_clip (vd: "openai", "laion2b_s34b_b79k")
+            load_mode: "memory" | "mmap" | "npy" (xem utils/index_loader.py)
+            npy_path: Ma trận vector .npy, dùng khi load_mode="npy"
+            embedding_cache: Dict cấu hình EmbeddingCache (maxsize, ttl, persist_path), None = tắt cache
+            video_pool_path: Embedding max-pool theo video .npy (scripts/build_video_pool.py), dùng khi
+                index không lưu vector thô
+            index_variant: Biến thể index xấp xỉ build từ bin_path ("ivf_flat", "ivf_pq", "hnsw"...),
+                None = index flat gốc (xem utils/index_tools.py)
+            search_params: Tham số search của biến thể (vd {"nprobe": 32}, {"efSearch": 128})
+            rerank: Search 2 giai đoạn {"factor": r, "npy_path": ...}: lấy k x r candidate từ index
+                (xấp xỉ / lượng tử hóa) rồi chấm lại chính xác trên vector .npy float32 memory-mapped,
+                npy_path mặc định dùng npy_path của model. None = tắt
+            image_cache_size: Số vector ảnh upload được cache (key = hash nội dung ảnh)
+            backend: VectorBackend dựng sẵn (vd MilvusBackend), None = FaissBackend từ bin_path
+                và các tham số index ở trên
         """
         self.device = device
         self.translator = translator
         self.model_type = model_type
         self.model_name = model_name
         self.pretrained = pretrained
+
+        # Cache vector query theo (model, text đã dịch/refine)
+        self.embedding_cache = None
+        if embedding_cache is not None:
+            self.embedding_cache = EmbeddingCache(namespace=f"{model_type}:{model_name}:{pretrained}", **embedding_cache)
         
-        # 1.LOAD INDEX FAISS 
-        if not os.path.exists(bin_path):
-            raise FileNotFoundError(f"Index not found: {bin_path}")
-        
-        logger.info(f"Loading Index: {bin_path}")
-        self.index = faiss.read_index(bin_path)
-        # chuyển index sang GPU nếu có
-        if device == "cuda":
-            try: 
-                res = faiss.StandardGpuResources()
-                self.index = faiss.index_cpu_to_gpu(res, 0, self.index)
-                logger.info("Đã chuyển FAISS index sang GPU")
-            except Exception as e:
-                logger.warning(f"Không thể chuyển index sang GPU: {e}, dùng CPU.")
-
-        # 2. LOAD MAPPING JSON 
-        if not os.path.exists(json_path):
-            raise FileNotFoundError(f"JSON Map not found: {json_path}")
-            
-        logger.info(f"Loading Map: {json_path}")
-        with open(json_path, 'r') as f:
-            # Map ID (int) -> Path (str)
-            self.id_map = {int(k): v for k, v in json.load(f).items()}
+        # Cache vector ảnh upload theo hash nội dung
+        self.image_cache = LRUCache(maxsize=image_cache_size)
+
+        # Cache bộ lọc đã đổi sang dạng của backend (khoảng frame ID / danh sách video), trang sau không tính lại
+        self.filter_cache = LRUCache(maxsize=64)
+
+        # 1. VECTOR BACKEND (FAISS trong process hoặc Milvus)
+        if backend is None:
+            backend = FaissBackend(bin_path, load_mode=load_mode, npy_path=npy_path, index_variant=index_variant,
+                                   search_params=search_params, rerank=rerank, device=device)
+        self.backend = backend
+
+        # 2. LOAD FRAME CATALOG (ID -> Path, dùng chung giữa các service)
+        self.catalog = get_catalog(json_path)
+        self.video_index = get_video_index(self.catalog)
+
+        # Vector thô để chấm điểm mọi frame (None với backend không lưu vector trong process),
+        # embedding theo video nếu có
+        self.vectors = backend.vectors
+        self.video_pool = None
+        if video_pool_path and os.path.exists(video_pool_path):
+            logger.info(f"Loading Video Pool: {video_pool_path}")
+            self.video_pool = np.load(video_pool_path, mmap_mode='r')
 
         # 3. LOAD AI MODEL
         logger.info(f"Loading Model: {model_type} - {model_name}")
@@ -73,67 +115,218 @@ class FaissService:
             # Xử lý cho Sentence Transformers
             self.model = SentenceTransformer(model_name, device=device)
 
+        # Key cache chỉ gộp hoa-thường khi tokenizer tự lowercase (CLIP BPE), model khác phân biệt hoa-thường
+        if self.embedding_cache is not None:
+            self.embedding_cache.lowercase = self.lowercases_text()
+
+    @classmethod
+    def from_config(cls, config, device="cpu", translator=None, **kwargs):
+        """Khởi tạo service từ 1 entry trong MODEL_CONFIGS (kwargs: tham số dùng chung, vd embedding_cache)"""
+        return cls(
+            backend=create_backend(config, device=device),  # "backend": "faiss" | "milvus"
+            bin_path=config.get("bin_path"),
+            json_path=config["json_path"],
+            model_type=config["type"],
+            model_name=config["model_key"],
+            device=device,
+            translator=translator,
+            pretrained=config.get("pretrained"),  # Lấy pretrained từ config nếu có
+            video_pool_path=config.get("video_pool_path"),
+            **kwargs
+        )
+
     def _normalize(self, x):
         return x / np.linalg.norm(x, axis=1, keepdims=True)
 
-    def text_search(self, text: str, k: int = 100):
-        # 1. Dịch thuật (Nếu có translator truyền vào)
+    def _translate(self, text: str) -> str:
+        # Dịch thuật (Nếu có translator truyền vào)
         if self.translator:
-            if detect(text) == 'vi':
-                text = self.translator(text) 
-        # 2. Encode Text thành Vector (Tùy loại model)
-        vector = None
+            if detect_language(text) == 'vi':
+                text = self.translator(text)
+        return text
+
+    def encode_texts(self, texts):
+        """
+        Encode nhiều câu query, chỉ chạy model cho các text chưa có trong embedding cache.
+        Returns: np.ndarray float32 [len(texts), dim] đã chuẩn hóa, hoặc None nếu model không hỗ trợ.
+        """
+        texts = [self._translate(t) for t in texts]
+        if self.embedding_cache is None:
+            return self._encode_texts(texts)
+
+        vectors = [self.embedding_cache.get(t) for t in texts]
+        # Gộp theo key của cache ("a  cat" và "a cat" là 1 key): mỗi key chỉ encode 1 lần.
+        # Model luôn encode text gốc (như khi tắt cache), key chỉ dùng để tra cache
+        keys = [self.embedding_cache.key(t) for t in texts]
+        missing = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            encoded = self._encode_texts(list(missing.values()))
+            if encoded is None:
+                return None
+            fresh = dict(zip(missing, encoded))
+            for key, vector in fresh.items():
+                self.embedding_cache.set(key, vector)
+            vectors = [fresh[key] if v is None else v for key, v in zip(keys, vectors)]
+
+        return np.stack(vectors)
+
+    def lowercases_text(self):
+        """Tokenizer có tự lowercase không (CLIP BPE: có; HF tokenizer / sentence-transformers: không)"""
+        if self.model_type == "openai":
+            return True
+        if self.model_type == "open_clip":
+            return isinstance(getattr(self, 'tokenizer', None), open_clip.tokenizer.SimpleTokenizer)
+        return False
+
+    def _encode_texts(self, texts):
+        """1 lần forward encode_text cho cả batch (không qua cache)"""
+        vectors = None
         with torch.no_grad():
             if self.model_type == "open_clip":
-                tokens = self.tokenizer([text]).to(self.device)
-                feat = self.model.encode_text(tokens)
-                vector = feat.cpu().numpy()
-                
+                tokens = self.tokenizer(texts).to(self.device)
+                vectors = self.model.encode_text(tokens).cpu().numpy()
+
             elif self.model_type == "openai":
-                tokens = clip.tokenize([text]).to(self.device)
-                feat = self.model.encode_text(tokens)
-                vector = feat.cpu().numpy()
-                
+                tokens = clip.tokenize(texts).to(self.device)
+                vectors = self.model.encode_text(tokens).cpu().numpy()
+
             elif self.model_type == "sentence_transformer":
-                vector = self.model.encode([text]) # SentenceTransformer tự ra numpy
+                vectors = self.model.encode(texts) # SentenceTransformer tự ra numpy
 
-        # 3. Chuẩn hóa & Search FAISS
-        if vector is not None:
-            vector = vector.astype(np.float32)
-            vector = self._normalize(vector)
-            
-            scores, ids = self.index.search(vector, k)
-            
-            # 4. Map kết quả trả về List Dict đẹp
-            results = []
-            for score, idx in zip(scores[0], ids[0]):
-                idx = int(idx)
-                if idx in self.id_map:
-                    results.append({
-                        "id": idx,
-                        "score": float(score),
-                        "imgpath": f"/{self.id_map[idx]}"
-                    })
-            return results
-        return []
+        if vectors is None:
+            return None
+        return self._normalize(vectors.astype(np.float32))
+
+    def can_encode_images(self):
+        return self.model_type in ("open_clip", "openai") and hasattr(self, 'preprocess')
+
+    def encode_images(self, images):
+        """
+        1 lần forward encode_image cho cả batch ảnh PIL.
+        Returns: np.ndarray float32 [len(images), dim] đã chuẩn hóa, hoặc None nếu model không hỗ trợ.
+        """
+        if not self.can_encode_images():
+            return None
+        with torch.no_grad():
+            batch = torch.stack([self.preprocess(image) for image in images]).to(self.device)
+            vectors = self.model.encode_image(batch).cpu().numpy()
+        return self._normalize(vectors.astype(np.float32))
+
+    def has_cached_image(self, image_data):
+        return image_digest(image_data) in self.image_cache
+
+    def image_query(self, image_data, k: int = 100, image=None, filters=None):
+        """
+        Search bằng ảnh upload: vector lấy từ cache theo hash nội dung, chưa có thì encode.
+
+        Args:
+            image_data: Bytes file ảnh
+            image: Ảnh PIL đã decode sẵn (vd trên executor "decode"), None = decode tại đây
+            filters: Bộ lọc video (xem search_vectors)
+        Returns: List Dict {id, score, imgpath}, hoặc None nếu model không encode được ảnh
+        """
+        key = image_digest(image_data)
+        vector = self.image_cache.get(key)
+        if vector is None:
+            encoded = self.encode_images([image if image is not None else decode_image(image_data)])
+            if encoded is None:
+                return None
+            vector = encoded[0]
+            self.image_cache.set(key, vector)
+
+        scores, ids = self.search_vectors(vector.reshape(1, -1), k, filters=filters)
+        return self._format_results(scores[0], ids[0])
+
+    def search_vectors(self, vectors, k: int = 100, filters=None):
+        """
+        Search backend cho ma trận query [n, dim] (+ rerank nếu bật). Returns: (scores, ids)
+
+        Args:
+            filters: Bộ lọc video {"video_ids", "groups", "date_from", "date_to", "frame_range"}
+                (xem utils/search_filter.py), None = toàn bộ
+        """
+        return self.backend.search(vectors, k, filters=self.backend_filters(filters))
+
+    def backend_filters(self, filters):
+        """Bộ lọc video -> bộ lọc của backend (khoảng frame ID cho FAISS, biểu thức video_id cho Milvus)"""
+        if not filters:
+            return None
+        key = json.dumps(filters, sort_keys=True, default=str)
+        resolved = self.filter_cache.get(key)
+        if resolved is None:
+            codes = select_videos(self.video_index, filters)
+            resolved = self.backend.build_filters(self.video_index, codes, filters.get("frame_range"))
+            self.filter_cache.set(key, resolved)
+        return resolved
+
+    def reconstruct(self, frame_id):
+        """Vector của 1 frame đã index (FAISS: ưu tiên vector chính xác của rerank nếu có)"""
+        return self.backend.reconstruct(frame_id)
+
+    def score_all_frames(self, vectors, chunk_size=65536):
+        """Điểm inner product của query với MỌI frame: [n_query, ntotal] (chạy theo chunk trên ma trận vector)"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        scores = np.empty((len(vectors), len(self.vectors)), dtype=np.float32)
+        for start in range(0, len(self.vectors), chunk_size):
+            block = np.asarray(self.vectors[start:start + chunk_size], dtype=np.float32)
+            scores[:, start:start + len(block)] = vectors @ block.T
+        return scores
+
+    def can_score_videos(self):
+        return self.vectors is not None or self.video_pool is not None
+
+    def video_scores(self, vectors):
+        """
+        Điểm của MỌI video cho từng query, thứ tự theo self.video_index.videos.
+        - Có vector thô: điểm = max trên tất cả frame của video (chính xác)
+        - Chỉ có video pool: điểm = inner product với embedding max-pool của video (xấp xỉ)
+        Returns: (video_scores [n_query, n_video], grouped_frame_scores hoặc None)
+        """
+        if self.vectors is not None:
+            return self.video_index.reduce_max(self.score_all_frames(vectors))
+        if self.video_pool is not None:
+            return np.asarray(vectors, dtype=np.float32) @ np.asarray(self.video_pool, dtype=np.float32).T, None
+        raise RuntimeError("Index không lưu vector thô và chưa có video_pool_path")
+
+    def _format_results(self, scores, ids):
+        """Map 1 hàng kết quả FAISS -> List Dict {id, score, imgpath}"""
+        return self.catalog.format_results(scores, ids)
+
+    def text_search(self, text: str, k: int = 100, filters=None):
+        return self.text_search_batch([text], k=k, filters=filters)[0]
+
+    def text_search_batch(self, texts, k: int = 100, filters=None):
+        """
+        Search nhiều query cùng lúc: 1 lần tokenize, 1 lần encode_text, 1 lần index.search.
+        Returns: List kết quả theo đúng thứ tự của texts.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+
+        vectors = self.encode_texts(texts)
+        if vectors is None:
+            return [[] for _ in texts]
+
+        scores, ids = self.search_vectors(vectors, k, filters=filters)
+        return [self._format_results(scores[i], ids[i]) for i in range(len(texts))]
 
     # Hàm search bằng ảnh (Dùng chung cho cả 2 loại CLIP)
-    def image_search(self, img_id: int, k: int = 100):
+    def image_search(self, img_id: int, k: int = 100, filters=None):
+        # Có KNN graph: đọc thẳng top-k đã tính sẵn (graph không lọc được -> chỉ dùng khi không có bộ lọc)
+        if not filters:
+            neighbors = self.backend.neighbors(img_id, k)
+            if neighbors is not None:
+                return self._format_results(*neighbors)
+
         # Reconstruct vector từ Index (Không cần model AI chạy lại)
         try:
-            vector = self.index.reconstruct(img_id).reshape(1, -1).astype(np.float32)
-            scores, ids = self.index.search(vector, k)
-            
-            results = []
-            for score, idx in zip(scores[0], ids[0]):
-                idx = int(idx)
-                if idx in self.id_map:
-                    results.append({
-                        "id": idx,
-                        "score": float(score),
-                        "imgpath": f"/{self.id_map[idx]}"
-                    })
-            return results
+            vector = self.reconstruct(img_id).reshape(1, -1).astype(np.float32)
+            scores, ids = self.search_vectors(vector, k, filters=filters)
+            return self._format_results(scores[0], ids[0])
         except Exception as e:
             logger.error(f"Error image search id {img_id}: {e}")
             return []
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+FrameCatalog: bảng tra cứu frame ID -> (path, video, frame number) dạng mảng NumPy.
+
+Thay cho dict {int: str} ~546k phần tử parse từ data/index/path_index_clip.json:
+- Path được ghép thành 1 blob bytes + mảng offsets
+- Video lưu dạng mã số (int32) trỏ vào danh sách tên video đã sort
+- Lần đầu build từ JSON rồi cache ra file .npz cạnh JSON, các lần sau load trực tiếp
+- Dùng chung 1 instance cho mọi service qua get_catalog()
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_FRAME_NUMBER_RE = re.compile(r'(\d+)$')
+
+
+def parse_frame_path(path):
+    """
+    data/clip_frame/L01_V001/keyframe_0123.webp -> ("L01_V001", 123)
+    """
+    parts = path.replace('\\', '/').split('/')
+    video_id = parts[-2] if len(parts) >= 2 else ""
+    stem = os.path.splitext(parts[-1])[0]
+    match = _FRAME_NUMBER_RE.search(stem)
+    return video_id, int(match.group(1)) if match else 0
+
+
+class FrameCatalog:
+    def __init__(self, ids, video_codes, frames, path_offsets, path_blob, videos):
+        """
+        Args:
+            ids: int64 [N] frame ID, đã sort tăng dần
+            video_codes: int32 [N] chỉ số vào `videos`
+            frames: int32 [N] số thứ tự frame trong video
+            path_offsets: int64 [N+1] vị trí path thứ i trong path_blob
+            path_blob: bytes chứa toàn bộ path UTF-8 nối liền
+            videos: np.ndarray[str] tên video đã sort (L01_V001, ...)
+        """
+        self.ids = ids
+        self.video_codes = video_codes
+        self.frames = frames
+        self.path_offsets = path_offsets
+        self.path_blob = path_blob
+        self.videos = videos
+
+        # Bảng ID -> row, cho phép tra cứu O(1) kể cả khi ID không liên tục
+        size = int(ids[-1]) + 1 if len(ids) else 0
+        self._row_of = np.full(size, -1, dtype=np.int32)
+        self._row_of[ids] = np.arange(len(ids), dtype=np.int32)
+
+    # ----- BUILD / LOAD -----
+    @classmethod
+    def from_json(cls, json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+
+        items = sorted((int(k), v) for k, v in raw.items())
+        ids = np.fromiter((k for k, _ in items), dtype=np.int64, count=len(items))
+
+        encoded = [v.encode('utf-8') for _, v in items]
+        path_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=path_offsets[1:])
+        path_blob = b''.join(encoded)
+
+        parsed = [parse_frame_path(v) for _, v in items]
+        videos, video_codes = np.unique([vid for vid, _ in parsed], return_inverse=True)
+        frames = np.fromiter((frame for _, frame in parsed), dtype=np.int32, count=len(parsed))
+
+        return cls(ids, video_codes.astype(np.int32), frames, path_offsets, path_blob, videos)
+
+    @classmethod
+    def load(cls, json_path, cache_path=None):
+        """Load từ cache .npz nếu còn mới hơn JSON, ngược lại build từ JSON và ghi cache."""
+        if cache_path is None:
+            cache_path = os.path.splitext(json_path)[0] + ".catalog.npz"
+
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(json_path):
+            logger.info(f"Loading Frame Catalog: {cache_path}")
+            with np.load(cache_path, allow_pickle=False) as data:
+                return cls(
+                    data["ids"], data["video_codes"], data["frames"],
+                    data["path_offsets"], data["path_blob"].tobytes(), data["videos"]
+                )
+
+        logger.info(f"Building Frame Catalog from: {json_path}")
+        catalog = cls.from_json(json_path)
+        try:
+            catalog.save(cache_path)
+        except OSError as e:
+            logger.warning(f"Không ghi được cache catalog {cache_path}: {e}")
+        return catalog
+
+    def save(self, cache_path):
+        np.savez(
+            cache_path,
+            ids=self.ids,
+            video_codes=self.video_codes,
+            frames=self.frames,
+            path_offsets=self.path_offsets,
+            path_blob=np.frombuffer(self.path_blob, dtype=np.uint8),
+            videos=self.videos
+        )
+
+    # ----- LOOKUP O(1) -----
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, frame_id):
+        return 0 <= frame_id < len(self._row_of) and self._row_of[frame_id] >= 0
+
+    def row(self, frame_id):
+        """Row của frame ID trong các mảng, -1 nếu không tồn tại"""
+        if 0 <= frame_id < len(self._row_of):
+            return int(self._row_of[frame_id])
+        return -1
+
+    def rows(self, frame_ids):
+        """Phiên bản vectorized của row(): trả về -1 cho ID không tồn tại"""
+        frame_ids = np.asarray(frame_ids, dtype=np.int64)
+        valid = (frame_ids >= 0) & (frame_ids < len(self._row_of))
+        rows = np.full(frame_ids.shape, -1, dtype=np.int32)
+        rows[valid] = self._row_of[frame_ids[valid]]
+        return rows
+
+    def _path_at(self, row):
+        return self.path_blob[self.path_offsets[row]:self.path_offsets[row + 1]].decode('utf-8')
+
+    def path(self, frame_id):
+        row = self.row(frame_id)
+        if row < 0:
+            raise KeyError(frame_id)
+        return self._path_at(row)
+
+    def get(self, frame_id, default=None):
+        row = self.row(frame_id)
+        return self._path_at(row) if row >= 0 else default
+
+    def video(self, frame_id):
+        row = self.row(frame_id)
+        return str(self.videos[self.video_codes[row]]) if row >= 0 else None
+
+    def frame(self, frame_id):
+        row = self.row(frame_id)
+        return int(self.frames[row]) if row >= 0 else None
+
+    def items(self):
+        """Duyệt (id, path) theo thứ tự ID tăng dần"""
+        for row, frame_id in enumerate(self.ids):
+            yield int(frame_id), self._path_at(row)
+
+    # ----- FORMAT KẾT QUẢ -----
+    def format_frames(self, ids):
+        """List frame ID -> List Dict {id, imgpath} (trang chủ / duyệt video, không có score)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = self.rows(ids)
+        keep = rows >= 0
+        return [
+            {"id": idx, "imgpath": "/" + self._path_at(row)}
+            for idx, row in zip(ids[keep].tolist(), rows[keep].tolist())
+        ]
+
+    def format_results(self, scores, ids):
+        """
+        Map 1 hàng kết quả search (scores, ids) -> List Dict {id, score, imgpath}.
+        Lọc ID không hợp lệ (vd: -1 của FAISS) bằng mask thay vì check từng phần tử.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = self.rows(ids)
+        keep = rows >= 0
+
+        ids = ids[keep].tolist()
+        scores = np.asarray(scores, dtype=np.float32)[keep].tolist()
+        starts = self.path_offsets[rows[keep]].tolist()
+        ends = self.path_offsets[rows[keep] + 1].tolist()
+
+        blob = self.path_blob
+        return [
+            {"id": idx, "score": score, "imgpath": "/" + blob[s:e].decode('utf-8')}
+            for idx, score, s, e in zip(ids, scores, starts, ends)
+        ]
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(json_path):
+    """Trả về FrameCatalog dùng chung (mỗi json_path chỉ load 1 lần cho cả process)"""
+    key = os.path.abspath(json_path)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            if not os.path.exists(json_path):
+                raise FileNotFoundError(f"JSON Map not found: {json_path}")
+            _catalogs[key] = FrameCatalog.load(json_path)
+        return _catalogs[key]
@@ -0,0 +1,118 @@
+"""
+Load FAISS index theo nhiều chế độ (load_mode):
+- "memory": faiss.read_index đọc toàn bộ file .bin vào heap (mặc định, như cũ)
+- "mmap"  : faiss.read_index với IO_FLAG_MMAP -> vector nằm trong page cache,
+            các uvicorn worker dùng chung, khởi động gần như tức thì
+- "npy"   : ma trận vector thô (.npy float16/float32) mở bằng np.memmap,
+            search brute-force theo từng chunk (zero-copy với float32)
+"""
+
+import os
+import logging
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOAD_MODES = ("memory", "mmap", "npy")
+
+# IO_FLAG_MMAP_IFC (FAISS >= 1.10) mmap cả codes của IndexFlat; bản cũ chỉ có IO_FLAG_MMAP,
+# flag này không mmap IndexFlat nên index flat vẫn bị đọc hết vào RAM riêng của process
+MMAP_SHARES_FLAT = hasattr(faiss, "IO_FLAG_MMAP_IFC")
+
+
+class NpyFlatIndex:
+    """
+    Flat inner-product index đọc từ file .npy memory-mapped.
+    Giả lập các thuộc tính/hàm của faiss.Index mà FaissService dùng: ntotal, d, search, reconstruct.
+    """
+
+    def __init__(self, npy_path, chunk_size=65536):
+        if not os.path.exists(npy_path):
+            raise FileNotFoundError(f"Vector matrix not found: {npy_path}")
+
+        self.xb = np.load(npy_path, mmap_mode='r')
+        if self.xb.ndim != 2 or self.xb.dtype not in (np.float16, np.float32):
+            raise ValueError(f"Expected 2-D float16/float32 matrix in {npy_path}, got {self.xb.dtype} {self.xb.shape}")
+
+        self.ntotal, self.d = self.xb.shape
+        self.chunk_size = chunk_size
+        self.metric_type = faiss.METRIC_INNER_PRODUCT
+
+    def search(self, x, k):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        k = min(k, self.ntotal)
+
+        # float32: faiss.knn đọc thẳng trên memmap, không copy
+        if self.xb.dtype == np.float32:
+            return faiss.knn(x, self.xb, k, metric=faiss.METRIC_INNER_PRODUCT)
+
+        # float16: convert từng chunk sang float32 rồi merge top-k
+        all_scores, all_ids = [], []
+        for start in range(0, self.ntotal, self.chunk_size):
+            block = np.asarray(self.xb[start:start + self.chunk_size], dtype=np.float32)
+            scores, ids = faiss.knn(x, block, min(k, len(block)), metric=faiss.METRIC_INNER_PRODUCT)
+            all_scores.append(scores)
+            all_ids.append(ids + start)
+
+        scores = np.concatenate(all_scores, axis=1)
+        ids = np.concatenate(all_ids, axis=1)
+        top = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, top, axis=1), np.take_along_axis(ids, top, axis=1)
+
+    def reconstruct(self, key):
+        return np.asarray(self.xb[key], dtype=np.float32)
+
+
+def index_vectors(index):
+    """
+    Ma trận vector [ntotal, d] của index dạng flat mà không copy (view trên RAM/mmap),
+    None nếu index không lưu vector thô (IVF, HNSW, PQ, GPU...)
+    """
+    if isinstance(index, NpyFlatIndex):
+        return index.xb
+    if isinstance(index, faiss.IndexFlat):
+        return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+    return None
+
+
+def set_search_params(index, params):
+    """params: {"nprobe": 32} / {"efSearch": 128}... set qua faiss.ParameterSpace (bỏ qua nếu rỗng)"""
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, ",".join(f"{key}={value}" for key, value in params.items()))
+
+
+def load_index(bin_path, load_mode="memory", npy_path=None, search_params=None):
+    """
+    Args:
+        bin_path: File FAISS .bin
+        load_mode: "memory" | "mmap" | "npy"
+        npy_path: Ma trận vector .npy (bắt buộc khi load_mode="npy")
+        search_params: Tham số search của index xấp xỉ (IVF nprobe, HNSW efSearch), xem utils/index_tools.py
+    """
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load_mode '{load_mode}', expected one of {LOAD_MODES}")
+
+    if load_mode == "npy":
+        if not npy_path:
+            raise ValueError("load_mode='npy' requires npy_path")
+        logger.info(f"Memory-mapping vectors: {npy_path}")
+        return NpyFlatIndex(npy_path)
+
+    if not os.path.exists(bin_path):
+        raise FileNotFoundError(f"Index not found: {bin_path}")
+
+    if load_mode == "mmap":
+        mmap_flag = faiss.IO_FLAG_MMAP_IFC if MMAP_SHARES_FLAT else faiss.IO_FLAG_MMAP
+        if not MMAP_SHARES_FLAT:
+            logger.warning(f"FAISS {faiss.__version__} không có IO_FLAG_MMAP_IFC: index flat {bin_path} "
+                           f"vẫn được đọc hết vào RAM (cần FAISS >= 1.10 để mmap)")
+        logger.info(f"Memory-mapping Index: {bin_path}")
+        index = faiss.read_index(bin_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    else:
+        logger.info(f"Loading Index: {bin_path}")
+        index = faiss.read_index(bin_path)
+
+    set_search_params(index, search_params)
+    return index
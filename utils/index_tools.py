@@ -0,0 +1,132 @@
+"""
+Công cụ build / đánh giá các biến thể index FAISS từ file .bin flat gốc.
+
+Biến thể (key "index_variant" trong MODEL_CONFIGS, build bằng scripts/build_ann_index.py):
+- "flat"    : index gốc, brute-force chính xác
+- "ivf_flat": IVF{nlist},Flat  - chỉ quét nprobe cluster, vector giữ nguyên
+- "ivf_pq"  : IVF{nlist},PQ{m} - quét nprobe cluster trên mã PQ (m byte / vector)
+- "hnsw"    : HNSW{M},Flat     - đồ thị HNSW, không cần train
+- "sq_fp16" : SQfp16           - brute-force trên vector float16 (1/2 RAM, gần như không mất recall)
+- "sq8"     : SQ8              - brute-force trên vector int8 (1/4 RAM)
+- "ivf_sq8" : IVF{nlist},SQ8   - IVF trên vector int8
+
+File biến thể nằm cạnh file gốc: data/bin/l14.bin -> data/bin/l14.ivf_pq.bin
+Tham số lúc search ("search_params", vd {"nprobe": 32} hoặc {"efSearch": 128})
+được set qua faiss.ParameterSpace.
+"""
+
+import os
+import time
+import logging
+
+import faiss
+import numpy as np
+
+from utils.index_loader import index_vectors, set_search_params
+
+logger = logging.getLogger(__name__)
+
+INDEX_VARIANTS = {
+    "flat": "Flat",
+    "ivf_flat": "IVF{nlist},Flat",
+    "ivf_pq": "IVF{nlist},PQ{pq_m}",
+    "hnsw": "HNSW{hnsw_m},Flat",
+    "sq_fp16": "SQfp16",
+    "sq8": "SQ8",
+    "ivf_sq8": "IVF{nlist},SQ8",
+}
+
+
+def variant_path(bin_path, variant=None):
+    """Đường dẫn file của biến thể index (None / "flat" -> file gốc)"""
+    if not variant or variant == "flat":
+        return bin_path
+    root, ext = os.path.splitext(bin_path)
+    return f"{root}.{variant}{ext}"
+
+
+def factory_string(variant, d, nlist=4096, pq_m=None, hnsw_m=32):
+    """
+    Args:
+        d: Số chiều vector
+        pq_m: Số sub-quantizer của PQ (phải chia hết d), mặc định d // 16 (vd 768 -> 48 byte / vector)
+    """
+    if variant not in INDEX_VARIANTS:
+        raise ValueError(f"Unknown index variant '{variant}', expected one of {tuple(INDEX_VARIANTS)}")
+    pq_m = pq_m or d // 16
+    if variant == "ivf_pq" and d % pq_m:
+        raise ValueError(f"PQ{pq_m} không chia hết số chiều {d}")
+    return INDEX_VARIANTS[variant].format(nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m)
+
+
+def source_vectors(index):
+    """Ma trận vector của index gốc (view zero-copy với index flat, reconstruct với loại khác)"""
+    vectors = index_vectors(index)
+    if vectors is None:
+        vectors = index.reconstruct_n(0, index.ntotal)
+    return vectors
+
+
+def build_index(vectors, spec, train_size=200000, chunk_size=65536, ef_construction=None, seed=0):
+    """
+    Build index inner product theo factory string từ ma trận vector [n, d] (đã L2-normalize).
+
+    Args:
+        spec: Factory string (xem factory_string)
+        train_size: Số vector lấy mẫu để train IVF / PQ
+        ef_construction: efConstruction của HNSW (None = mặc định FAISS)
+    """
+    n, d = vectors.shape
+    index = faiss.index_factory(d, spec, faiss.METRIC_INNER_PRODUCT)
+    if ef_construction and hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = ef_construction
+
+    if not index.is_trained:
+        sample = np.sort(np.random.default_rng(seed).choice(n, size=min(train_size, n), replace=False))
+        logger.info(f"Training {spec} on {len(sample):,} vectors...")
+        index.train(np.ascontiguousarray(vectors[sample], dtype=np.float32))
+
+    for start in range(0, n, chunk_size):
+        index.add(np.ascontiguousarray(vectors[start:start + chunk_size], dtype=np.float32))
+        logger.info(f"Added {min(start + chunk_size, n):,}/{n:,} vectors")
+    return index
+
+
+def recall_at_k(gt_ids, ids, k):
+    """Tỉ lệ trung bình của top-k chính xác (gt_ids) xuất hiện trong top-k của index xấp xỉ (ids)"""
+    hits = [len(np.intersect1d(gt[:k], found[:k])) for gt, found in zip(gt_ids, ids)]
+    return float(np.mean(hits)) / k
+
+
+def drop_self(scores, ids, self_ids, k):
+    """Bỏ kết quả trùng chính query (query lấy mẫu từ index) khỏi từng dòng, giữ k kết quả còn lại"""
+    keep = ids != np.asarray(self_ids, dtype=np.int64)[:, None]
+    order = np.argsort(~keep, axis=1, kind="stable")[:, :k]  # Giữ thứ tự, đẩy dòng trùng ra cuối
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def evaluate(index, queries, gt_ids, k=100, params=None, gt_scores=None, self_ids=None):
+    """
+    Đo recall@k và latency của index so với ground truth từ index flat float32.
+
+    Args:
+        gt_scores: Điểm chính xác tương ứng gt_ids, nếu có thì đo thêm sai số điểm top-1
+            (index lượng tử hóa SQ / PQ trả về inner product xấp xỉ)
+        self_ids: Frame ID của từng query khi query lấy mẫu từ chính index: search k + 1 rồi bỏ kết quả
+            trùng query (gt_ids / gt_scores cũng phải đã bỏ, xem drop_self)
+    Returns: {"params", "recall@k", "ms_per_query"[, "top1_score_error"]}
+    """
+    set_search_params(index, params)
+    start = time.perf_counter()
+    scores, ids = index.search(queries, k if self_ids is None else k + 1)
+    elapsed = time.perf_counter() - start
+    if self_ids is not None:
+        scores, ids = drop_self(scores, ids, self_ids, k)
+    result = {
+        "params": params or {},
+        f"recall@{k}": recall_at_k(gt_ids, ids, k),
+        "ms_per_query": elapsed * 1000 / len(queries)
+    }
+    if gt_scores is not None:
+        result["top1_score_error"] = float(np.abs(scores[:, 0] - gt_scores[:, 0]).mean())
+    return result
@@ -0,0 +1,78 @@
+"""
+KnnGraph: top-K láng giềng tính sẵn cho mọi frame (build bằng scripts/build_knn_graph.py).
+
+/img (tìm frame tương tự) đọc thẳng 1 dòng từ mảng memory-mapped thay vì reconstruct + search toàn index:
+- <bin>.knn_ids.npy    int32   [ntotal, K]  frame ID láng giềng, sort theo điểm giảm dần (-1 = không có)
+- <bin>.knn_scores.npy float16 [ntotal, K]  inner product tương ứng
+- <bin>.knn.json       metadata: K, ntotal, kích thước + mtime của file index lúc build
+
+Graph bị coi là cũ (stale) nếu file index đã thay đổi hoặc ntotal khác, khi đó service search trực tiếp.
+"""
+
+import os
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def graph_paths(bin_path):
+    """data/bin/l14.bin -> (l14.knn_ids.npy, l14.knn_scores.npy, l14.knn.json)"""
+    root, _ = os.path.splitext(bin_path)
+    return f"{root}.knn_ids.npy", f"{root}.knn_scores.npy", f"{root}.knn.json"
+
+
+def index_signature(bin_path):
+    """Kích thước + mtime của file index, dùng để phát hiện graph cũ"""
+    if not os.path.exists(bin_path):
+        return None
+    stat = os.stat(bin_path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+class KnnGraph:
+    def __init__(self, ids, scores, meta):
+        self.ids = ids
+        self.scores = scores
+        self.meta = meta
+        self.k = ids.shape[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbors(self, frame_id, k):
+        """(scores [k], ids [k]) của frame_id, None nếu không phục vụ được (k > K hoặc ID ngoài graph)"""
+        if k > self.k or not 0 <= frame_id < len(self.ids):
+            return None
+        ids = np.asarray(self.ids[frame_id, :k], dtype=np.int64)
+        scores = np.asarray(self.scores[frame_id, :k], dtype=np.float32)
+        return scores, ids
+
+    @classmethod
+    def load(cls, bin_path, ntotal=None):
+        """
+        Mở graph cạnh file index (mmap), None nếu chưa build, build dở dang hoặc đã cũ.
+
+        Args:
+            ntotal: Số vector của index đang load, khác với lúc build thì coi là cũ
+        """
+        ids_path, scores_path, meta_path = graph_paths(bin_path)
+        # meta được ghi sau cùng -> chưa có meta là chưa build xong
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        signature = index_signature(bin_path)
+        if signature is not None and signature != meta.get("index"):
+            logger.warning(f"KNN graph cũ (index đã thay đổi từ lúc build): {meta_path}, dùng search trực tiếp.")
+            return None
+        if ntotal is not None and ntotal != meta.get("ntotal"):
+            logger.warning(f"KNN graph cũ (ntotal {meta.get('ntotal')} != {ntotal}): {meta_path}, dùng search trực tiếp.")
+            return None
+
+        logger.info(f"Loading KNN graph (K={meta['k']}): {ids_path}")
+        return cls(np.load(ids_path, mmap_mode='r'), np.load(scores_path, mmap_mode='r'), meta)
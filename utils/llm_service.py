@@ -1,17 +1,66 @@
 import google.generativeai as genai
+import asyncio
 import logging
 import os
+import re
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from utils.cache import LRUCache, SqliteStore
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class StubLlmBackend:
+    """
+    Backend giả lập Gemini để chạy offline / test: cùng interface generate_content(prompt).text.
+    Trả về câu mô tả cố định từ USER QUERY trong prompt, `delay` để giả lập độ trễ mạng.
+    """
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def generate_content(self, prompt):
+        if self.delay:
+            time.sleep(self.delay)
+        match = re.search(r'USER QUERY: "(.*)"', prompt)
+        query = match.group(1) if match else prompt.strip()
+        return type("StubResponse", (), {"text": f"A photo of {query}"})()
+
+
 class LlmService:
-    def __init__(self, api_keys=None):
+    def __init__(self, api_keys=None, backend="gemini", timeout=None, cache_size=1024, cache_path=None,
+                 rotate_delay=0.0, max_workers=4, executor=None):
         """
         api_keys: List of API keys or single API key string (can be comma-separated)
+        backend: "gemini" hoặc "stub" (StubLlmBackend, không cần API key/mạng)
+        timeout: Thời gian tối đa (giây) chờ LLM, quá hạn thì dùng query gốc (None = chờ tới khi xong)
+        cache_size / cache_path: Cache prompt đã refine trong RAM + SQLite (key = query gốc)
+        rotate_delay: Thời gian nghỉ (giây) trước khi thử lại với API key kế tiếp
+        executor: Thread pool chạy các lần gọi LLM (server: stage "llm" của utils/executors.py),
+            None = tạo pool riêng max_workers thread (script / test)
         """
+        self.timeout = timeout
+        self.rotate_delay = rotate_delay
+        self.cache = LRUCache(maxsize=cache_size)
+        self.store = SqliteStore(cache_path, table="llm_refine") if cache_path else None
+
+        # Các query giống nhau đang chờ LLM dùng chung 1 lần gọi
+        self._inflight = {}
+        self._inflight_lock = threading.RLock()
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+
+        # genai.configure là state toàn cục: đổi key + model chỉ trong lock, mỗi lần gọi dùng model lấy trong lock
+        self._key_lock = threading.Lock()
+
+        if backend == "stub":
+            logger.info("LLM Service: using offline stub backend")
+            self.api_keys = []
+            self.current_key_index = -1
+            self.model = StubLlmBackend()
+            return
+
         # Handle comma-separated string
         if isinstance(api_keys, str):
             # Split by comma and clean whitespace
@@ -52,27 +101,143 @@ class LlmService:
             self.model = None
             return False
     
-    def _rotate_key(self):
-        """Rotate to next API key"""
-        self.current_key_index += 1
-        if self.current_key_index >= len(self.api_keys):
-            logger.warning("All API keys exhausted. Resetting to first key.")
-            self.current_key_index = 0
-        
-        logger.info(f"Rotating to API key #{self.current_key_index + 1}/{len(self.api_keys)}")
-        return self._initialize_model()
+    def _rotate_key(self, failed_index=None):
+        """
+        Rotate to next API key.
+        failed_index: key đang dùng khi gặp lỗi quota; thread khác đã rotate qua key đó rồi thì không rotate nữa
+        (nhiều request cùng hết quota chỉ bỏ qua đúng 1 key)
+        """
+        with self._key_lock:
+            if failed_index is not None and failed_index != self.current_key_index:
+                return self.model is not None
+
+            self.current_key_index += 1
+            if self.current_key_index >= len(self.api_keys):
+                logger.warning("All API keys exhausted. Resetting to first key.")
+                self.current_key_index = 0
+
+            logger.info(f"Rotating to API key #{self.current_key_index + 1}/{len(self.api_keys)}")
+            return self._initialize_model()
+
+    def _current_model(self):
+        with self._key_lock:
+            return self.model, self.current_key_index
 
     def refine_for_clip(self, user_query: str, max_retries=None):
         """
         Input: "xe cứu thương chạy trên phố" (Vietnamese)
         Output: "An ambulance driving fast on a busy city street with buildings around" (English Visual Description)
+
+        Cache theo query gốc; các request trùng query đang chạy dùng chung 1 lần gọi LLM;
+        quá `timeout` thì trả về query gốc (lần gọi vẫn chạy nền và ghi cache khi xong).
+        """
+        return self.refine_with_status(user_query, max_retries)[0]
+
+    def refine_with_status(self, user_query: str, max_retries=None):
+        """
+        Như refine_for_clip nhưng cho biết có phải đường dự phòng không (bản blocking cho script,
+        không gọi từ chính thread của `executor`).
+        Returns: (query, refined) - refined = False khi LLM timeout / lỗi và trả về query gốc
         """
         if not self.model:
-            return user_query
+            return user_query, True  # Không bật LLM: query gốc là kết quả bình thường
+
+        key = " ".join(user_query.split())
+        refined_query = self.cache.get(key)
+        if refined_query is not None:
+            return refined_query, True
+
+        try:
+            refined_query = self._submit(key, user_query, max_retries).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.warning(f"LLM timeout after {self.timeout}s. Returning original query.")
+            return user_query, False
+        except Exception as e:
+            logger.error(f"LLM Error: {e}")
+            return user_query, False
+        return self._with_status(user_query, refined_query)
+
+    async def refine_async(self, user_query: str, max_retries=None):
+        """
+        Bản async của refine_with_status cho endpoint: chỉ lần gọi LLM chiếm 1 thread của `executor`,
+        request chờ trên event loop nên không giữ thêm thread nào (kể cả khi timeout).
+        Returns: (query, refined)
+        """
+        if not self.model:
+            return user_query, True
+
+        key = " ".join(user_query.split())
+        refined_query = self.cache.get(key)
+        if refined_query is not None:
+            return refined_query, True
+
+        future = asyncio.wrap_future(self._submit(key, user_query, max_retries))
+        try:
+            # shield: request timeout / bị hủy không hủy lần gọi đang dùng chung với request khác
+            refined_query = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"LLM timeout after {self.timeout}s. Returning original query.")
+            return user_query, False
+        except Exception as e:
+            logger.error(f"LLM Error: {e}")
+            return user_query, False
+        return self._with_status(user_query, refined_query)
+
+    def _with_status(self, user_query, refined_query):
+        if refined_query is None:
+            # Fallback: Trả về query gốc nếu tất cả keys đều thất bại
+            logger.warning(f"All API keys failed or exhausted. Returning original query.")
+            return user_query, False
+        return refined_query, True
+
+    def _submit(self, key, user_query, max_retries):
+        """Future của lần gọi đang chạy cho key, chưa có thì tạo mới (tra cache SQLite + gọi LLM trên executor)"""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._lookup_or_refine, key, user_query, max_retries)
+                self._inflight[key] = future
+                future.add_done_callback(lambda f: self._on_refined(key, f))
+        return future
+
+    def _lookup_or_refine(self, key, user_query, max_retries=None):
+        """Chạy trên executor: cache SQLite trước, không có mới gọi LLM"""
+        if self.store is not None:
+            try:
+                blob = self.store.get("clip", key)
+            except Exception as e:
+                logger.warning(f"Không đọc được LLM cache trên đĩa: {e}")
+                blob = None
+            if blob is not None:
+                return blob.decode('utf-8')
+        return self._refine_uncached(user_query, max_retries)
+
+    def _on_refined(self, key, future):
+        """
+        Ghi cache khi LLM trả kết quả (kể cả khi request đã timeout) rồi mới bỏ khỏi in-flight:
+        request đến giữa 2 bước vẫn thấy future đã xong, không gọi LLM lần nữa
+        """
+        try:
+            if future.cancelled() or future.exception() is not None:
+                return
+            refined_query = future.result()
+            if refined_query is None:
+                return
+            self.cache.set(key, refined_query)
+            if self.store is not None:
+                try:
+                    self.store.set("clip", key, refined_query.encode('utf-8'))
+                except Exception as e:
+                    logger.warning(f"Không ghi được LLM cache xuống đĩa: {e}")
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
 
+    def _refine_uncached(self, user_query: str, max_retries=None):
+        """Gọi LLM (có rotate API key khi hết quota). Returns: query đã refine hoặc None nếu thất bại"""
         # Default max_retries to number of available keys
         if max_retries is None:
-            max_retries = len(self.api_keys)
+            max_retries = max(1, len(self.api_keys))
 
         # --- PROMPT TỐI ƯU CHO CLIP (TEXT-TO-IMAGE) ---
         prompt = f"""
@@ -89,8 +254,11 @@ class LlmService:
 
         retry_count = 0
         while retry_count < max_retries:
+            model, key_index = self._current_model()
+            if model is None:
+                break
             try:
-                response = self.model.generate_content(prompt)
+                response = model.generate_content(prompt)
                 refined_query = response.text.strip()
                 
                 logger.info(f"LLM Reprompt: '{user_query}' -> '{refined_query}'")
@@ -105,13 +273,14 @@ class LlmService:
                 ])
                 
                 if is_quota_error and retry_count < max_retries - 1:
-                    logger.warning(f"API key #{self.current_key_index + 1} quota exceeded: {e}")
+                    logger.warning(f"API key #{key_index + 1} quota exceeded: {e}")
                     logger.info(f"Attempting to rotate to next API key... (retry {retry_count + 1}/{max_retries})")
                     
                     # Rotate to next key
-                    if self._rotate_key():
+                    if self._rotate_key(key_index):
                         retry_count += 1
-                        time.sleep(0.5)  # Small delay before retry
+                        if self.rotate_delay:
+                            time.sleep(self.rotate_delay)  # Small delay before retry
                         continue
                     else:
                         logger.error("Failed to rotate to next key.")
@@ -120,6 +289,4 @@ class LlmService:
                     logger.error(f"LLM Error (not quota related or no more retries): {e}")
                     break
         
-        # Fallback: Trả về query gốc nếu tất cả keys đều thất bại
-        logger.warning(f"All API keys failed or exhausted. Returning original query.")
-        return user_query
\ No newline at end of file
+        return None
\ No newline at end of file
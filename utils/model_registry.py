@@ -0,0 +1,215 @@
+"""
+ModelRegistry: load FaissService theo yêu cầu (lazy) + LRU eviction.
+
+- Model chỉ được load khi có request đầu tiên với faiss=<id>
+- Giữ tối đa `max_loaded_models` model và tổng RAM ước tính <= `memory_budget_mb`
+- Vượt giới hạn thì giải phóng model ít được dùng gần đây nhất (LRU)
+"""
+
+import gc
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import torch
+
+from utils.faiss_service import FaissService
+from utils.index_loader import MMAP_SHARES_FLAT
+from utils.index_tools import variant_path
+
+logger = logging.getLogger(__name__)
+
+
+def index_file_path(config):
+    """
+    File index thực tế của 1 model (load_mode="npy" đọc ma trận .npy, "index_variant" đọc file biến thể),
+    None với backend "milvus" (vector nằm trên Milvus server)
+    """
+    if config.get("backend") == "milvus":
+        return None
+    if config.get("load_mode") == "npy":
+        return config.get("npy_path")
+    return variant_path(config["bin_path"], config.get("index_variant"))
+
+
+# RAM weights float32 (MB) theo kiến trúc CLIP trong "model_key", để ước tính TRƯỚC khi load
+# (kiểm tra theo thứ tự: "bigg-14" phải đứng trước "-g-14")
+MODEL_WEIGHTS_MB = (
+    ("bigg-14", 10200),  # ~2.5B params
+    ("-g-14", 5500),     # ~1.4B
+    ("h-14", 4000),      # ~1B
+    ("l-14", 1750),      # ~430M
+    ("b-16", 600),       # ~150M
+    ("b-32", 600),
+)
+
+
+def model_weights_mb(config):
+    """RAM weights ước tính theo MODEL_WEIGHTS_MB, 0 nếu không nhận ra kiến trúc"""
+    key = config.get("model_key", "").lower().replace("/", "-")
+    for pattern, size_mb in MODEL_WEIGHTS_MB:
+        if pattern in key:
+            return size_mb
+    return 0
+
+
+def estimate_memory_mb(config, service=None):
+    """
+    Ước tính RAM riêng (private) của 1 model:
+    - Index: kích thước file nếu load_mode="memory" (mmap/npy nằm trong page cache dùng chung),
+      hoặc "mmap" trên FAISS cũ không mmap được IndexFlat (xem MMAP_SHARES_FLAT)
+    - Model: tổng dung lượng parameters nếu đã load, hoặc "memory_mb" trong config,
+      hoặc bảng MODEL_WEIGHTS_MB khi chưa load
+    """
+    if service is None and config.get("memory_mb"):
+        return float(config["memory_mb"])
+
+    total = 0
+    index_path = index_file_path(config)
+    private_modes = ("memory",) if MMAP_SHARES_FLAT else ("memory", "mmap")
+    if config.get("load_mode", "memory") in private_modes and index_path and os.path.exists(index_path):
+        total += os.path.getsize(index_path)
+
+    model = getattr(service, "model", None)
+    if isinstance(model, torch.nn.Module):
+        total += sum(p.numel() * p.element_size() for p in model.parameters())
+    elif service is None:
+        total += model_weights_mb(config) * 1024 ** 2
+
+    return total / (1024 ** 2)
+
+
+class ModelRegistry:
+    def __init__(self, configs, device="cpu", translator=None, max_loaded_models=2, memory_budget_mb=None, service_kwargs=None):
+        """
+        Args:
+            configs: MODEL_CONFIGS
+            max_loaded_models: Số model tối đa được giữ trong RAM cùng lúc
+            memory_budget_mb: Tổng RAM ước tính tối đa cho các model (None = không giới hạn)
+            service_kwargs: Tham số dùng chung truyền thêm cho FaissService.from_config
+        """
+        self.configs = configs
+        self.device = device
+        self.translator = translator
+        self.max_loaded_models = max_loaded_models
+        self.memory_budget_mb = memory_budget_mb
+        self.service_kwargs = service_kwargs or {}
+
+        self._services = OrderedDict()   # model_id -> FaissService, cuối = mới dùng nhất
+        self._memory_mb = {}             # model_id -> RAM ước tính
+        self._lock = threading.Lock()
+        self._load_locks = {model_id: threading.Lock() for model_id in configs}
+
+    def __contains__(self, model_id):
+        return model_id in self._services
+
+    def loaded_ids(self):
+        with self._lock:
+            return list(self._services.keys())
+
+    def is_available(self, model_id):
+        """Model có trong config và file index tồn tại (load được khi cần), Milvus kiểm tra kết nối lúc load"""
+        config = self.configs.get(model_id)
+        if not config:
+            return False
+        if config.get("backend") == "milvus":
+            return True
+        index_path = index_file_path(config)
+        return bool(index_path) and os.path.exists(index_path)
+
+    def peek(self, model_id):
+        """Trả về service nếu đã load, không trigger load và không đổi thứ tự LRU"""
+        with self._lock:
+            return self._services.get(model_id)
+
+    def any_loaded(self):
+        """Service bất kỳ đang được load (ưu tiên model dùng gần nhất), None nếu chưa có"""
+        with self._lock:
+            return next(reversed(self._services.values()), None)
+
+    def get(self, model_id):
+        """
+        Lấy FaissService của model_id, load nếu chưa có.
+        Returns: FaissService hoặc None nếu model không tồn tại / load lỗi.
+        """
+        with self._lock:
+            if model_id in self._services:
+                self._services.move_to_end(model_id)
+                return self._services[model_id]
+
+        config = self.configs.get(model_id)
+        if config is None:
+            return None
+
+        # Mỗi model 1 lock riêng: nhiều request cùng lúc chỉ load 1 lần
+        with self._load_locks[model_id]:
+            with self._lock:
+                if model_id in self._services:
+                    self._services.move_to_end(model_id)
+                    return self._services[model_id]
+
+            if not self.is_available(model_id):
+                logger.warning(f"File index không tồn tại: {index_file_path(config)}. Bỏ qua {config['name']}.")
+                return None
+
+            # Giải phóng chỗ trước khi load model mới
+            self._evict_for(estimate_memory_mb(config))
+
+            try:
+                logger.info(f"⏳ Loading Model ID {model_id}: {config['name']}...")
+                service = FaissService.from_config(
+                    config, device=self.device, translator=self.translator, **self.service_kwargs
+                )
+            except Exception as e:
+                logger.error(f"FAILED to load {config['name']}: {e}")
+                return None
+
+            with self._lock:
+                self._services[model_id] = service
+                self._memory_mb[model_id] = estimate_memory_mb(config, service)
+                logger.info(f"Loaded {config['name']} SUCCESS (~{self._memory_mb[model_id]:.0f} MB).")
+
+            # Kiểm tra lại với dung lượng thực tế, không evict chính model vừa load
+            self._evict_for(0, keep=model_id)
+            return service
+
+    def preload(self, model_ids):
+        """Load trước các model (vd: các model "enabled" trong config lúc khởi động)"""
+        return sum(1 for model_id in model_ids if self.get(model_id) is not None)
+
+    def _evict_for(self, incoming_mb, keep=None):
+        """Evict LRU cho tới khi còn chỗ cho 1 model mới cần `incoming_mb`"""
+        while True:
+            with self._lock:
+                candidates = [mid for mid in self._services if mid != keep]
+                if not candidates:
+                    return
+                incoming = 0 if keep is not None else 1
+                over_count = len(self._services) + incoming > self.max_loaded_models
+                over_budget = (
+                    self.memory_budget_mb is not None
+                    and sum(self._memory_mb.values()) + incoming_mb > self.memory_budget_mb
+                )
+                if not (over_count or over_budget):
+                    return
+                victim = candidates[0]
+            self.evict(victim)
+
+    def evict(self, model_id):
+        with self._lock:
+            service = self._services.pop(model_id, None)
+            self._memory_mb.pop(model_id, None)
+        if service is None:
+            return
+
+        logger.info(f"Evicting Model ID {model_id}: {self.configs[model_id]['name']} (LRU)")
+        # Request đang chạy vẫn giữ reference, RAM được giải phóng khi request xong
+        del service
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def clear(self):
+        for model_id in self.loaded_ids():
+            self.evict(model_id)
@@ -13,17 +13,50 @@ import logging
 from typing import List, Dict, Optional
 from collections import defaultdict
 
+import numpy as np
+
+from utils.temporal_fusion import best_ordered_chains, video_fps
+
 logger = logging.getLogger(__name__)
 
+
+# Trần của số frame được cộng điểm evidence (bằng search_k mặc định cũ)
+MAX_EVIDENCE_FRAMES = 100
+
+
+def default_ranking_score(num_contexts, avg_score, max_score, num_frames):
+    """
+    Ranking formula (mảng theo video):
+    - Ưu tiên video có nhiều contexts
+    - Sau đó ưu tiên score cao
+    - Cuối cùng ưu tiên nhiều frames (evidence)
+
+    Số frames bị chặn ở MAX_EVIDENCE_FRAMES: với search_k lớn (1000+) 1 video có thể có hàng nghìn frame hit,
+    không chặn thì điểm evidence vượt 1000 và 1 context nhiều frame xếp trên video khớp 2 contexts.
+    Điểm score (tối đa 100) + evidence (tối đa 100) luôn < 1000 nên thứ tự "contexts trước" được giữ.
+    """
+    return (
+        num_contexts * 1000 +                          # Contexts là quan trọng nhất
+        avg_score * 100 +                              # Avg score
+        np.minimum(num_frames, MAX_EVIDENCE_FRAMES)    # Số lượng frames (evidence)
+    )
+
+
 class MultiContextKIS:
     """
     Multi-Context Video Search
     Tìm video chứa nhiều ngữ cảnh/sự kiện khác nhau
     """
     
-    def __init__(self, faiss_service, es_service=None):
+    def __init__(self, faiss_service, es_service=None, scorer=None):
+        """
+        Args:
+            scorer: Hàm ranking cho multi_context_fusion, nhận các mảng theo video
+                (num_contexts, avg_score, max_score, num_frames) -> mảng điểm (default: default_ranking_score)
+        """
         self.faiss = faiss_service
         self.es = es_service
+        self.scorer = scorer or default_ranking_score
         
     def search_single_context(self, context: str, k: int = 100) -> List[Dict]:
         """
@@ -40,6 +73,20 @@ class MultiContextKIS:
             logger.error(f"Search error for context: {e}")
             return []
     
+    def search_contexts(self, contexts: List[str], k: int = 100) -> List[List[Dict]]:
+        """
+        Tìm kiếm nhiều contexts cùng lúc bằng text_search_batch.
+        Fallback về search từng context nếu batch lỗi.
+        """
+        try:
+            all_results = self.faiss.text_search_batch(contexts, k=k)
+            for context, results in zip(contexts, all_results):
+                logger.info(f"Context '{context[:50]}...' found {len(results)} results")
+            return all_results
+        except Exception as e:
+            logger.error(f"Batch search error, fallback to per-context search: {e}")
+            return [self.search_single_context(context, k=k) for context in contexts]
+
     def extract_video_id(self, imgpath: str) -> Optional[str]:
         """
         Extract video ID từ image path
@@ -53,127 +100,277 @@ class MultiContextKIS:
         except:
             return None
     
+    def frame_video_id(self, item: Dict) -> Optional[str]:
+        """
+        Video ID của 1 frame kết quả: tra frame catalog theo ID (O(1)),
+        fallback về parse imgpath nếu service không có catalog
+        """
+        catalog = getattr(self.faiss, 'catalog', None)
+        if catalog is not None and 'id' in item:
+            video_id = catalog.video(item['id'])
+            if video_id:
+                return video_id
+        return self.extract_video_id(item['imgpath'])
+
+    def search_arrays(self, contexts: List[str], k: int = 100):
+        """
+        Encode + FAISS search tất cả contexts trong 1 batch, giữ kết quả dạng mảng
+        Returns: (scores [n_contexts, k], ids [n_contexts, k]) hoặc None nếu encode lỗi
+        """
+        vectors = self.faiss.encode_texts(contexts)
+        if vectors is None:
+            return None
+        return self.faiss.search_vectors(vectors, k)
+
     def multi_context_fusion(
-        self, 
-        context_results: List[List[Dict]], 
+        self,
+        scores: np.ndarray,
+        ids: np.ndarray,
         k: int = 100,
-        min_contexts: int = 2
+        min_contexts: int = 2,
+        frames_per_video: int = 10
     ) -> List[Dict]:
         """
         Kết hợp kết quả từ nhiều contexts
-        
+
         Strategy: Tìm video xuất hiện trong NHIỀU contexts nhất
-        
+
+        Toàn bộ tính trên mảng (context x frame) thay vì dict theo video, nên search_k
+        vài nghìn frame / context vẫn chạy ở latency tương tác.
+
         Args:
-            context_results: List of results từ mỗi context [[ctx1_results], [ctx2_results], ...]
-            k: Số kết quả trả về
+            scores, ids: Kết quả FAISS [n_contexts, search_k] (xem search_arrays)
+            k: Số video trả về
             min_contexts: Video phải xuất hiện trong ít nhất bao nhiêu contexts
-        
+            frames_per_video: Số frame (điểm cao nhất) trả về cho mỗi video
+
         Returns:
-            List of videos ranked by số contexts matched và score
+            List frames của các video ranked theo self.scorer
         """
-        # Dictionary: video_id -> {contexts, frames, scores}
-        video_data = defaultdict(lambda: {
-            'contexts': set(),  # Các context nào video này xuất hiện
-            'frames': [],       # Tất cả frames
-            'scores': [],       # Tất cả scores
-            'context_frames': defaultdict(list)  # frames cho mỗi context
-        })
-        
-        # Thu thập data từ mỗi context
-        for context_idx, results in enumerate(context_results):
-            if not results:
-                continue
-                
-            for item in results:
-                video_id = self.extract_video_id(item['imgpath'])
-                if not video_id:
-                    continue
-                
-                video_data[video_id]['contexts'].add(context_idx)
-                video_data[video_id]['frames'].append(item)
-                video_data[video_id]['scores'].append(item.get('score', 0))
-                video_data[video_id]['context_frames'][context_idx].append(item)
-        
-        # Lọc videos có đủ min_contexts
-        qualified_videos = {
-            vid: data for vid, data in video_data.items()
-            if len(data['contexts']) >= min_contexts
-        }
-        
-        if not qualified_videos:
+        catalog = self.faiss.catalog
+        n_contexts = len(scores)
+
+        # Trải phẳng (context, frame) và bỏ ID không hợp lệ (-1 của FAISS)
+        context_idx = np.repeat(np.arange(n_contexts), scores.shape[1])
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        scores = np.asarray(scores, dtype=np.float64).ravel()
+        rows = catalog.rows(ids)
+        keep = rows >= 0
+        context_idx, ids, scores = context_idx[keep], ids[keep], scores[keep]
+        videos = catalog.video_codes[rows[keep]].astype(np.int64)
+        if len(ids) == 0:
+            return []
+
+        # Gom theo video, trong mỗi video frame có điểm cao đứng trước
+        order = np.lexsort((-scores, videos))
+        context_idx, ids, scores, videos = context_idx[order], ids[order], scores[order], videos[order]
+        starts = np.flatnonzero(np.r_[True, videos[1:] != videos[:-1]])
+        group_videos = videos[starts]
+
+        num_frames = np.diff(np.r_[starts, len(videos)])
+        avg_score = np.add.reduceat(scores, starts) / num_frames
+        max_score = scores[starts]
+        # Số contexts khác nhau của mỗi video = số cặp (video, context) unique
+        pairs = np.unique(videos * n_contexts + context_idx)
+        num_contexts = np.bincount(pairs // n_contexts, minlength=len(catalog.videos))[group_videos]
+
+        qualified = num_contexts >= min_contexts
+        if not qualified.any():
             logger.warning(f"No videos found with {min_contexts}+ contexts. Lowering threshold...")
             # Nếu không có video nào match đủ, giảm threshold
-            qualified_videos = {
-                vid: data for vid, data in video_data.items()
-                if len(data['contexts']) >= 1
+            qualified = num_contexts >= 1
+
+        ranking_score = np.where(
+            qualified, self.scorer(num_contexts, avg_score, max_score, num_frames), -np.inf
+        )
+
+        n_qualified = int(qualified.sum())
+        logger.info(f"Multi-context fusion: {n_qualified} videos qualified")
+
+        top_k = min(k, n_qualified)
+        top = np.argpartition(-ranking_score, top_k - 1)[:top_k]
+        top = top[np.argsort(-ranking_score[top], kind="stable")]
+
+        # Top frames_per_video frame của mỗi video, format 1 lần cho tất cả
+        counts = np.minimum(num_frames[top], frames_per_video)
+        take = np.concatenate([np.arange(starts[g], starts[g] + n) for g, n in zip(top, counts)])
+        frames = catalog.format_results(scores[take], ids[take])
+
+        final_results = []
+        frame_iter = iter(frames)
+        for g, n in zip(top.tolist(), counts.tolist()):
+            video_info = {
+                'video_id': str(catalog.videos[group_videos[g]]),
+                'multi_context_score': float(ranking_score[g]),
+                'contexts_matched': int(num_contexts[g]),
+                'coverage': int(num_contexts[g]) / n_contexts,
+                'is_multi_context': True
             }
-        
-        # Tính ranking score cho mỗi video
-        ranked_videos = []
-        for video_id, data in qualified_videos.items():
-            num_contexts = len(data['contexts'])
-            avg_score = sum(data['scores']) / len(data['scores']) if data['scores'] else 0
-            max_score = max(data['scores']) if data['scores'] else 0
-            num_frames = len(data['frames'])
-            
-            # Ranking formula: 
-            # - Ưu tiên video có nhiều contexts
-            # - Sau đó ưu tiên score cao
-            # - Cuối cùng ưu tiên nhiều frames (evidence)
-            ranking_score = (
-                num_contexts * 1000 +  # Contexts là quan trọng nhất
-                avg_score * 100 +      # Avg score
-                num_frames * 1        # Số lượng frames (evidence)
-            )
-            
-            # Lấy best frame từ mỗi context
-            context_best_frames = {}
-            for ctx_idx, frames in data['context_frames'].items():
-                best_frame = max(frames, key=lambda x: x.get('score', 0))
-                context_best_frames[ctx_idx] = best_frame
-            
-            ranked_videos.append({
-                'video_id': video_id,
-                'ranking_score': ranking_score,
-                'num_contexts_matched': num_contexts,
-                'total_contexts': len(context_results),
-                'coverage': num_contexts / len(context_results),
-                'avg_score': avg_score,
-                'max_score': max_score,
-                'num_frames': num_frames,
-                'all_frames': sorted(data['frames'], key=lambda x: x.get('score', 0), reverse=True),
-                'context_best_frames': context_best_frames,
-                'matched_contexts': list(data['contexts'])
+            for _ in range(n):
+                frame = next(frame_iter)
+                frame.update(video_info)
+                final_results.append(frame)
+
+        return final_results
+
+    def video_level_fusion(
+        self,
+        contexts: List[str],
+        k: int = 100,
+        search_k: int = 100,
+        min_contexts: int = 2,
+        match_top: int = 50,
+        frames_per_video: int = 10
+    ) -> List[Dict]:
+        """
+        Fusion trên TOÀN BỘ video thay vì top search_k frame của mỗi context:
+        mỗi context được chấm điểm với mọi video trong 1 lần (max trên mọi frame của video,
+        hoặc embedding max-pool của video), nên video có frame khớp xếp hạng 101+ không bị bỏ sót.
+
+        Args:
+            match_top: Context được tính là "match" video nếu video nằm trong top match_top video của context
+            frames_per_video: Số frame trả về cho mỗi video
+        """
+        vectors = self.faiss.encode_texts(contexts)
+        video_scores, grouped = self.faiss.video_scores(vectors)
+        n_contexts, n_videos = video_scores.shape
+        video_index = self.faiss.video_index
+
+        # Ma trận context x video: video có nằm trong top match_top của context không
+        match_top = min(match_top, n_videos)
+        top_videos = np.argpartition(-video_scores, match_top - 1, axis=1)[:, :match_top]
+        matched = np.zeros(video_scores.shape, dtype=bool)
+        np.put_along_axis(matched, top_videos, True, axis=1)
+
+        num_contexts = matched.sum(axis=0)
+        avg_score = video_scores.mean(axis=0)
+        max_score = video_scores.max(axis=0)
+        # Mọi frame đều đã được chấm điểm, không có tập frame hit làm evidence như mức frame
+        num_frames = np.zeros(n_videos, dtype=np.int64)
+
+        qualified = num_contexts >= min_contexts
+        if not qualified.any():
+            logger.warning(f"No videos found with {min_contexts}+ contexts. Lowering threshold...")
+            qualified = num_contexts >= 1
+
+        ranking_score = np.where(
+            qualified, self.scorer(num_contexts, avg_score, max_score, num_frames), -np.inf
+        )
+        order = np.argsort(-ranking_score)[:min(k, int(qualified.sum()))]
+
+        logger.info(f"Video-level fusion: {int(qualified.sum())}/{n_videos} videos qualified")
+
+        # Không có điểm từng frame (chỉ có video pool): lấy frame từ FAISS search của từng context
+        frame_hits = None
+        if grouped is None:
+            frame_hits = defaultdict(list)
+            for results in self.search_contexts(contexts, k=search_k):
+                for item in results:
+                    frame_hits[self.frame_video_id(item)].append(item)
+
+        final_results = []
+        for code in order:
+            video_id = str(video_index.videos[code])
+            if grouped is not None:
+                frames = self._best_video_frames(code, grouped, frames_per_video)
+            else:
+                frames = sorted(frame_hits.get(video_id, []), key=lambda x: x.get('score', 0), reverse=True)
+                frames = frames[:frames_per_video] or self.faiss.catalog.format_results(
+                    [video_scores[:, code].max()], video_index.frames_of(video_id)[:1]
+                )
+
+            for frame in frames:
+                frame.update({
+                    'video_id': video_id,
+                    'multi_context_score': float(ranking_score[code]),
+                    'contexts_matched': int(num_contexts[code]),
+                    'coverage': int(num_contexts[code]) / n_contexts,
+                    'is_multi_context': True
+                })
+                final_results.append(frame)
+
+        return final_results
+
+    def temporal_fusion(
+        self,
+        contexts: List[str],
+        k: int = 100,
+        search_k: int = 1000,
+        window_seconds: float = 60.0
+    ) -> List[Dict]:
+        """
+        Fusion theo thứ tự thời gian: contexts là chuỗi sự kiện, context i xảy ra trước context i+1.
+        Mỗi video lấy chuỗi frame tốt nhất (1 frame / context, đúng thứ tự, 2 frame liên tiếp
+        cách nhau không quá window_seconds), xếp hạng video theo tổng điểm của chuỗi.
+
+        Args:
+            search_k: Số frame candidate cho mỗi context (từ FAISS search)
+            window_seconds: Khoảng cách tối đa giữa 2 sự kiện liên tiếp (đổi ra số frame theo fps của video)
+        """
+        catalog = self.faiss.catalog
+        video_index = self.faiss.video_index
+
+        searched = self.search_arrays(contexts, k=search_k)
+        if searched is None:
+            return []
+        scores, ids = searched
+
+        candidates = []
+        for context_scores, context_ids in zip(scores, ids):
+            rows = catalog.rows(context_ids)
+            keep = rows >= 0
+            rows = rows[keep]
+            candidates.append({
+                "video": catalog.video_codes[rows],
+                "frame": catalog.frames[rows],
+                "score": context_scores[keep],
+                "id": context_ids[keep]
             })
-        
-        # Sort by ranking_score
-        ranked_videos.sort(key=lambda x: x['ranking_score'], reverse=True)
-        
-        logger.info(f"Multi-context fusion: {len(ranked_videos)} videos qualified")
-        
-        # Flatten về format cũ (list of frames) nhưng ưu tiên video tốt
+
+        window = np.round(video_fps(video_index) * window_seconds).astype(np.int64)
+        codes, chain_scores, chain_ids, frame_scores = best_ordered_chains(candidates, window)
+
+        logger.info(f"Temporal fusion: {len(codes)} videos có chuỗi đủ {len(contexts)} contexts theo thứ tự")
+
         final_results = []
-        for video_info in ranked_videos[:k]:
-            # Thêm metadata vào từng frame
-            for frame in video_info['all_frames'][:10]:  # Top 10 frames/video
-                final_results.append({
-                    **frame,
-                    'video_id': video_info['video_id'],
-                    'multi_context_score': video_info['ranking_score'],
-                    'contexts_matched': video_info['num_contexts_matched'],
-                    'coverage': video_info['coverage'],
+        for code, chain_score, frame_ids, chain_frame_scores in zip(codes[:k], chain_scores[:k], chain_ids[:k], frame_scores[:k]):
+            frames = catalog.format_results(chain_frame_scores, frame_ids)
+            for context_idx, frame in enumerate(frames):
+                frame.update({
+                    'video_id': str(video_index.videos[code]),
+                    'multi_context_score': float(chain_score),
+                    'contexts_matched': len(contexts),
+                    'coverage': 1.0,
+                    'context_index': context_idx,
                     'is_multi_context': True
                 })
-        
+                final_results.append(frame)
+
         return final_results
-    
+
+    def _best_video_frames(self, code: int, grouped: np.ndarray, limit: int) -> List[Dict]:
+        """Frame tốt nhất của mỗi context trong video trước, sau đó các frame có điểm cao nhất"""
+        video_index = self.faiss.video_index
+        frame_slice = video_index.frame_slice(code)
+        segment = grouped[:, frame_slice]          # [n_contexts, n_frames_of_video]
+        best = segment.max(axis=0)
+
+        picks = list(dict.fromkeys(segment.argmax(axis=1).tolist()))
+        picks += [i for i in np.argsort(-best)[:limit].tolist() if i not in picks]
+        picks = [i for i in picks[:limit] if np.isfinite(best[i])]
+
+        ids = video_index.frame_ids[frame_slice][picks]
+        return self.faiss.catalog.format_results(best[picks], ids)
+
     def search_multi_context(
         self, 
         contexts: List[str], 
         k: int = 100,
         search_k: int = 100,
-        min_contexts: Optional[int] = None
+        min_contexts: Optional[int] = None,
+        mode: str = "auto",
+        window_seconds: float = 60.0,
+        temporal_k: int = 1000
     ) -> List[Dict]:
         """
         Main API: Tìm kiếm với nhiều contexts
@@ -183,6 +380,12 @@ class MultiContextKIS:
             k: Số kết quả cuối cùng
             search_k: Số kết quả cho mỗi context search
             min_contexts: Tối thiểu bao nhiêu contexts phải match (default: len(contexts))
+            mode: "frame" (fusion trên top search_k frame mỗi context),
+                  "video" (chấm điểm mọi video, xem video_level_fusion),
+                  "temporal" (contexts là chuỗi sự kiện theo thứ tự, xem temporal_fusion),
+                  "auto" (video nếu service hỗ trợ, ngược lại frame)
+            window_seconds: Mode temporal - khoảng cách tối đa giữa 2 sự kiện liên tiếp
+            temporal_k: Mode temporal - số frame candidate cho mỗi context
         
         Returns:
             Ranked list of frames từ videos tốt nhất
@@ -196,30 +399,30 @@ class MultiContextKIS:
         
         logger.info(f"Multi-context search with {len(valid_contexts)} contexts")
         
-        # Search từng context
-        all_results = []
-        for idx, context in enumerate(valid_contexts):
-            logger.info(f"Searching context {idx+1}/{len(valid_contexts)}: {context[:50]}...")
-            results = self.search_single_context(context, k=search_k)
-            all_results.append(results)
-        
-        # Nếu chỉ có 1 context, return luôn
-        if len(valid_contexts) == 1:
-            return all_results[0][:k]
-        
         # Fusion nhiều contexts
         if min_contexts is None:
             # Default: Yêu cầu match ít nhất 2 contexts (hoặc tất cả nếu có 2)
             min_contexts = min(2, len(valid_contexts))
-        
-        fused_results = self.multi_context_fusion(
-            all_results, 
-            k=k,
-            min_contexts=min_contexts
-        )
-        
-        return fused_results
-    
+
+        if mode == "temporal" and len(valid_contexts) > 1:
+            return self.temporal_fusion(valid_contexts, k=k, search_k=temporal_k, window_seconds=window_seconds)
+        if mode == "auto":
+            mode = "video" if self.faiss.can_score_videos() else "frame"
+        if mode == "video" and len(valid_contexts) > 1:
+            return self.video_level_fusion(valid_contexts, k=k, search_k=search_k, min_contexts=min_contexts)
+
+        # Search tất cả contexts trong 1 batch (1 lần encode + 1 lần FAISS search)
+        searched = self.search_arrays(valid_contexts, k=search_k)
+        if searched is None:
+            return []
+        scores, ids = searched
+
+        # Nếu chỉ có 1 context, return luôn
+        if len(valid_contexts) == 1:
+            return self.faiss.catalog.format_results(scores[0][:k], ids[0][:k])
+
+        return self.multi_context_fusion(scores, ids, k=k, min_contexts=min_contexts)
+
     def get_video_summary(self, results: List[Dict]) -> List[Dict]:
         """
         Tạo summary theo video (để hiển thị)
@@ -242,7 +445,7 @@ class MultiContextKIS:
         })
         
         for item in results:
-            video_id = item.get('video_id') or self.extract_video_id(item['imgpath'])
+            video_id = item.get('video_id') or self.frame_video_id(item)
             if not video_id:
                 continue
             
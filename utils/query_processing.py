@@ -2,19 +2,86 @@ from pyvi import ViUtils, ViTokenizer
 from deep_translator import GoogleTranslator
 from translate import Translator as TranslateTranslator
 from difflib import SequenceMatcher
-from langdetect import detect
+from langdetect import detect, DetectorFactory
 import underthesea
 from transformers import BertModel, BertTokenizer
 import torch
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
+import time
+import logging
+from functools import lru_cache
+
+from utils.cache import LRUCache, SqliteStore
+
+logger = logging.getLogger(__name__)
+
+# langdetect mặc định có yếu tố ngẫu nhiên, cố định seed để kết quả ổn định (và memoize được)
+DetectorFactory.seed = 0
+
+@lru_cache(maxsize=4096)
+def detect_language(text):
+    """langdetect.detect có memoize: query lặp lại không phải detect lại"""
+    return detect(text)
+
+class MarianTranslator():
+    """
+    Backend dịch offline bằng MarianMT (Helsinki-NLP/opus-mt-*) qua transformers.
+    Model được load + chạy thử ngay khi khởi tạo, chỉ từ đĩa (thư mục model hoặc HF cache đã tải sẵn):
+    backend này được dùng đúng lúc mất mạng nên không thể tải model vào lúc đó.
+    """
+    def __init__(self, model_name='Helsinki-NLP/opus-mt-vi-en', device='cpu'):
+        """
+        Args:
+            model_name: Thư mục model local (vd data/models/opus-mt-vi-en) hoặc tên model đã có trong HF cache
+        Raises: OSError nếu model không có sẵn trên đĩa
+        """
+        from transformers import MarianMTModel, MarianTokenizer
+        self.model_name = model_name
+        self.device = device
+
+        logger.info(f"Loading offline translator: {model_name}")
+        self.tokenizer = MarianTokenizer.from_pretrained(model_name, local_files_only=True)
+        self.model = MarianMTModel.from_pretrained(model_name, local_files_only=True).to(device).eval()
+        self('xin chào')  # Warm up: lần dịch thật đầu tiên không phải chờ khởi tạo
+
+    def __call__(self, text):
+        with torch.no_grad():
+            tokens = self.tokenizer([text], return_tensors='pt', truncation=True).to(self.device)
+            output = self.model.generate(**tokens, max_new_tokens=128)
+        return self.tokenizer.decode(output[0], skip_special_tokens=True)
+
+OFFLINE_BACKENDS = {
+    'marian': MarianTranslator,
+}
 
 class Translation():
-    def __init__(self, from_lang='vi', to_lang='en', mode='google'):
+    def __init__(self, from_lang='vi', to_lang='en', mode='google', cache_size=4096, cache_path=None, offline_backend=None,
+                 offline_model=None, offline_cooldown=30.0):
         # The class Translation is a wrapper for the two translation libraries, deep-translator and translate. 
+        # cache_size / cache_path: cache bản dịch trong RAM + SQLite (key = text đã lowercase)
+        # offline_backend: tên trong OFFLINE_BACKENDS hoặc callable(text) -> str, dùng khi mất mạng
+        # offline_model: đường dẫn model local cho backend offline (không có trên đĩa thì tắt backend)
+        # offline_cooldown: sau 1 lần dịch online lỗi, dùng thẳng backend offline trong bấy nhiêu giây
+        #   (mất mạng thì mỗi query không phải chờ hết timeout online)
         self.__mode = mode
         self.__from_lang = from_lang
         self.__to_lang = to_lang
+        self.__namespace = f"{from_lang}->{to_lang}"
+
+        self.cache = LRUCache(maxsize=cache_size)
+        self.store = SqliteStore(cache_path, table="translations") if cache_path else None
+
+        if isinstance(offline_backend, str):
+            name = offline_backend
+            try:
+                offline_backend = OFFLINE_BACKENDS[name](offline_model) if offline_model else OFFLINE_BACKENDS[name]()
+            except Exception as e:
+                logger.warning(f"Không load được backend dịch offline '{name}' ({offline_model}): {e}. Tắt dịch offline.")
+                offline_backend = None
+        self.offline_backend = offline_backend
+        self.offline_cooldown = offline_cooldown
+        self._online_retry_at = 0.0  # time.monotonic() mà từ đó mới thử dịch online lại
 
         if mode == 'google':
             self.translator = GoogleTranslator(source=from_lang, target=to_lang)
@@ -24,13 +91,53 @@ class Translation():
     def preprocessing(self, text):
         return text.lower()
 
-    def __call__(self, text):
-        text = self.preprocessing(text)
+    def translate_online(self, text):
         if self.__mode == 'google':
             return self.translator.translate(text)
         elif self.__mode == 'translate':
             return self.translator.translate(text)
 
+    def __call__(self, text):
+        text = self.preprocessing(text)
+
+        # 1. Cache RAM -> 2. Cache SQLite
+        result = self.cache.get(text)
+        if result is not None:
+            return result
+        if self.store is not None:
+            try:
+                blob = self.store.get(self.__namespace, text)
+            except Exception as e:
+                logger.warning(f"Không đọc được translation cache trên đĩa: {e}")
+                blob = None
+            if blob is not None:
+                result = blob.decode('utf-8')
+                self.cache.set(text, result)
+                return result
+
+        # 3. Dịch online, lỗi mạng thì dùng backend offline (bản dịch offline không được cache)
+        if self.offline_backend is not None and time.monotonic() < self._online_retry_at:
+            return self.offline_backend(text)
+        try:
+            result = self.translate_online(text)
+        except Exception as e:
+            if self.offline_backend is None:
+                raise
+            logger.warning(f"Online translation failed ({e}), using offline backend for {self.offline_cooldown:.0f}s")
+            self._online_retry_at = time.monotonic() + self.offline_cooldown
+            return self.offline_backend(text)
+
+        self.cache.set(text, result)
+        if self.store is not None:
+            try:
+                self.store.set(self.__namespace, text, result.encode('utf-8'))
+            except Exception as e:
+                logger.warning(f"Không ghi được translation cache xuống đĩa: {e}")
+        return result
+
+    def cache_stats(self):
+        return self.cache.stats()
+
 class Text_Preprocessing():
     def __init__(self, stopwords_path='./dict/vietnamese-stopwords-dash.txt'):
         with open(stopwords_path, 'rb') as f:
@@ -0,0 +1,131 @@
+"""
+ResultStore: cache kết quả search phía server để phân trang không phải search lại.
+
+- Mỗi bộ kết quả có result_set id = hash của (loại search, tham số), nên trang Jinja
+  với cùng query (chỉ khác ?page=) dùng lại kết quả đã có thay vì encode + FAISS + LLM lại
+- JSON API lấy các trang tiếp theo bằng result_set + cursor (vị trí bắt đầu)
+- Giới hạn số bộ kết quả (LRU) + TTL, hết hạn thì client phải search lại
+- Kết quả tạm (ShortLived, vd LLM timeout -> search bằng query gốc) chỉ được cache fallback_ttl giây
+"""
+
+import json
+import asyncio
+import hashlib
+import logging
+
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def result_set_id(search_type, params):
+    """Id ổn định cho 1 bộ kết quả: cùng loại search + cùng tham số -> cùng id"""
+    signature = json.dumps({"type": search_type, **params}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(signature.encode('utf-8')).hexdigest()[:16]
+
+
+class ShortLived:
+    """Kết quả search bằng đường dự phòng: vẫn trả về cho request nhưng chỉ cache ngắn hạn"""
+
+    def __init__(self, results):
+        self.results = results
+
+
+class ResultStore:
+    def __init__(self, maxsize=256, ttl=600, fallback_ttl=30, wait_timeout=30):
+        """
+        Args:
+            maxsize: Số bộ kết quả tối đa giữ trong RAM
+            ttl: Thời gian sống (giây) của mỗi bộ kết quả
+            fallback_ttl: Thời gian sống (giây) của kết quả ShortLived (0 = không cache)
+            wait_timeout: Thời gian tối đa (giây) chờ lần search trùng tham số đang chạy, quá hạn thì tự search
+        """
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.fallback_ttl = fallback_ttl
+        self.wait_timeout = wait_timeout
+        self._inflight = {}  # result_set -> asyncio.Future của lần search đang chạy
+
+    def get(self, result_set):
+        return self.cache.get(result_set)
+
+    async def get_or_search(self, search_type, params, search_fn):
+        """
+        Lấy kết quả từ cache, chưa có thì chạy search_fn (coroutine function) rồi lưu lại.
+        Nhiều request cùng tham số đến cùng lúc chỉ chạy search 1 lần; request chờ quá wait_timeout
+        hoặc request đang search bị hủy thì các request chờ tự search.
+
+        Args:
+            search_fn: Trả về list kết quả, ShortLived(list) (cache fallback_ttl giây) hoặc None (không cache)
+        Returns: (result_set, results)
+        """
+        result_set = result_set_id(search_type, params)
+        results = self.cache.get(result_set)
+        if results is not None:
+            return result_set, results
+
+        inflight = self._inflight.get(result_set)
+        if inflight is not None:
+            try:
+                return result_set, await asyncio.wait_for(asyncio.shield(inflight), self.wait_timeout)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # Chính request này bị hủy
+                logger.warning(f"Search {result_set} đang chạy bị hủy, tự search lại")
+            except asyncio.TimeoutError:
+                logger.warning(f"Chờ search {result_set} quá {self.wait_timeout}s, tự search lại")
+            return result_set, self._store(result_set, await search_fn())
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[result_set] = future
+        try:
+            results = self._store(result_set, await search_fn())
+            future.set_result(results)
+            return result_set, results
+        except Exception as e:
+            future.set_exception(e)
+            # Tránh warning "exception never retrieved" khi không có request nào chờ
+            future.exception()
+            raise
+        except BaseException:
+            # Request bị hủy (client ngắt kết nối...): báo cho các request đang chờ để chúng tự search
+            future.cancel()
+            raise
+        finally:
+            if self._inflight.get(result_set) is future:
+                del self._inflight[result_set]
+
+    def _store(self, result_set, results):
+        """Lưu kết quả theo TTL phù hợp, trả về list kết quả (đã bỏ lớp ShortLived)"""
+        if isinstance(results, ShortLived):
+            results = results.results
+            if results is not None and self.fallback_ttl:
+                self.cache.set(result_set, results, ttl=self.fallback_ttl)
+        elif results is not None:
+            self.cache.set(result_set, results)
+        return results
+
+    def page(self, result_set, cursor=0, limit=100, results=None):
+        """
+        1 trang của bộ kết quả bắt đầu từ cursor.
+
+        Args:
+            results: Kết quả đã có sẵn (vừa search xong), None = đọc từ cache
+        Returns: dict {result_set, items, cursor, next_cursor, total} hoặc None nếu đã hết hạn
+        """
+        if results is None:
+            results = self.cache.get(result_set)
+        if results is None:
+            return None
+
+        cursor = max(0, cursor)
+        end = cursor + limit
+        return {
+            "result_set": result_set,
+            "items": results[cursor:end],
+            "cursor": cursor,
+            "next_cursor": end if end < len(results) else None,
+            "total": len(results)
+        }
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,186 @@
+"""
+Bộ lọc search theo tập video: chỉ xếp hạng CLIP trong các video / batch / khoảng ngày đã biết.
+
+Bộ lọc (dict, JSON được nên dùng luôn làm key cache kết quả):
+    {"video_ids": ["L01_V003"], "groups": ["L01", "L02"], "date_from": "2023-10-01", "date_to": "2023-10-31",
+     "frame_range": (lo, hi)}
+- video_ids / groups / ngày publish (data/metadata/<video>.json, "publish_date": "31/10/2023") giao nhau
+  thành 1 tập video code của VideoIndex
+- frame_range: số frame trong video thuộc [lo, hi]
+
+Tập video được đổi thành các khoảng frame ID liên tiếp [lo, hi] (frame của 1 video gom liền nhau trong
+VideoIndex), FAISS chỉ quét các khoảng đó:
+- Có ma trận vector thô (flat / npy / vector rerank): nhân trực tiếp trên các dòng trong khoảng (search_ranges)
+- Index IVF / HNSW / SQ: faiss.IDSelector qua SearchParameters (id_selector, search_parameters)
+"""
+
+import os
+import json
+import logging
+from datetime import date, datetime
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_publish_dates = {}
+
+
+def parse_date(value):
+    """"31/10/2023" (metadata) hoặc "2023-10-31" (query param) -> date, None nếu rỗng / sai định dạng"""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def publish_dates(video_index, metadata_dir="data/metadata"):
+    """Ngày publish (date.toordinal()) của từng video theo thứ tự video code, -1 nếu không có metadata"""
+    key = (id(video_index), metadata_dir)
+    if key not in _publish_dates:
+        ordinals = np.full(len(video_index), -1, dtype=np.int64)
+        for code, video in enumerate(video_index.video_list):
+            path = os.path.join(metadata_dir, f"{video}.json")
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                published = parse_date(json.load(f).get("publish_date"))
+            if published is not None:
+                ordinals[code] = published.toordinal()
+        _publish_dates[key] = ordinals
+    return _publish_dates[key]
+
+
+def _split(value):
+    """"L01,L02" | ["L01", "L02"] -> ["L01", "L02"]"""
+    if not value:
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    return [item.strip() for item in items if item and item.strip()]
+
+
+def parse_filters(video=None, group=None, date_from=None, date_to=None):
+    """
+    Query param -> bộ lọc, None nếu không lọc gì.
+
+    Args:
+        video: "L01_V001,L01_V002"
+        group: "L01,L02"
+        date_from, date_to: "YYYY-MM-DD" hoặc "dd/mm/YYYY"
+    """
+    filters = {}
+    if _split(video):
+        filters["video_ids"] = _split(video)
+    if _split(group):
+        filters["groups"] = _split(group)
+    for name, value in (("date_from", date_from), ("date_to", date_to)):
+        parsed = parse_date(value)
+        if value and parsed is None:
+            raise ValueError(f"Ngày không hợp lệ: {name}={value}")
+        if parsed is not None:
+            filters[name] = parsed.isoformat()
+    return filters or None
+
+
+def select_videos(video_index, filters, metadata_dir="data/metadata"):
+    """Video code (tăng dần) thỏa mọi điều kiện của bộ lọc"""
+    mask = np.ones(len(video_index), dtype=bool)
+    if filters.get("video_ids"):
+        mask &= np.isin(video_index.videos.astype(str), filters["video_ids"])
+    if filters.get("groups"):
+        groups = np.array([video.split("_")[0] for video in video_index.video_list])
+        mask &= np.isin(groups, filters["groups"])
+
+    date_from, date_to = parse_date(filters.get("date_from")), parse_date(filters.get("date_to"))
+    if date_from or date_to:
+        ordinals = publish_dates(video_index, metadata_dir)
+        mask &= ordinals >= 0  # Video không có ngày publish bị loại khi lọc theo ngày
+        if date_from:
+            mask &= ordinals >= date_from.toordinal()
+        if date_to:
+            mask &= ordinals <= date_to.toordinal()
+    return np.flatnonzero(mask)
+
+
+def frame_id_ranges(video_index, codes, frame_range=None):
+    """
+    Các khoảng frame ID liên tiếp [lo, hi] (int64 [m, 2], đã sort) phủ đúng các frame của `codes`.
+
+    Args:
+        frame_range: (lo, hi) số frame trong video, None = mọi frame
+    """
+    if len(codes) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    slices = [video_index.frame_slice(code) for code in codes.tolist()]
+    ids = np.concatenate([video_index.frame_ids[s] for s in slices]).astype(np.int64)
+    if frame_range is not None:
+        numbers = np.concatenate([video_index.frame_numbers[s] for s in slices])
+        ids = ids[(numbers >= frame_range[0]) & (numbers <= frame_range[1])]
+    if len(ids) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    ids = np.sort(ids)
+    breaks = np.flatnonzero(np.diff(ids) != 1)
+    starts = np.concatenate(([ids[0]], ids[breaks + 1]))
+    ends = np.concatenate((ids[breaks], [ids[-1]]))
+    return np.stack([starts, ends], axis=1)
+
+
+def range_rows(ranges):
+    """[[lo, hi], ...] -> mọi frame ID trong các khoảng"""
+    return np.concatenate([np.arange(lo, hi + 1, dtype=np.int64) for lo, hi in ranges.tolist()])
+
+
+def id_selector(ranges):
+    """faiss.IDSelector cho các khoảng frame ID (1 khoảng -> IDSelectorRange, nhiều khoảng -> IDSelectorBatch)"""
+    if len(ranges) == 1:
+        return faiss.IDSelectorRange(int(ranges[0, 0]), int(ranges[0, 1]) + 1)
+    rows = range_rows(ranges)
+    return faiss.IDSelectorBatch(len(rows), faiss.swig_ptr(rows))
+
+
+def search_parameters(index, selector):
+    """SearchParameters có selector, giữ nguyên nprobe / efSearch đang set trên index"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_ranges(xb, queries, k, ranges, chunk_size=65536):
+    """
+    Brute-force inner product chỉ trên các dòng của xb thuộc `ranges` (theo chunk, float16 được đổi từng chunk).
+    Returns: (scores [n, k], ids [n, k]), pad -inf / -1 nếu tập con có ít hơn k frame
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    if len(ranges) == 0:
+        return scores, ids
+
+    rows = range_rows(ranges)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        if chunk[-1] - chunk[0] == len(chunk) - 1:
+            block = xb[chunk[0]:chunk[-1] + 1]  # Khoảng liền: slice, không gather
+        else:
+            block = xb[chunk]
+        block = np.ascontiguousarray(block, dtype=np.float32)
+        block_scores, block_ids = faiss.knn(queries, block, min(k, len(block)), metric=faiss.METRIC_INNER_PRODUCT)
+
+        # Gộp với top-k hiện tại
+        merged_scores = np.concatenate([scores, block_scores], axis=1)
+        merged_ids = np.concatenate([ids, chunk[block_ids]], axis=1)
+        top = np.argsort(-merged_scores, axis=1, kind="stable")[:, :k]
+        scores = np.take_along_axis(merged_scores, top, axis=1)
+        ids = np.take_along_axis(merged_ids, top, axis=1)
+    return scores, ids
@@ -0,0 +1,136 @@
+"""
+Temporal fusion cho multi-context KIS: context 1 xảy ra TRƯỚC context 2, context 2 trước context 3...
+
+Với mỗi video tìm chuỗi frame (1 frame / context) đúng thứ tự thời gian, 2 frame liên tiếp
+cách nhau không quá `window` frame, sao cho tổng điểm lớn nhất.
+
+Quy hoạch động chạy vectorized trên mảng candidate của từng context:
+    best[c][j] = score[c][j] + max{ best[c-1][i] : cùng video, frame_j - window <= frame_i < frame_j }
+Candidate của context trước được sort theo khóa (video, frame) nên tập i hợp lệ là 1 đoạn liên tiếp
+(tìm bằng searchsorted), max trên đoạn dùng sparse table -> O(n log n), không có vòng lặp Python
+theo từng cặp frame.
+"""
+
+import json
+import os
+
+import numpy as np
+
+_FRAME_BITS = 32
+
+
+class SparseTableMax:
+    """Range-max query O(1) trên mảng tĩnh, trả về cả vị trí của max"""
+
+    def __init__(self, values):
+        self.levels = [np.asarray(values)]
+        self.argmax = [np.arange(len(values))]
+        span = 1
+        while span * 2 <= len(values):
+            prev, prev_arg = self.levels[-1], self.argmax[-1]
+            left, right = prev[:-span], prev[span:]
+            take_right = right > left
+            self.levels.append(np.where(take_right, right, left))
+            self.argmax.append(np.where(take_right, prev_arg[span:], prev_arg[:-span]))
+            span *= 2
+
+    def query(self, lo, hi):
+        """Max trên đoạn [lo, hi] (inclusive, lo <= hi). Returns: (values, positions)"""
+        level = np.floor(np.log2(hi - lo + 1)).astype(np.int64)
+        values = np.empty(len(lo), dtype=self.levels[0].dtype)
+        positions = np.empty(len(lo), dtype=np.int64)
+        for k in np.unique(level):
+            mask = level == k
+            left, right = lo[mask], hi[mask] - (1 << k) + 1
+            left_val, right_val = self.levels[k][left], self.levels[k][right]
+            take_right = right_val > left_val
+            values[mask] = np.where(take_right, right_val, left_val)
+            positions[mask] = np.where(take_right, self.argmax[k][right], self.argmax[k][left])
+        return values, positions
+
+
+def best_ordered_chains(candidates, window, min_gap=1):
+    """
+    Args:
+        candidates: List theo thứ tự context, mỗi phần tử là dict mảng cùng độ dài:
+            {"video": int video code, "frame": int số frame, "score": float, "id": frame ID}
+        window: Khoảng cách tối đa (số frame) giữa 2 context liên tiếp, scalar hoặc mảng theo video code
+        min_gap: Khoảng cách tối thiểu (frame) giữa 2 context liên tiếp
+    Returns:
+        (video_codes [n], chain_scores [n], chain_ids [n, n_contexts], frame_scores [n, n_contexts])
+        sort theo tổng điểm giảm dần, mỗi video 1 chuỗi tốt nhất
+    """
+    window = np.asarray(window)
+
+    # Sort candidate của từng context theo (video, frame)
+    ordered = []
+    for cand in candidates:
+        keys = (cand["video"].astype(np.int64) << _FRAME_BITS) | cand["frame"].astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        sorted_cand = {name: np.asarray(values)[order] for name, values in cand.items()}
+        sorted_cand["key"] = keys[order]
+        ordered.append(sorted_cand)
+
+    best = ordered[0]["score"].astype(np.float64)
+    back = []
+    for cur, prev in zip(ordered[1:], ordered[:-1]):
+        video = cur["video"].astype(np.int64)
+        frame = cur["frame"].astype(np.int64)
+        win = window[cur["video"]] if window.ndim else window
+
+        lo_key = (video << _FRAME_BITS) | np.maximum(frame - win, 0).astype(np.int64)
+        hi_key = (video << _FRAME_BITS) | np.maximum(frame - min_gap, 0)
+        lo = np.searchsorted(prev["key"], lo_key, side="left")
+        hi = np.searchsorted(prev["key"], hi_key, side="right") - 1
+        # frame - min_gap < 0 thì không có frame nào trước đó
+        valid = (lo <= hi) & (frame - min_gap >= 0)
+
+        new_best = np.full(len(frame), -np.inf)
+        pointer = np.full(len(frame), -1, dtype=np.int64)
+        if valid.any() and len(best):
+            table = SparseTableMax(best)
+            prev_best, prev_pos = table.query(lo[valid], hi[valid])
+            new_best[valid] = cur["score"][valid] + prev_best
+            pointer[valid] = prev_pos
+        best = new_best
+        back.append(pointer)
+
+    last = ordered[-1]
+    complete = np.isfinite(best)
+    if not complete.any():
+        empty = np.zeros((0, len(candidates)))
+        return np.zeros(0, np.int64), np.zeros(0), empty.astype(np.int64), empty
+
+    # Chuỗi tốt nhất của mỗi video: sort theo (video, -score), lấy phần tử đầu của mỗi video
+    idx = np.flatnonzero(complete)
+    idx = idx[np.lexsort((-best[idx], last["video"][idx]))]
+    first = np.ones(len(idx), dtype=bool)
+    first[1:] = last["video"][idx][1:] != last["video"][idx][:-1]
+    idx = idx[first]
+
+    # Backtrack vectorized cho tất cả video cùng lúc
+    chain_pos = np.empty((len(idx), len(candidates)), dtype=np.int64)
+    chain_pos[:, -1] = idx
+    for c in range(len(candidates) - 1, 0, -1):
+        chain_pos[:, c - 1] = back[c - 1][chain_pos[:, c]]
+
+    chain_ids = np.stack([ordered[c]["id"][chain_pos[:, c]] for c in range(len(candidates))], axis=1)
+    frame_scores = np.stack([ordered[c]["score"][chain_pos[:, c]] for c in range(len(candidates))], axis=1)
+    scores = best[idx]
+    rank = np.argsort(-scores, kind="stable")
+    return last["video"][idx][rank], scores[rank], chain_ids[rank], frame_scores[rank]
+
+
+_fps_cache = {}
+
+
+def video_fps(video_index, fps_path="data/index/fps.json", default=25.0):
+    """FPS của từng video theo thứ tự video code (data/index/fps.json), thiếu thì dùng default"""
+    key = (id(video_index), fps_path)
+    if key not in _fps_cache:
+        fps_map = {}
+        if os.path.exists(fps_path):
+            with open(fps_path, 'r', encoding='utf-8') as f:
+                fps_map = json.load(f)
+        _fps_cache[key] = np.array([float(fps_map.get(str(v), default)) for v in video_index.videos])
+    return _fps_cache[key]
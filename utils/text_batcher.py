@@ -0,0 +1,78 @@
+"""
+TextSearchBatcher: gom các text query đến cùng lúc thành 1 batch (dynamic micro-batching).
+
+Khi nhiều người cùng gọi /clip, thay vì mỗi request chạy 1 encode_text batch-1:
+- Model đang rảnh: chạy ngay, không thêm độ trễ
+- Model đang bận: gom các query đến trong `max_wait_ms` (tối đa `max_batch_size`),
+  chạy 1 lần text_search_batch (1 encode + 1 index.search) rồi trả kết quả về từng request
+"""
+
+import asyncio
+import logging
+
+from utils.executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class TextSearchBatcher:
+    def __init__(self, max_batch_size=16, max_wait_ms=5, stage="inference"):
+        """
+        Args:
+            max_batch_size: Số query tối đa trong 1 batch
+            max_wait_ms: Thời gian chờ gom batch khi model đang bận
+            stage: Executor chạy text_search_batch (xem utils/executors.py)
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stage = stage
+
+        # Theo từng FaissService (xóa khi không còn việc, không giữ service đã bị evict)
+        self._pending = {}   # service -> [(text, k, future)]
+        self._timers = {}    # service -> TimerHandle
+        self._inflight = {}  # service -> số batch đang chạy
+
+    async def search(self, service, text, k=100):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(service, []).append((text, k, future))
+
+        if not self._inflight.get(service) or len(self._pending[service]) >= self.max_batch_size:
+            self._flush(service)
+        elif service not in self._timers:
+            self._timers[service] = loop.call_later(self.max_wait, self._flush, service)
+
+        return await future
+
+    def _flush(self, service):
+        timer = self._timers.pop(service, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(service, [])
+        while batch:
+            chunk, batch = batch[:self.max_batch_size], batch[self.max_batch_size:]
+            self._inflight[service] = self._inflight.get(service, 0) + 1
+            asyncio.ensure_future(self._run(service, chunk))
+
+    async def _run(self, service, batch):
+        texts = [text for text, _, _ in batch]
+        k = max(k for _, k, _ in batch)
+        try:
+            if len(batch) > 1:
+                logger.info(f"Micro-batch: {len(batch)} text queries")
+            results = await run_blocking(self.stage, service.text_search_batch, texts, k=k)
+            for (_, item_k, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result[:item_k])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._inflight[service] -= 1
+            if not self._inflight[service]:
+                del self._inflight[service]
+                # Query đang chờ timer thì chạy luôn khi model rảnh
+                if service in self._pending:
+                    self._flush(service)
@@ -0,0 +1,255 @@
+"""
+VectorBackend: nơi lưu + search vector của 1 model, tách khỏi phần encode query / format kết quả của FaissService.
+
+- "faiss" : FaissBackend  - index .bin / .npy load trong process (load_mode, index_variant, rerank, KNN graph)
+- "milvus": MilvusBackend - collection Milvus (scripts/insert_data.py), search qua RPC
+
+Chọn backend bằng key "backend" trong MODEL_CONFIGS (mặc định "faiss"). Mọi backend trả về
+(scores [n, k], ids [n, k]) theo frame ID của catalog, thiếu kết quả thì pad -1 như FAISS.
+
+Bộ lọc của người dùng (utils/search_filter.py) được chọn thành tập video code, rồi mỗi backend
+đổi tập đó sang dạng nó lọc được ngay trong engine (build_filters):
+- FAISS : {"id_ranges": [[lo, hi], ...]} các khoảng frame ID -> chỉ quét các khoảng này
+- Milvus: {"video_ids": [...], "frame_range": (lo, hi)} -> biểu thức scalar (milvus_expr) trên video_id / frame_id
+"""
+
+import os
+import json
+import logging
+
+import faiss
+import numpy as np
+
+from utils.index_loader import load_index, index_vectors
+from utils.index_tools import variant_path
+from utils.knn_graph import KnnGraph
+from utils.search_filter import frame_id_ranges, id_selector, search_parameters, search_ranges
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("faiss", "milvus")
+
+
+class VectorBackend:
+    """Interface chung của các backend"""
+
+    name = None
+
+    # Ma trận vector thô [ntotal, d] để chấm điểm mọi frame (multi-context), None nếu backend không có
+    vectors = None
+
+    @property
+    def ntotal(self):
+        raise NotImplementedError
+
+    def build_filters(self, video_index, codes, frame_range=None):
+        """Tập video code (+ khoảng số frame) -> bộ lọc của backend (xem đầu file)"""
+        raise NotImplementedError
+
+    def search(self, vectors, k, filters=None):
+        """
+        Args:
+            vectors: Ma trận query float32 [n, d] đã chuẩn hóa
+            filters: Bộ lọc từ build_filters, None = search toàn bộ
+        Returns: (scores [n, k], ids [n, k])
+        """
+        raise NotImplementedError
+
+    def reconstruct(self, frame_id):
+        """Vector float32 [d] của 1 frame đã index"""
+        raise NotImplementedError
+
+    def neighbors(self, frame_id, k):
+        """Top-k láng giềng tính sẵn của frame (scores, ids), None nếu backend không có"""
+        return None
+
+
+class FaissBackend(VectorBackend):
+    name = "faiss"
+
+    def __init__(self, bin_path, load_mode="memory", npy_path=None, index_variant=None, search_params=None,
+                 rerank=None, device="cpu"):
+        """
+        Args: xem FaissService (load_mode, npy_path, index_variant, search_params, rerank)
+        """
+        self.index = load_index(variant_path(bin_path, index_variant), load_mode=load_mode, npy_path=npy_path,
+                                search_params=search_params)
+        # Vector thô lấy từ index CPU trước khi chuyển GPU (index GPU không cho đọc trực tiếp);
+        # giữ index CPU vì flat_vectors là view trên bộ nhớ của nó
+        self.cpu_index = self.index
+        flat_vectors = index_vectors(self.index)
+
+        # chuyển index sang GPU nếu có
+        if device == "cuda" and load_mode != "npy":
+            try:
+                res = faiss.StandardGpuResources()
+                self.index = faiss.index_cpu_to_gpu(res, 0, self.index)
+                logger.info("Đã chuyển FAISS index sang GPU")
+            except Exception as e:
+                logger.warning(f"Không thể chuyển index sang GPU: {e}, dùng CPU.")
+
+        # Top-K láng giềng tính sẵn cho image_search (scripts/build_knn_graph.py), None nếu chưa build / đã cũ
+        self.knn_graph = KnnGraph.load(bin_path, ntotal=self.index.ntotal)
+
+        # Vector chính xác cho rerank (chỉ đọc các dòng candidate từ file mmap)
+        self.rerank_vectors = None
+        self.rerank_factor = 1
+        if rerank:
+            rerank_path = rerank.get("npy_path", npy_path)
+            if rerank_path and os.path.exists(rerank_path):
+                logger.info(f"Rerank x{rerank.get('factor', 4)} trên: {rerank_path}")
+                self.rerank_vectors = np.load(rerank_path, mmap_mode='r')
+                self.rerank_factor = rerank.get("factor", 4)
+            else:
+                logger.warning(f"Không tìm thấy vector rerank: {rerank_path}, tắt rerank.")
+
+        # Vector thô: index flat, hoặc vector rerank khi index là IVF/HNSW/SQ
+        self.vectors = flat_vectors if flat_vectors is not None else self.rerank_vectors
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def build_filters(self, video_index, codes, frame_range=None):
+        return {"id_ranges": frame_id_ranges(video_index, codes, frame_range)}
+
+    def search(self, vectors, k, filters=None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if filters is not None:
+            return self._search_ranges(vectors, k, filters["id_ranges"])
+        if self.rerank_vectors is None:
+            return self.index.search(vectors, k)
+
+        _, candidate_ids = self.index.search(vectors, k * self.rerank_factor)
+        return self._rerank(vectors, candidate_ids, k)
+
+    def _search_ranges(self, vectors, k, ranges):
+        """Chỉ search trong các khoảng frame ID"""
+        ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+        ranges = ranges[ranges[:, 0] < self.ntotal]
+        ranges[:, 1] = np.minimum(ranges[:, 1], self.ntotal - 1)
+
+        # Có vector thô (flat / npy / vector rerank): nhân trực tiếp trên các dòng trong khoảng, kết quả chính xác
+        if self.vectors is not None or len(ranges) == 0:
+            return search_ranges(self.vectors, vectors, k, ranges)
+
+        # IVF / HNSW / SQ: IDSelector, index bỏ qua các frame ngoài khoảng ngay trong lúc duyệt.
+        # Index GPU không hỗ trợ IDSelector nên luôn search trên bản CPU
+        selector = id_selector(ranges)
+        return self.cpu_index.search(vectors, k, params=search_parameters(self.cpu_index, selector))
+
+    def _rerank(self, vectors, candidate_ids, k):
+        """Chấm lại điểm chính xác cho candidate của từng query, chỉ đọc các dòng candidate từ .npy"""
+        scores = np.full((len(vectors), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(vectors), k), -1, dtype=np.int64)
+        for i, query in enumerate(vectors):
+            # Sort ID để đọc file mmap theo thứ tự tăng dần
+            rows = np.unique(candidate_ids[i][(candidate_ids[i] >= 0) & (candidate_ids[i] < len(self.rerank_vectors))])
+            exact = np.asarray(self.rerank_vectors[rows], dtype=np.float32) @ query
+            top = np.argsort(-exact, kind="stable")[:k]
+            scores[i, :len(top)] = exact[top]
+            ids[i, :len(top)] = rows[top]
+        return scores, ids
+
+    def reconstruct(self, frame_id):
+        """Ưu tiên vector chính xác của rerank nếu có"""
+        if self.rerank_vectors is not None and frame_id < len(self.rerank_vectors):
+            return np.asarray(self.rerank_vectors[frame_id], dtype=np.float32)
+        return self.index.reconstruct(frame_id)
+
+    def neighbors(self, frame_id, k):
+        if self.knn_graph is None:
+            return None
+        return self.knn_graph.neighbors(frame_id, k)
+
+
+def milvus_expr(filters):
+    """Bộ lọc -> biểu thức scalar của Milvus, None nếu không lọc gì"""
+    if not filters:
+        return None
+    clauses = []
+    video_ids = filters.get("video_ids")
+    if video_ids is not None:
+        clauses.append(f"video_id in {json.dumps([str(v) for v in video_ids])}")
+    frame_range = filters.get("frame_range")
+    if frame_range is not None:
+        lo, hi = frame_range
+        clauses.append(f"frame_id >= {int(lo)} && frame_id <= {int(hi)}")
+    return " && ".join(clauses) or None
+
+
+class MilvusBackend(VectorBackend):
+    name = "milvus"
+
+    def __init__(self, collection, host="127.0.0.1", port="19530", metric_type="COSINE", search_params=None,
+                 anns_field="embedding", alias=None):
+        """
+        Args:
+            collection: Tên collection (schema của scripts/insert_data.py: id, video_id, frame_id, path, embedding)
+            metric_type: Phải khớp với index của collection ("COSINE" | "IP" | "L2")
+            search_params: Tham số search của index, vd {"ef": 128} (HNSW) hoặc {"nprobe": 16} (IVF)
+            alias: Tên connection pymilvus (mặc định mỗi host:port 1 connection)
+        """
+        # pymilvus chỉ cần khi có model dùng backend "milvus"
+        from pymilvus import connections, Collection
+
+        self.alias = alias or f"{host}:{port}"
+        connections.connect(self.alias, host=host, port=port)
+        self.collection = Collection(collection, using=self.alias)
+        self.collection.load()
+
+        self.metric_type = metric_type
+        self.search_params = search_params or {}
+        self.anns_field = anns_field
+        logger.info(f"Milvus collection '{collection}' @ {host}:{port} ({self.collection.num_entities} entities)")
+
+    @property
+    def ntotal(self):
+        return self.collection.num_entities
+
+    def build_filters(self, video_index, codes, frame_range=None):
+        return {"video_ids": [video_index.video_list[code] for code in codes.tolist()], "frame_range": frame_range}
+
+    def search(self, vectors, k, filters=None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        results = self.collection.search(
+            data=vectors.tolist(),
+            anns_field=self.anns_field,
+            param={"metric_type": self.metric_type, "params": self.search_params},
+            limit=k,
+            expr=milvus_expr(filters),
+        )
+
+        scores = np.full((len(vectors), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(vectors), k), -1, dtype=np.int64)
+        # L2: khoảng cách nhỏ = giống hơn -> đổi dấu để mọi backend cùng quy ước "điểm cao = tốt"
+        sign = -1.0 if self.metric_type == "L2" else 1.0
+        for i, hits in enumerate(results):
+            n = len(hits.ids)
+            ids[i, :n] = hits.ids
+            scores[i, :n] = sign * np.asarray(hits.distances, dtype=np.float32)
+        return scores, ids
+
+    def reconstruct(self, frame_id):
+        rows = self.collection.query(expr=f"id == {int(frame_id)}", output_fields=[self.anns_field])
+        if not rows:
+            raise KeyError(f"Frame {frame_id} không có trong collection {self.collection.name}")
+        return np.asarray(rows[0][self.anns_field], dtype=np.float32)
+
+
+def create_backend(config, device="cpu"):
+    """Backend của 1 entry MODEL_CONFIGS theo key "backend" ("faiss" mặc định)"""
+    backend = config.get("backend", "faiss")
+    if backend == "faiss":
+        return FaissBackend(
+            config["bin_path"],
+            load_mode=config.get("load_mode", "memory"),
+            npy_path=config.get("npy_path"),
+            index_variant=config.get("index_variant"),
+            search_params=config.get("search_params"),
+            rerank=config.get("rerank"),
+            device=device,
+        )
+    if backend == "milvus":
+        return MilvusBackend(search_params=config.get("search_params"), **config["milvus"])
+    raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
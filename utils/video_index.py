@@ -0,0 +1,124 @@
+"""
+VideoIndex: cấu trúc theo video build sẵn từ FrameCatalog.
+
+- Frame ID của mỗi video được gom liền nhau (sort theo video rồi theo số frame)
+  + mảng offsets -> video thứ v chiếm đoạn [offsets[v], offsets[v+1])
+- Khoảng frame ID (min, max) của từng video
+- match_videos() / page_frames(): danh bạ video cho trang chủ, lấy 1 trang frame của
+  các video được lọc mà không duyệt toàn bộ catalog
+- reduce_max(): từ điểm của MỌI frame tính điểm tốt nhất của MỌI video trong 1 lần
+  np.maximum.reduceat, dùng cho multi-context fusion trên toàn bộ 725 video
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class VideoIndex:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.videos = catalog.videos
+        self.video_list = self.videos.astype(str).tolist()
+
+        # Row của catalog sắp theo (video, frame)
+        self.order = np.lexsort((catalog.frames, catalog.video_codes)).astype(np.int64)
+        self.frame_ids = catalog.ids[self.order]
+        self.frame_numbers = catalog.frames[self.order]
+        self.max_frame_id = int(self.frame_ids.max()) if len(self.frame_ids) else -1
+
+        counts = np.bincount(catalog.video_codes, minlength=len(self.videos))
+        self.offsets = np.zeros(len(self.videos) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+
+        # Khoảng frame ID của từng video
+        starts = self.offsets[:-1]
+        self.id_min = np.minimum.reduceat(self.frame_ids, starts) if len(starts) else np.zeros(0, np.int64)
+        self.id_max = np.maximum.reduceat(self.frame_ids, starts) if len(starts) else np.zeros(0, np.int64)
+
+        logger.info(f"Video Index: {len(self.videos)} videos, {len(self.frame_ids)} frames")
+
+    def __len__(self):
+        return len(self.videos)
+
+    def video_code(self, video_id):
+        """Vị trí của video trong danh sách đã sort, -1 nếu không có"""
+        code = int(np.searchsorted(self.videos, video_id))
+        if code < len(self.videos) and self.videos[code] == video_id:
+            return code
+        return -1
+
+    def frame_slice(self, code):
+        return slice(int(self.offsets[code]), int(self.offsets[code + 1]))
+
+    def frames_of(self, video_id):
+        """Frame ID của 1 video (đã sort theo số frame)"""
+        code = self.video_code(video_id)
+        if code < 0:
+            return np.zeros(0, dtype=self.frame_ids.dtype)
+        return self.frame_ids[self.frame_slice(code)]
+
+    def id_range(self, video_id):
+        """(frame ID nhỏ nhất, lớn nhất) của video, None nếu không có"""
+        code = self.video_code(video_id)
+        if code < 0:
+            return None
+        return int(self.id_min[code]), int(self.id_max[code])
+
+    def match_videos(self, pattern):
+        """Video code có tên chứa pattern (vd: "L01" -> mọi video của L01, "L01_V003" -> 1 video)"""
+        return np.array([code for code, name in enumerate(self.video_list) if pattern in name], dtype=np.int64)
+
+    def count_frames(self, codes):
+        return int((self.offsets[codes + 1] - self.offsets[codes]).sum())
+
+    def page_frames(self, codes, start, stop):
+        """
+        Frame ID ở vị trí [start, stop) khi nối frame của các video `codes` liền nhau,
+        chỉ đọc các video giao với đoạn cần lấy (O(page size), không duyệt toàn bộ frame)
+        """
+        counts = self.offsets[codes + 1] - self.offsets[codes]
+        ends = np.cumsum(counts)
+        first = int(np.searchsorted(ends, start, side="right"))
+
+        chunks = []
+        position = int(ends[first - 1]) if first > 0 else 0
+        for code, count in zip(codes[first:].tolist(), counts[first:].tolist()):
+            if position >= stop:
+                break
+            lo = max(start - position, 0)
+            hi = min(stop - position, count)
+            base = int(self.offsets[code])
+            chunks.append(self.frame_ids[base + lo:base + hi])
+            position += count
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=self.frame_ids.dtype)
+
+    def reduce_max(self, frame_scores):
+        """
+        Args:
+            frame_scores: [n_query, ntotal] điểm của mọi frame, cột = frame ID
+        Returns:
+            (video_scores [n_query, n_video], grouped_scores [n_query, n_frame] theo thứ tự self.frame_ids)
+        """
+        ntotal = frame_scores.shape[1]
+        if self.max_frame_id < ntotal:
+            grouped = frame_scores[:, self.frame_ids]
+        else:
+            # Index chưa phủ hết catalog (trích xuất dở dang): frame thiếu vector nhận -inf
+            valid = self.frame_ids < ntotal
+            grouped = np.full((len(frame_scores), len(self.frame_ids)), -np.inf, dtype=frame_scores.dtype)
+            grouped[:, valid] = frame_scores[:, self.frame_ids[valid]]
+        return np.maximum.reduceat(grouped, self.offsets[:-1], axis=1), grouped
+
+
+_video_indexes = {}
+
+
+def get_video_index(catalog):
+    """VideoIndex dùng chung cho mỗi FrameCatalog"""
+    key = id(catalog)
+    if key not in _video_indexes:
+        _video_indexes[key] = VideoIndex(catalog)
+    return _video_indexes[key]